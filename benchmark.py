@@ -0,0 +1,1231 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark harness for the WanAnimate handler and client
+
+Runs the real handler.py and wananimate_s3_client.py against local stand-ins, so handler
+and client overhead can be measured without a GPU:
+
+- FakeComfyUI: HTTP /prompt, /history, /view, /system_stats and a /ws WebSocket that replays the
+  execution_start / executing / progress / executed / execution_success sequence for every
+  node of a submitted prompt, with configurable delays and output file size
+- FakeS3: path-style S3 API (put/head/get and multipart upload) backed by a directory that
+  also plays the role of the RunPod network volume (/runpod-volume)
+- FakeRunPodAPI: /run, /runsync, /status, /stream and /cancel, served by a separate worker
+  process that imports handler.py and runs the handler chosen by serverless_config()
+
+Each scenario gets a fresh worker process, so peak RSS and caches are measured per scenario.
+Reports are written as JSON and can be compared across commits.
+
+Usage:
+    python benchmark.py                                   # all scenarios -> benchmark-<commit>.json
+    python benchmark.py --scenario single --jobs 10
+    python benchmark.py --compare benchmark-1a2b3c4.json  # print deltas against an earlier report
+"""
+
+import argparse
+import asyncio
+import base64
+import inspect
+import json
+import logging
+import os
+import platform
+import re
+import resource
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, List
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+logger = logging.getLogger("benchmark")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Network volume mount point used in the paths the client sends to the handler
+VOLUME_MOUNT = "/runpod-volume"
+
+MB = 1024 * 1024
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (None where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def write_synthetic_file(path: str, size: int, header: bytes):
+    """Write a file of the given size that starts with a valid container signature"""
+    block = os.urandom(MB)
+    with open(path, "wb") as f:
+        f.write(header)
+        remaining = size - len(header)
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+# Magic bytes the handler sniffs to validate base64 inputs
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+MP4_HEADER = b"\x00\x00\x00\x18ftypmp42\x00\x00\x00\x00"
+
+
+class FakeComfyUI:
+    """
+    Stand-in ComfyUI server
+
+    Executes prompts one at a time like a single GPU. Every node gets an `executing` event
+    and `node_delay` seconds; sampler nodes additionally report `progress` once per step
+    (`step_delay` seconds each). VHS_VideoCombine nodes write an output file of
+    `output_bytes` and report it in an `executed` event, just like VideoHelperSuite.
+    /system_stats reports one `vram_bytes` GPU whose memory is half used while a prompt runs.
+    /queue lists and deletes pending prompts and /interrupt stops the running one, like ComfyUI.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        node_delay: float = 0.005,
+        step_delay: float = 0.05,
+        steps: Optional[int] = None,
+        output_bytes: int = MB,
+        vram_bytes: int = 24 * 1024 * MB
+    ):
+        """
+        Initialize fake ComfyUI
+
+        Args:
+            output_dir: Directory that receives the generated output files
+            node_delay: Simulated execution time of every node (seconds)
+            step_delay: Simulated time of one sampler step (seconds)
+            steps: Sampler step count override (defaults to the prompt's `steps` input)
+            output_bytes: Size of every generated video file
+            vram_bytes: Total memory of the simulated GPU
+        """
+        self.output_dir = output_dir
+        self.node_delay = node_delay
+        self.step_delay = step_delay
+        self.steps = steps
+        self.output_bytes = output_bytes
+        self.vram_bytes = vram_bytes
+        self.history: Dict[str, Dict[str, Any]] = {}
+        self.records: List[Dict[str, Any]] = []
+        self.busy_seconds = 0.0
+
+        self._sockets: Dict[str, set] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._counter = 0
+        self._number = 0
+        self._blob: Optional[bytes] = None
+        self._executing = False
+        self._running: Optional[str] = None
+        self._pending: Dict[str, int] = {}
+        self._deleted: set = set()
+        self._interrupted: Optional[str] = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    def app(self) -> "web.Application":
+        app = web.Application(client_max_size=64 * MB)
+        app.router.add_get("/", self._index)
+        app.router.add_get("/ws", self._websocket)
+        app.router.add_post("/prompt", self._prompt)
+        app.router.add_get("/history/{prompt_id}", self._history)
+        app.router.add_get("/view", self._view)
+        app.router.add_get("/system_stats", self._system_stats)
+        app.router.add_get("/queue", self._get_queue)
+        app.router.add_post("/queue", self._post_queue)
+        app.router.add_post("/interrupt", self._interrupt)
+        app.on_startup.append(self._start_executor)
+        app.on_cleanup.append(self._stop_executor)
+        return app
+
+    @staticmethod
+    def execution_order(prompt: Dict[str, Any]) -> List[str]:
+        """Node IDs in dependency order (inputs linked as [node_id, output_index] run first)"""
+        order: List[str] = []
+        visited: set = set()
+
+        def visit(node_id: str):
+            if node_id in visited or node_id not in prompt:
+                return
+            visited.add(node_id)
+            for value in prompt[node_id].get("inputs", {}).values():
+                if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str):
+                    visit(value[0])
+            order.append(node_id)
+
+        for node_id in sorted(prompt, key=lambda n: (len(n), n)):
+            visit(node_id)
+        return order
+
+    def _sampler_steps(self, node: Dict[str, Any]) -> int:
+        if self.steps is not None:
+            return self.steps
+        steps = node.get("inputs", {}).get("steps")
+        return steps if isinstance(steps, int) else 6
+
+    async def _index(self, request):
+        return web.Response(text="ok")
+
+    async def _websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client_id = request.query.get("clientId", "")
+        self._sockets.setdefault(client_id, set()).add(ws)
+        await ws.send_str(json.dumps({
+            "type": "status",
+            "data": {"status": {"exec_info": {"queue_remaining": self._queue.qsize()}}, "sid": client_id}
+        }))
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self._sockets[client_id].discard(ws)
+        return ws
+
+    async def _prompt(self, request):
+        body = await request.json()
+        prompt = body.get("prompt")
+        if not isinstance(prompt, dict) or not prompt:
+            return web.json_response({"error": "invalid prompt", "node_errors": {}}, status=400)
+        prompt_id = str(uuid.uuid4())
+        self._number += 1
+        record = {"prompt_id": prompt_id, "queued": time.time(), "started": None, "finished": None}
+        self.records.append(record)
+        self._pending[prompt_id] = self._number
+        await self._queue.put((prompt_id, prompt, body.get("client_id", ""), record))
+        return web.json_response({"prompt_id": prompt_id, "number": self._number, "node_errors": {}})
+
+    async def _get_queue(self, request):
+        running = [[0, self._running, {}, {}, []]] if self._running else []
+        pending = [[number, prompt_id, {}, {}, []] for prompt_id, number in self._pending.items()]
+        return web.json_response({"queue_running": running, "queue_pending": pending})
+
+    async def _post_queue(self, request):
+        body = await request.json()
+        for prompt_id in body.get("delete", []):
+            if self._pending.pop(prompt_id, None) is not None:
+                self._deleted.add(prompt_id)
+        return web.json_response({})
+
+    async def _interrupt(self, request):
+        body = await request.json() if request.can_read_body else {}
+        # Like ComfyUI, only the running prompt is interrupted (and only if it matches a given prompt_id)
+        if self._running and body.get("prompt_id", self._running) == self._running:
+            self._interrupted = self._running
+        return web.json_response({})
+
+    async def _history(self, request):
+        prompt_id = request.match_info["prompt_id"]
+        entry = self.history.get(prompt_id)
+        return web.json_response({prompt_id: entry} if entry else {})
+
+    async def _view(self, request):
+        filename = os.path.basename(request.query.get("filename", ""))
+        subfolder = request.query.get("subfolder", "")
+        path = os.path.join(self.output_dir, subfolder, filename)
+        if not filename or not os.path.isfile(path):
+            return web.Response(status=404)
+        return web.FileResponse(path)
+
+    async def _system_stats(self, request):
+        used = 512 * MB + (self.vram_bytes // 2 if self._executing else 0)
+        return web.json_response({"devices": [{
+            "name": "cuda:0 Fake GPU : native",
+            "type": "cuda",
+            "index": 0,
+            "vram_total": self.vram_bytes,
+            "vram_free": self.vram_bytes - used,
+            "torch_vram_total": used,
+            "torch_vram_free": 0,
+        }]})
+
+    async def _start_executor(self, app):
+        self._queue = asyncio.Queue()
+        app["executor"] = asyncio.ensure_future(self._execute_loop())
+
+    async def _stop_executor(self, app):
+        app["executor"].cancel()
+        for ws in [ws for sockets in self._sockets.values() for ws in sockets]:
+            await ws.close()
+
+    async def _send(self, client_id: str, message_type: str, data: Dict[str, Any]):
+        message = json.dumps({"type": message_type, "data": data})
+        for ws in list(self._sockets.get(client_id, ())):
+            try:
+                await ws.send_str(message)
+            except ConnectionError:
+                pass
+
+    async def _execute_loop(self):
+        while True:
+            prompt_id, prompt, client_id, record = await self._queue.get()
+            self._pending.pop(prompt_id, None)
+            if prompt_id in self._deleted:
+                self._deleted.discard(prompt_id)
+                record["deleted"] = True
+                continue
+            record["started"] = time.time()
+            self._executing = True
+            self._running = prompt_id
+            try:
+                await self._execute(prompt_id, prompt, client_id)
+            except Exception as e:
+                logger.error(f"Fake ComfyUI execution failed: {e}")
+            finally:
+                self._executing = False
+                self._running = None
+                self._interrupted = None
+            record["finished"] = time.time()
+            self.busy_seconds += record["finished"] - record["started"]
+
+    async def _execute(self, prompt_id: str, prompt: Dict[str, Any], client_id: str):
+        await self._send(client_id, "execution_start", {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)})
+        await self._send(client_id, "execution_cached", {"nodes": [], "prompt_id": prompt_id})
+
+        outputs = {}
+        for node_id in self.execution_order(prompt):
+            node = prompt[node_id]
+            class_type = node.get("class_type", "")
+            if self._interrupted == prompt_id:
+                await self._send(client_id, "execution_interrupted", {
+                    "prompt_id": prompt_id, "node_id": node_id, "node_type": class_type, "executed": list(outputs),
+                })
+                return
+            await self._send(client_id, "executing", {"node": node_id, "display_node": node_id, "prompt_id": prompt_id})
+
+            error = self._check_inputs(node)
+            if error:
+                await self._send(client_id, "execution_error", {
+                    "prompt_id": prompt_id,
+                    "node_id": node_id,
+                    "node_type": class_type,
+                    "executed": list(outputs),
+                    "exception_type": "FileNotFoundError",
+                    "exception_message": error,
+                    "traceback": [],
+                })
+                return
+
+            await asyncio.sleep(self.node_delay)
+            if "Sampler" in class_type:
+                steps = self._sampler_steps(node)
+                for step in range(1, steps + 1):
+                    await asyncio.sleep(self.step_delay)
+                    await self._send(client_id, "progress", {
+                        "value": step, "max": steps, "prompt_id": prompt_id, "node": node_id
+                    })
+            if class_type == "VHS_VideoCombine":
+                output = await self._write_output(node)
+                outputs[node_id] = output
+                await self._send(client_id, "executed", {
+                    "node": node_id, "display_node": node_id, "output": output, "prompt_id": prompt_id
+                })
+
+        self.history[prompt_id] = {
+            "prompt": [self._number, prompt_id, prompt, {}, list(outputs)],
+            "outputs": outputs,
+            "status": {"status_str": "success", "completed": True, "messages": []},
+        }
+        await self._send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+        await self._send(client_id, "execution_success", {"prompt_id": prompt_id, "timestamp": int(time.time() * 1000)})
+
+    @staticmethod
+    def _check_inputs(node: Dict[str, Any]) -> Optional[str]:
+        """Loader nodes fail on absolute input paths that do not exist, like the real nodes"""
+        field = {"LoadImage": "image", "VHS_LoadVideo": "video"}.get(node.get("class_type"))
+        path = node.get("inputs", {}).get(field) if field else None
+        if isinstance(path, str) and os.path.isabs(path) and not os.path.isfile(path):
+            return f"Invalid {field} file: {path}"
+        return None
+
+    async def _write_output(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = node.get("inputs", {})
+        self._counter += 1
+        filename = f"{inputs.get('filename_prefix', 'ComfyUI')}_{self._counter:05d}.mp4"
+        folder_type = "output" if inputs.get("save_output") else "temp"
+        path = os.path.join(self.output_dir, filename)
+        if self._blob is None or len(self._blob) != self.output_bytes:
+            self._blob = MP4_HEADER + os.urandom(max(0, self.output_bytes - len(MP4_HEADER)))
+        await asyncio.to_thread(self._write_file, path, self._blob)
+        return {"gifs": [{
+            "filename": filename,
+            "subfolder": "",
+            "type": folder_type,
+            "format": inputs.get("format", "video/h264-mp4"),
+            "frame_rate": inputs.get("frame_rate", 16),
+            "workflow": f"{os.path.splitext(filename)[0]}.png",
+            "fullpath": path,
+        }]}
+
+    @staticmethod
+    def _write_file(path: str, data: bytes):
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+class FakeS3:
+    """
+    Minimal path-style S3 API backed by a local directory
+
+    Supports what the client uses: PutObject, HeadObject, GetObject (with ranges) and
+    multipart upload. Bucket names are ignored and keys map to paths under `root`, the same
+    way a RunPod network volume's S3 API maps keys onto the volume. Signatures are not checked.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.bytes_in = 0
+        self.requests = 0
+        self._uploads: Dict[str, str] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def app(self) -> "web.Application":
+        app = web.Application()
+        app.router.add_route("*", "/{bucket}/{key:.+}", self._object)
+        return app
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise web.HTTPForbidden()
+        return path
+
+    @staticmethod
+    def _xml(body: str, status: int = 200) -> "web.Response":
+        return web.Response(
+            text=f'<?xml version="1.0" encoding="UTF-8"?>\n{body}',
+            status=status,
+            content_type="application/xml"
+        )
+
+    async def _object(self, request):
+        self.requests += 1
+        bucket = request.match_info["bucket"]
+        key = request.match_info["key"]
+        path = self._path(key)
+        query = request.query
+        method = request.method
+
+        if method == "PUT" and "uploadId" in query:
+            part_path = os.path.join(self._uploads[query["uploadId"]], f"{int(query['partNumber']):05d}")
+            await self._receive(request, part_path)
+            return web.Response(headers={"ETag": f'"{uuid.uuid4().hex}"'})
+        if method == "PUT":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{uuid.uuid4().hex}.part"
+            await self._receive(request, temp_path)
+            os.replace(temp_path, path)
+            return web.Response(headers={"ETag": f'"{uuid.uuid4().hex}"'})
+        if method == "POST" and "uploads" in query:
+            upload_id = uuid.uuid4().hex
+            self._uploads[upload_id] = tempfile.mkdtemp(prefix="upload-", dir=self.root)
+            return self._xml(
+                f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+            )
+        if method == "POST" and "uploadId" in query:
+            part_dir = self._uploads.pop(query["uploadId"])
+            part_numbers = [int(n) for n in re.findall(r"<PartNumber>(\d+)</PartNumber>", await request.text())]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            await asyncio.to_thread(self._concatenate, part_dir, sorted(part_numbers), path)
+            return self._xml(
+                f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                f'<ETag>"{uuid.uuid4().hex}-{len(part_numbers)}"</ETag></CompleteMultipartUploadResult>'
+            )
+        if method == "DELETE":
+            if "uploadId" in query:
+                shutil.rmtree(self._uploads.pop(query["uploadId"], ""), ignore_errors=True)
+            elif os.path.isfile(path):
+                os.remove(path)
+            return web.Response(status=204)
+        if method in ("GET", "HEAD"):
+            if not os.path.isfile(path):
+                if method == "HEAD":
+                    return web.Response(status=404)
+                return self._xml(f"<Error><Code>NoSuchKey</Code><Key>{key}</Key></Error>", status=404)
+            return web.FileResponse(path)
+        return web.Response(status=405)
+
+    async def _receive(self, request, path: str):
+        """Stream the request body to a file, decoding aws-chunked payloads"""
+        content = request.content
+        chunked = (
+            "aws-chunked" in request.headers.get("Content-Encoding", "")
+            or request.headers.get("x-amz-content-sha256", "").startswith("STREAMING-")
+        )
+        with open(path, "wb") as f:
+            if not chunked:
+                async for data in content.iter_chunked(MB):
+                    f.write(data)
+                    self.bytes_in += len(data)
+                return
+            while True:
+                size = int((await content.readline()).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    break
+                data = await content.readexactly(size)
+                f.write(data)
+                self.bytes_in += size
+                await content.readline()
+
+    @staticmethod
+    def _concatenate(part_dir: str, part_numbers: List[int], path: str):
+        with open(path, "wb") as out:
+            for number in part_numbers:
+                with open(os.path.join(part_dir, f"{number:05d}"), "rb") as part:
+                    shutil.copyfileobj(part, out, MB)
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+
+class FakeRunPodAPI:
+    """
+    RunPod serverless API served in front of the imported handler module
+
+    Runs the handler the way runpod.serverless.start would with the same configuration:
+    sync handlers one job at a time, async handlers up to concurrency_modifier() jobs at a
+    time, and generator handlers with their items exposed through /stream.
+    """
+
+    def __init__(self, worker, volume_dir: str):
+        """
+        Initialize fake RunPod API
+
+        Args:
+            worker: Imported handler module
+            volume_dir: Local directory mounted at /runpod-volume for the handler
+        """
+        self.worker = worker
+        self.volume_dir = volume_dir
+        self.config = worker.serverless_config()
+        modifier = self.config.get("concurrency_modifier")
+        self.concurrency = max(1, modifier(1)) if modifier else 1
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.baseline_rss = current_rss()
+        self.import_seconds = None
+        self._queue: Optional[asyncio.Queue] = None
+
+        # progress_update would post to the RunPod job API; keep the progress on the job instead
+        worker.runpod.serverless.progress_update = self._progress_update
+
+    def app(self) -> "web.Application":
+        app = web.Application(client_max_size=4 * 1024 * MB)
+        app.router.add_post("/v2/{endpoint}/run", self._run)
+        app.router.add_post("/v2/{endpoint}/runsync", self._runsync)
+        app.router.add_route("*", "/v2/{endpoint}/status/{job_id}", self._status)
+        app.router.add_route("*", "/v2/{endpoint}/stream/{job_id}", self._stream)
+        app.router.add_post("/v2/{endpoint}/cancel/{job_id}", self._cancel)
+        app.router.add_get("/health", self._health)
+        app.router.add_get("/bench/stats", self._stats)
+        app.on_startup.append(self._start_workers)
+        return app
+
+    def _progress_update(self, job: Dict[str, Any], progress: Any):
+        entry = self.jobs.get(job.get("id"))
+        if entry is not None:
+            entry["progress"] = progress
+
+    def _mount_volume(self, job_input: Dict[str, Any]) -> Dict[str, Any]:
+        """Map /runpod-volume/... paths onto the local volume directory"""
+        prefix = VOLUME_MOUNT + "/"
+        return {
+            key: os.path.join(self.volume_dir, value[len(prefix):])
+            if isinstance(value, str) and value.startswith(prefix) else value
+            for key, value in job_input.items()
+        }
+
+    async def _start_workers(self, app):
+        self._queue = asyncio.Queue()
+        app["workers"] = [asyncio.ensure_future(self._work()) for _ in range(self.concurrency)]
+
+    async def _submit(self, request) -> Dict[str, Any]:
+        body = await request.json()
+        job_id = f"bench-{uuid.uuid4()}"
+        entry = {
+            "id": job_id,
+            "status": "IN_QUEUE",
+            "input": self._mount_volume(body.get("input") or {}),
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "stream": [],
+            "stream_cursor": 0,
+            "done": asyncio.Event(),
+            "task": None,
+        }
+        self.jobs[job_id] = entry
+        await self._queue.put(entry)
+        return entry
+
+    async def _work(self):
+        while True:
+            entry = await self._queue.get()
+            if entry["status"] != "IN_QUEUE":
+                continue
+            entry["task"] = asyncio.ensure_future(self._execute(entry))
+            try:
+                await entry["task"]
+            except asyncio.CancelledError:
+                entry["status"] = "CANCELLED"
+            entry["finished"] = time.time()
+            entry["done"].set()
+
+    async def _execute(self, entry: Dict[str, Any]):
+        entry["status"] = "IN_PROGRESS"
+        entry["started"] = time.time()
+        job = {"id": entry["id"], "input": entry["input"]}
+        handler = self.config["handler"]
+        try:
+            if inspect.iscoroutinefunction(handler):
+                output = await handler(job)
+            elif inspect.isgeneratorfunction(handler):
+                output = await asyncio.to_thread(self._drain, handler, job, entry)
+            else:
+                output = await asyncio.to_thread(handler, job)
+        except Exception as e:
+            entry["status"] = "FAILED"
+            entry["error"] = str(e)
+            return
+        if isinstance(output, dict) and "error" in output:
+            entry["status"] = "FAILED"
+            entry["error"] = output["error"]
+            entry["output"] = output
+        else:
+            entry["status"] = "COMPLETED"
+            entry["output"] = output
+
+    def _drain(self, handler, job: Dict[str, Any], entry: Dict[str, Any]):
+        for item in handler(job):
+            entry["stream"].append(item)
+        return list(entry["stream"]) if self.config.get("return_aggregate_stream") else None
+
+    def _status_body(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        body = {"id": entry["id"], "status": entry["status"]}
+        if entry["started"]:
+            body["delayTime"] = int((entry["started"] - entry["created"]) * 1000)
+        if entry["finished"] and entry["started"]:
+            body["executionTime"] = int((entry["finished"] - entry["started"]) * 1000)
+        if entry["status"] == "COMPLETED":
+            body["output"] = entry.get("output")
+        elif entry["status"] == "FAILED":
+            body["error"] = entry.get("error")
+        elif "progress" in entry:
+            body["output"] = entry["progress"]
+        return body
+
+    def _lookup(self, request) -> Dict[str, Any]:
+        entry = self.jobs.get(request.match_info["job_id"])
+        if entry is None:
+            raise web.HTTPNotFound(text=json.dumps({"error": "job not found"}), content_type="application/json")
+        return entry
+
+    async def _run(self, request):
+        entry = await self._submit(request)
+        return web.json_response({"id": entry["id"], "status": entry["status"]})
+
+    async def _runsync(self, request):
+        wait_seconds = int(request.query.get("wait", "90000")) / 1000
+        entry = await self._submit(request)
+        try:
+            await asyncio.wait_for(entry["done"].wait(), wait_seconds)
+        except asyncio.TimeoutError:
+            pass
+        return web.json_response(self._status_body(entry))
+
+    async def _status(self, request):
+        return web.json_response(self._status_body(self._lookup(request)))
+
+    async def _stream(self, request):
+        entry = self._lookup(request)
+        items = entry["stream"][entry["stream_cursor"]:]
+        entry["stream_cursor"] += len(items)
+        return web.json_response({
+            "status": entry["status"],
+            "stream": [{"output": item} for item in items]
+        })
+
+    async def _cancel(self, request):
+        entry = self._lookup(request)
+        if entry["status"] == "IN_QUEUE":
+            entry["status"] = "CANCELLED"
+            entry["done"].set()
+        elif entry["status"] == "IN_PROGRESS" and entry["task"] is not None:
+            entry["task"].cancel()
+        return web.json_response({"id": entry["id"], "status": "CANCELLED"})
+
+    async def _health(self, request):
+        return web.json_response({"status": "ok", "concurrency": self.concurrency})
+
+    async def _stats(self, request):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        jobs = []
+        for entry in self.jobs.values():
+            output = entry.get("output")
+            if isinstance(output, list) and output:
+                output = output[0]
+            jobs.append({
+                "id": entry["id"],
+                "status": entry["status"],
+                "delay_seconds": entry["started"] - entry["created"] if entry["started"] else None,
+                "execution_seconds": entry["finished"] - entry["started"] if entry["finished"] and entry["started"] else None,
+                "timing": output.get("timing") if isinstance(output, dict) else None,
+            })
+        return web.json_response({
+            "import_seconds": self.import_seconds,
+            "baseline_rss_bytes": self.baseline_rss,
+            "rss_bytes": current_rss(),
+            "peak_rss_bytes": peak_rss(),
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            "concurrency": self.concurrency,
+            "warmup": self.worker.warmup_state,
+            "jobs": jobs,
+        })
+
+
+def run_worker(args):
+    """Worker process entry point: import the handler and serve the fake RunPod API"""
+    start = time.perf_counter()
+    import handler as worker
+    import_seconds = time.perf_counter() - start
+
+    if worker.WARMUP_ENABLED:
+        # Same order as handler.py's __main__: warm up before accepting jobs
+        worker.warmup()
+    api = FakeRunPodAPI(worker, args.volume)
+    api.import_seconds = import_seconds
+    web.run_app(api.app(), host="127.0.0.1", port=args.port, print=None, handle_signals=True)
+
+
+class WorkerProcess:
+    """
+    One handler worker process serving the fake RunPod API
+
+    The worker runs in its own scratch directory (`cwd`) so the per-job task_* input
+    directories never land in the checkout; the directory is removed on stop().
+    """
+
+    def __init__(self, env: Dict[str, str], volume_dir: str, log_path: str, cwd: str):
+        self.port = free_port()
+        self.cwd = cwd
+        os.makedirs(cwd, exist_ok=True)
+        self.api_base = f"http://127.0.0.1:{self.port}/v2"
+        self.log_file = open(log_path, "ab")
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "worker", "--port", str(self.port), "--volume", volume_dir],
+            cwd=cwd,
+            env=env,
+            stdout=self.log_file,
+            stderr=subprocess.STDOUT
+        )
+
+    def wait_ready(self, timeout: float = 120):
+        import requests
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Worker exited with code {self.process.returncode} (see {self.log_file.name})")
+            try:
+                requests.get(f"http://127.0.0.1:{self.port}/health", timeout=1).raise_for_status()
+                return
+            except requests.exceptions.RequestException:
+                time.sleep(0.1)
+        raise RuntimeError(f"Worker did not become ready within {timeout:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        import requests
+        response = requests.get(f"http://127.0.0.1:{self.port}/bench/stats", timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.log_file.close()
+        shutil.rmtree(self.cwd, ignore_errors=True)
+
+
+class Harness:
+    """Fake ComfyUI and S3 on a background event loop, plus per-scenario worker processes"""
+
+    def __init__(self, workdir: str, comfy_options: Dict[str, Any], warmup: bool = False):
+        self.workdir = workdir
+        self.warmup = warmup
+        self.volume_dir = os.path.join(workdir, "volume")
+        self.comfy = FakeComfyUI(os.path.join(workdir, "comfy_output"), **comfy_options)
+        self.s3 = FakeS3(self.volume_dir)
+        self.comfy_port = free_port()
+        self.s3_port = free_port()
+        self.s3_url = f"http://127.0.0.1:{self.s3_port}"
+
+        self.loop = asyncio.new_event_loop()
+        self._runners = []
+        self._thread = threading.Thread(target=self.loop.run_forever, name="benchmark-servers", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_servers(), self.loop).result()
+
+    async def _start_servers(self):
+        for app, port in ((self.comfy.app(), self.comfy_port), (self.s3.app(), self.s3_port)):
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", port).start()
+            self._runners.append(runner)
+
+    async def _stop_servers(self):
+        for runner in self._runners:
+            await runner.cleanup()
+
+    def start_worker(self, name: str, env_overrides: Dict[str, str]) -> WorkerProcess:
+        env = dict(
+            os.environ,
+            SERVER_ADDRESS="127.0.0.1",
+            COMFY_PORT=str(self.comfy_port),
+            NETWORK_VOLUME_PATH=self.volume_dir,
+            CACHE_ROOT=os.path.join(self.workdir, "cache", name),
+            RESULT_CACHE_ENABLED="false",
+            METRICS_FILE="",
+            METRICS_PORT="0",
+            OUTPUT_STREAMING="false",
+            MAX_CONCURRENCY="1",
+            WARMUP_ENABLED="true" if self.warmup else "false",
+            PYTHONUNBUFFERED="1",
+        )
+        env.update(env_overrides)
+        worker = WorkerProcess(
+            env, self.volume_dir, os.path.join(self.workdir, f"worker-{name}.log"),
+            os.path.join(self.workdir, f"worker-{name}"),
+        )
+        worker.wait_ready()
+        return worker
+
+    def client_options(self, worker: WorkerProcess) -> Dict[str, Any]:
+        return {
+            "runpod_endpoint_id": "benchmark",
+            "runpod_api_key": "benchmark",
+            "s3_endpoint_url": self.s3_url,
+            "s3_access_key_id": "benchmark",
+            "s3_secret_access_key": "benchmark",
+            "s3_bucket_name": "benchmark",
+            "s3_region": "us-east-1",
+            "runpod_api_base": worker.api_base,
+        }
+
+    def comfy_window(self, first_record: int) -> Dict[str, Any]:
+        """Simulated GPU time of the prompts executed since records[first_record]"""
+        records = [r for r in self.comfy.records[first_record:] if r["finished"]]
+        durations = [r["finished"] - r["started"] for r in records]
+        return {
+            "prompts": len(records),
+            "execution_seconds": summarize(durations),
+            "busy_seconds": round(sum(durations), 4),
+        }
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self._stop_servers(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "mean": round(statistics.fmean(ordered), 4),
+        "p50": round(percentile(50), 4),
+        "p95": round(percentile(95), 4),
+        "max": round(ordered[-1], 4),
+    }
+
+
+def worker_report(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Peak memory, CPU and the handler's per-stage timing aggregated over the scenario's jobs"""
+    stages: Dict[str, List[float]] = {}
+    handler_overhead = []
+    for job in stats["jobs"]:
+        timing = job.get("timing")
+        if not timing:
+            continue
+        gpu_seconds = 0.0
+        for path, seconds in timing["stages"].items():
+            if path.count("/") <= 1:
+                stages.setdefault(path, []).append(seconds)
+            if path.endswith("comfyui_prompt"):
+                gpu_seconds += seconds
+        handler_overhead.append(timing["total_seconds"] - gpu_seconds)
+    return {
+        "import_seconds": round(stats["import_seconds"], 4),
+        "warmup_seconds": stats["warmup"]["seconds"],
+        "baseline_rss_mb": round((stats["baseline_rss_bytes"] or 0) / MB, 1),
+        "peak_rss_mb": round(stats["peak_rss_bytes"] / MB, 1),
+        "cpu_seconds": round(stats["cpu_seconds"], 3),
+        "handler_overhead_seconds": summarize(handler_overhead),
+        "stages": {path: summarize(values)["mean"] for path, values in sorted(stages.items())},
+    }
+
+
+def scenario_single(harness: Harness, args) -> Dict[str, Any]:
+    """Sequential jobs through the synchronous client (/runsync, inline output)"""
+    from wananimate_s3_client import WanAnimateS3Client
+
+    worker = harness.start_worker("single", {"MAX_CONCURRENCY": "1"})
+    try:
+        client = WanAnimateS3Client(**harness.client_options(worker))
+        first_record = len(harness.comfy.records)
+        latencies, failed = [], 0
+        for index in range(args.jobs):
+            start = time.perf_counter()
+            result = client.create_animation_from_files(
+                image_path=args.image,
+                video_path=args.video,
+                seed=index,
+                output_mode="inline",
+                sync_wait_ms=args.sync_wait_ms
+            )
+            saved = client.save_video_result(result, os.path.join(harness.workdir, "client_output", f"single_{index}.mp4"))
+            latencies.append(time.perf_counter() - start)
+            failed += not saved
+        comfy = harness.comfy_window(first_record)
+        gpu_mean = comfy["execution_seconds"].get("mean", 0.0)
+        client.upload_executor.shutdown()
+        return {
+            "jobs": args.jobs,
+            "failed": failed,
+            "cold_latency_seconds": round(latencies[0], 4),
+            "latency_seconds": summarize(latencies[1:] or latencies),
+            "overhead_seconds": summarize([latency - gpu_mean for latency in latencies[1:] or latencies]),
+            "comfy": comfy,
+            "worker": worker_report(worker.stats()),
+        }
+    finally:
+        worker.stop()
+
+
+def scenario_concurrent(harness: Harness, args) -> Dict[str, Any]:
+    """Many jobs submitted at once (status polling, volume output) against a concurrent worker"""
+    worker = harness.start_worker("concurrent", {"MAX_CONCURRENCY": str(args.concurrency)})
+    try:
+        first_record = len(harness.comfy.records)
+        start = time.perf_counter()
+        if args.client == "async":
+            latencies, failed, status_requests = asyncio.run(_concurrent_async(harness, worker, args))
+        else:
+            latencies, failed, status_requests = _concurrent_sync(harness, worker, args)
+        wall = time.perf_counter() - start
+        comfy = harness.comfy_window(first_record)
+        gpu_mean = comfy["execution_seconds"].get("mean") or 0.0
+        return {
+            "jobs": args.concurrent_jobs,
+            "concurrency": args.concurrency,
+            "client": args.client,
+            "failed": failed,
+            "wall_seconds": round(wall, 4),
+            "throughput_jobs_per_second": round(args.concurrent_jobs / wall, 4),
+            "ideal_jobs_per_second": round(1 / gpu_mean, 4) if gpu_mean else None,
+            "gpu_utilization": round(comfy["busy_seconds"] / wall, 4),
+            "latency_seconds": summarize(latencies),
+            "status_requests": status_requests,
+            "comfy": comfy,
+            "worker": worker_report(worker.stats()),
+        }
+    finally:
+        worker.stop()
+
+
+def _concurrent_sync(harness: Harness, worker: WorkerProcess, args):
+    from concurrent.futures import ThreadPoolExecutor
+    from wananimate_s3_client import WanAnimateS3Client
+
+    client = WanAnimateS3Client(**harness.client_options(worker))
+
+    def run_job(index: int):
+        start = time.perf_counter()
+        result = client.create_animation_from_files(
+            image_path=args.image, video_path=args.video, seed=index, output_mode="volume"
+        )
+        saved = client.save_video_result(result, os.path.join(harness.workdir, "client_output", f"concurrent_{index}.mp4"))
+        return time.perf_counter() - start, saved
+
+    with ThreadPoolExecutor(max_workers=args.concurrent_jobs) as executor:
+        results = list(executor.map(run_job, range(args.concurrent_jobs)))
+    client.upload_executor.shutdown()
+    return [latency for latency, _ in results], sum(not saved for _, saved in results), client.status_poller.request_count
+
+
+async def _concurrent_async(harness: Harness, worker: WorkerProcess, args):
+    from wananimate_s3_client import AsyncWanAnimateS3Client
+
+    async with AsyncWanAnimateS3Client(**harness.client_options(worker)) as client:
+        status_requests = 0
+        original_request = client._api_request
+
+        async def counted_request(method, url, *a, **kw):
+            nonlocal status_requests
+            if url.startswith(client.status_url) or url.startswith(client.stream_url):
+                status_requests += 1
+            return await original_request(method, url, *a, **kw)
+        client._api_request = counted_request
+
+        async def run_job(index: int):
+            start = time.perf_counter()
+            result = await client.create_animation_from_files(
+                image_path=args.image, video_path=args.video, seed=index, output_mode="volume"
+            )
+            saved = await client.save_video_result(
+                result, os.path.join(harness.workdir, "client_output", f"concurrent_{index}.mp4")
+            )
+            return time.perf_counter() - start, saved
+
+        results = await asyncio.gather(*(run_job(index) for index in range(args.concurrent_jobs)))
+    return [latency for latency, _ in results], sum(not saved for _, saved in results), status_requests
+
+
+def scenario_large_payload(harness: Harness, args) -> Dict[str, Any]:
+    """Base64 image/video inputs in the request body and an inline base64 video in the response"""
+    from wananimate_s3_client import WanAnimateS3Client
+
+    image_path = os.path.join(harness.workdir, "payload_image.jpg")
+    video_path = os.path.join(harness.workdir, "payload_video.mp4")
+    write_synthetic_file(image_path, args.payload_image_bytes, JPEG_HEADER)
+    write_synthetic_file(video_path, args.payload_video_bytes, MP4_HEADER)
+
+    worker = harness.start_worker("large_payload", {"MAX_CONCURRENCY": "1", "INLINE_OUTPUT_MAX_BYTES": str(4 * 1024 * MB)})
+    output_bytes = harness.comfy.output_bytes
+    harness.comfy.output_bytes = args.payload_output_bytes
+    try:
+        client = WanAnimateS3Client(**harness.client_options(worker))
+        first_record = len(harness.comfy.records)
+        encode, submit, latencies, decode, request_bytes, response_bytes, failed = [], [], [], [], [], [], 0
+        for index in range(args.payload_jobs):
+            start = time.perf_counter()
+            with open(image_path, "rb") as f:
+                image = bytearray(f.read())
+            with open(video_path, "rb") as f:
+                video = bytearray(f.read())
+            # Make every payload unique so the handler's input cache does not short-circuit decoding
+            marker = uuid.uuid4().bytes
+            image[len(JPEG_HEADER):len(JPEG_HEADER) + 16] = marker
+            video[len(MP4_HEADER):len(MP4_HEADER) + 16] = marker
+            body = json.dumps({"input": {
+                "prompt": "A person walking in a natural way",
+                "seed": index,
+                "cfg": 1.0,
+                "fps": 16,
+                "width": 832,
+                "height": 480,
+                "image_base64": base64.b64encode(image).decode("ascii"),
+                "video_base64": base64.b64encode(video).decode("ascii"),
+                "output_mode": "inline",
+            }})
+            del image, video
+            encoded = time.perf_counter()
+            encode.append(encoded - start)
+            request_bytes.append(len(body))
+
+            response = client.session.post(client.runpod_api_endpoint, data=body, timeout=300)
+            del body
+            response.raise_for_status()
+            job_id = response.json()["id"]
+            submit.append(time.perf_counter() - encoded)
+            result = client.wait_for_completion(job_id, check_interval=1)
+
+            decode_start = time.perf_counter()
+            output = result.get("output") or {}
+            response_bytes.append(len(output.get("video") or "") if isinstance(output, dict) else 0)
+            saved = client.save_video_result(result, os.path.join(harness.workdir, "client_output", f"payload_{index}.mp4"))
+            decode.append(time.perf_counter() - decode_start)
+            latencies.append(time.perf_counter() - start)
+            failed += not saved
+        client.upload_executor.shutdown()
+        return {
+            "jobs": args.payload_jobs,
+            "failed": failed,
+            "request_mb": round(statistics.fmean(request_bytes) / MB, 2),
+            "response_mb": round(statistics.fmean(response_bytes) / MB, 2),
+            "client_encode_seconds": summarize(encode),
+            "client_submit_seconds": summarize(submit),
+            "client_decode_seconds": summarize(decode),
+            "latency_seconds": summarize(latencies),
+            "comfy": harness.comfy_window(first_record),
+            "worker": worker_report(worker.stats()),
+        }
+    finally:
+        harness.comfy.output_bytes = output_bytes
+        worker.stop()
+
+
+SCENARIOS = {
+    "single": scenario_single,
+    "concurrent": scenario_concurrent,
+    "large_payload": scenario_large_payload,
+}
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*command):
+        return subprocess.run(["git", *command], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or "unknown",
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    values = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    current = flatten(report["scenarios"])
+    previous = flatten(baseline["scenarios"]) if baseline else {}
+    meta = report["meta"]
+    print(f"\nWanAnimate benchmark @ {meta['commit']}{' (dirty)' if meta['dirty'] else ''}")
+    if baseline:
+        base = baseline["meta"]
+        print(f"compared with {base['commit']}{' (dirty)' if base['dirty'] else ''}")
+    width = max((len(key) for key in current), default=10)
+    for key, value in current.items():
+        line = f"  {key:<{width}}  {value:>12.4f}"
+        if key in previous:
+            old = previous[key]
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            line += f"  {old:>12.4f}  {change:>8}"
+        print(line)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline WanAnimate handler/client benchmark")
+    subparsers = parser.add_subparsers(dest="command")
+    worker = subparsers.add_parser("worker", help=argparse.SUPPRESS)
+    worker.add_argument("--port", type=int, required=True)
+    worker.add_argument("--volume", required=True)
+
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--jobs", type=int, default=5, help="Sequential jobs in the single scenario")
+    parser.add_argument("--concurrent-jobs", type=int, default=16, help="Jobs submitted at once in the concurrent scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="Worker MAX_CONCURRENCY in the concurrent scenario")
+    parser.add_argument("--client", choices=["auto", "sync", "async"], default="auto",
+                        help="Client used by the concurrent scenario (auto: async when aioboto3 is installed)")
+    parser.add_argument("--payload-jobs", type=int, default=3, help="Jobs in the large_payload scenario")
+    parser.add_argument("--payload-image-bytes", type=int, default=8 * MB)
+    parser.add_argument("--payload-video-bytes", type=int, default=64 * MB)
+    parser.add_argument("--payload-output-bytes", type=int, default=32 * MB)
+    parser.add_argument("--image", default=os.path.join(REPO_DIR, "example_image.jpeg"), help="Input image for client scenarios")
+    parser.add_argument("--video", default=os.path.join(REPO_DIR, "example_video.mp4"), help="Input video for client scenarios")
+    parser.add_argument("--sync-wait-ms", type=int, default=90000, help="/runsync wait used by the single scenario")
+    parser.add_argument("--node-delay", type=float, default=0.005, help="Simulated time per ComfyUI node (seconds)")
+    parser.add_argument("--step-delay", type=float, default=0.05, help="Simulated time per sampler step (seconds)")
+    parser.add_argument("--steps", type=int, default=None, help="Sampler step override (default: the prompt's steps)")
+    parser.add_argument("--output-bytes", type=int, default=MB, help="Size of every generated video")
+    parser.add_argument("--warmup", action="store_true", help="Run the handler's warmup workflow before each scenario")
+    parser.add_argument("--output", help="Report path (default: benchmark-<commit>.json)")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    parser.add_argument("--workdir", help="Keep servers' files and worker logs in this directory")
+    parser.add_argument("--log-level", default="WARNING", help="Log level of the benchmark process")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if web is None:
+        sys.exit("benchmark.py requires 'aiohttp' (pip install aiohttp)")
+    if args.command == "worker":
+        run_worker(args)
+        return
+
+    logging.basicConfig(level=args.log_level)
+    # Plain (non aws-chunked) S3 uploads from the clients
+    os.environ.setdefault("AWS_REQUEST_CHECKSUM_CALCULATION", "when_required")
+    os.environ.setdefault("AWS_RESPONSE_CHECKSUM_VALIDATION", "when_required")
+    import wananimate_s3_client
+    logging.getLogger().setLevel(args.log_level)
+    if args.client == "auto":
+        args.client = "async" if wananimate_s3_client.aioboto3 is not None else "sync"
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="wananimate-bench-")
+    os.makedirs(os.path.join(workdir, "client_output"), exist_ok=True)
+    harness = Harness(workdir, {
+        "node_delay": args.node_delay,
+        "step_delay": args.step_delay,
+        "steps": args.steps,
+        "output_bytes": args.output_bytes,
+    }, warmup=args.warmup)
+
+    report = {
+        "meta": dict(
+            git_revision(),
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            cpus=os.cpu_count(),
+            settings={key: value for key, value in vars(args).items() if key not in ("command", "compare", "output")},
+        ),
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenario or list(SCENARIOS):
+            print(f"▶ {name} ...", flush=True)
+            start = time.perf_counter()
+            report["scenarios"][name] = SCENARIOS[name](harness, args)
+            print(f"✅ {name} finished in {time.perf_counter() - start:.1f}s", flush=True)
+    finally:
+        harness.close()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or f"benchmark-{report['meta']['commit']}.json"
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    print(f"\nReport saved: {output}")
+
+
+if __name__ == "__main__":
+    main()
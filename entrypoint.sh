@@ -3,6 +3,32 @@
 # Exit immediately if a command exits with a non-zero status.
 set -e
 
+# torch.compile (inductor/Triton) 캐시를 네트워크 볼륨에 두면 다음 콜드 스타트에서 컴파일 결과를 재사용합니다.
+# COMPILE_CACHE_DIR을 지정하거나, PERSIST_COMPILE_CACHE=true(기본값)이고 네트워크 볼륨이 연결되어 있으면 사용합니다.
+if [ -z "$COMPILE_CACHE_DIR" ] && [ "${PERSIST_COMPILE_CACHE:-true}" = "true" ] && [ -d /runpod-volume ]; then
+    COMPILE_CACHE_DIR=/runpod-volume/wananimate_cache/compile
+fi
+if [ -n "$COMPILE_CACHE_DIR" ]; then
+    # GPU 아키텍처나 torch/triton 버전이 다르면 컴파일 결과를 공유할 수 없으므로 키별로 디렉토리를 나눕니다.
+    gpu_arch=$(nvidia-smi --query-gpu=compute_cap --format=csv,noheader 2>/dev/null | head -n 1 | tr -d '.[:space:]')
+    package_versions=$(python -c "
+from importlib.metadata import version, PackageNotFoundError
+def package_version(name):
+    try:
+        return version(name)
+    except PackageNotFoundError:
+        return 'none'
+print('-'.join(f'{name}{package_version(name)}' for name in ('torch', 'triton')))
+" 2>/dev/null || echo "unknown")
+    COMPILE_CACHE_KEY=$(echo "sm${gpu_arch:-unknown}-${package_versions}" | tr -c 'A-Za-z0-9._\n-' '_')
+    export COMPILE_CACHE_KEY
+    export TORCHINDUCTOR_CACHE_DIR="$COMPILE_CACHE_DIR/$COMPILE_CACHE_KEY/inductor"
+    export TRITON_CACHE_DIR="$COMPILE_CACHE_DIR/$COMPILE_CACHE_KEY/triton"
+    export TORCHINDUCTOR_FX_GRAPH_CACHE=1
+    mkdir -p "$TORCHINDUCTOR_CACHE_DIR" "$TRITON_CACHE_DIR"
+    echo "Using persistent compile cache: $COMPILE_CACHE_DIR/$COMPILE_CACHE_KEY"
+fi
+
 # Start ComfyUI in the background
 echo "Starting ComfyUI in the background..."
 python /ComfyUI/main.py --listen --use-sage-attention &
@@ -28,5 +54,6 @@ fi
 
 # Start the handler in the foreground
 # 이 스크립트가 컨테이너의 메인 프로세스가 됩니다.
+# 핸들러는 예열 워크플로우(WARMUP_ENABLED)를 실행한 뒤에 job을 받기 시작합니다.
 echo "Starting the handler..."
 exec python handler.py
\ No newline at end of file
@@ -9,8 +9,25 @@ import logging
 import urllib.request
 import urllib.parse
 import binascii # Base64 에러 처리를 위해 import
-import subprocess
 import time
+import subprocess
+import random
+import queue
+import threading
+import collections
+import shutil
+import asyncio
+import hashlib
+import itertools
+import math
+import re
+import contextlib
+import contextvars
+import http.server
+import requests
+from requests.adapters import HTTPAdapter
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 
 # 로깅 설정
 logging.basicConfig(level=logging.INFO)
@@ -18,7 +35,683 @@ logger = logging.getLogger(__name__)
 
 
 server_address = os.getenv('SERVER_ADDRESS', '127.0.0.1')
+comfy_port = int(os.getenv('COMFY_PORT', '8188'))
 client_id = str(uuid.uuid4())
+
+# ComfyUI 연결 관리 설정
+COMFY_KEEPALIVE_INTERVAL = float(os.getenv('COMFY_KEEPALIVE_INTERVAL', '20'))
+COMFY_RECONNECT_BASE_DELAY = float(os.getenv('COMFY_RECONNECT_BASE_DELAY', '0.5'))
+COMFY_RECONNECT_MAX_DELAY = float(os.getenv('COMFY_RECONNECT_MAX_DELAY', '10'))
+COMFY_CONNECT_TIMEOUT = float(os.getenv('COMFY_CONNECT_TIMEOUT', '180'))
+
+# 출력 전달 설정
+# OUTPUT_MODE: auto | inline | upload | volume (job 입력의 output_mode로 덮어쓸 수 있음)
+OUTPUT_MODE = os.getenv('OUTPUT_MODE', 'auto')
+INLINE_OUTPUT_MAX_BYTES = int(os.getenv('INLINE_OUTPUT_MAX_BYTES', str(10 * 1024 * 1024)))
+# base64 청크가 독립적으로 디코딩되도록 3의 배수로 맞춥니다.
+OUTPUT_CHUNK_BYTES = int(os.getenv('OUTPUT_CHUNK_BYTES', str(3 * 1024 * 1024))) // 3 * 3
+OUTPUT_STREAMING = os.getenv('OUTPUT_STREAMING', 'false').lower() == 'true'
+NETWORK_VOLUME_PATH = os.getenv('NETWORK_VOLUME_PATH', '/runpod-volume')
+
+# 캐시 루트 (네트워크 볼륨이 있으면 워커 간에 공유됩니다)
+CACHE_ROOT = os.getenv(
+    'CACHE_ROOT',
+    os.path.join(NETWORK_VOLUME_PATH, 'wananimate_cache') if os.path.isdir(NETWORK_VOLUME_PATH) else '/tmp/wananimate_cache'
+)
+INPUT_CACHE_ENABLED = os.getenv('INPUT_CACHE_ENABLED', 'true').lower() == 'true'
+INPUT_CACHE_MAX_BYTES = int(os.getenv('INPUT_CACHE_MAX_BYTES', str(20 * 1024 * 1024 * 1024)))
+
+# 텍스트 임베딩 캐시 설정 (WanVideoTextEncodeCached 노드의 디스크 캐시를 CACHE_ROOT 아래에 두고 크기를 관리)
+TEXT_EMBED_CACHE_ENABLED = os.getenv('TEXT_EMBED_CACHE_ENABLED', 'true').lower() == 'true'
+TEXT_EMBED_CACHE_MAX_BYTES = int(os.getenv('TEXT_EMBED_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+# ComfyUI-WanVideoWrapper가 임베딩을 저장하는 디렉토리 (CACHE_ROOT 아래 디렉토리로 심볼릭 링크합니다)
+TEXT_EMBED_NODE_CACHE_DIR = os.getenv(
+    'TEXT_EMBED_NODE_CACHE_DIR', '/ComfyUI/custom_nodes/ComfyUI-WanVideoWrapper/text_embed_cache'
+)
+
+# 전처리 캐시 설정 (같은 driving 비디오의 포즈/얼굴 검출 결과를 저장해 두고 검출을 건너뜀)
+PREPROCESS_CACHE_ENABLED = os.getenv('PREPROCESS_CACHE_ENABLED', 'true').lower() == 'true'
+PREPROCESS_CACHE_MAX_BYTES = int(os.getenv('PREPROCESS_CACHE_MAX_BYTES', str(20 * 1024 * 1024 * 1024)))
+# 검출 노드 코드가 바뀌어 이전 결과를 쓰면 안 될 때 올리는 버전 (캐시 키에 포함)
+PREPROCESS_CACHE_VERSION = os.getenv('PREPROCESS_CACHE_VERSION', '1')
+# mode=preprocess로 만든 자산(asset_id)을 마지막 사용 후 보관할 시간 (초)
+PREPROCESS_ASSET_TTL = float(os.getenv('PREPROCESS_ASSET_TTL', str(7 * 24 * 3600)))
+
+# 결과 캐시 설정 (같은 요청이 다시 오면 생성을 건너뛰고 저장된 결과를 반환)
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', 'true').lower() == 'true'
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(50 * 1024 * 1024 * 1024)))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', str(7 * 24 * 3600)))
+# 실행 중 표시(lock)가 이 시간(초)보다 오래되면 실행한 워커가 죽은 것으로 보고 무시합니다.
+RESULT_CACHE_LOCK_TIMEOUT = float(os.getenv('RESULT_CACHE_LOCK_TIMEOUT', '7200'))
+
+# 워크플로우 템플릿(newWanAnimate_*_api.json)이 있는 디렉토리 (Docker 이미지에서는 /)
+WORKFLOW_DIR = os.getenv('WORKFLOW_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# Base64 입력을 디코딩할 때 한 번에 처리하는 문자 수 (4의 배수)
+BASE64_DECODE_CHUNK_CHARS = int(os.getenv('BASE64_DECODE_CHUNK_CHARS', str(4 * 1024 * 1024))) // 4 * 4
+
+# URL 입력 다운로드 설정
+DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv('DOWNLOAD_CONNECT_TIMEOUT', '10'))
+DOWNLOAD_READ_TIMEOUT = float(os.getenv('DOWNLOAD_READ_TIMEOUT', '60'))
+DOWNLOAD_MAX_BYTES = int(os.getenv('DOWNLOAD_MAX_BYTES', str(4 * 1024 * 1024 * 1024)))
+DOWNLOAD_PART_BYTES = int(os.getenv('DOWNLOAD_PART_BYTES', str(16 * 1024 * 1024)))
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '8'))
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', '3'))
+# 재시도 대기 시간(초). 재시도마다 두 배로 늘어납니다.
+DOWNLOAD_RETRY_DELAY = float(os.getenv('DOWNLOAD_RETRY_DELAY', '1'))
+
+# 긴 비디오 분할 처리에 사용하는 ffmpeg/ffprobe 경로
+FFMPEG_PATH = os.getenv('FFMPEG_PATH', 'ffmpeg')
+FFPROBE_PATH = os.getenv('FFPROBE_PATH', 'ffprobe')
+# 시작할 때 찾지 못한 도구. 이 도구가 필요한 기능은 job 도중 실패하지 않도록 미리 끄거나 거부합니다.
+MISSING_MEDIA_TOOLS = [path for path in (FFMPEG_PATH, FFPROBE_PATH) if shutil.which(path) is None]
+if MISSING_MEDIA_TOOLS:
+    logger.error(f"❌ {', '.join(MISSING_MEDIA_TOOLS)}를 찾을 수 없습니다. 이 도구가 필요한 기능을 사용할 수 없습니다.")
+
+# 타이밍/메트릭 설정
+# TIMING_IN_OUTPUT: job 출력에 단계별 시간 요약(timing)을 포함할지 여부
+TIMING_IN_OUTPUT = os.getenv('TIMING_IN_OUTPUT', 'true').lower() == 'true'
+# METRICS_FILE: job이 끝날 때마다 Prometheus 텍스트 형식 메트릭을 기록할 파일 (빈 값이면 기록하지 않음)
+METRICS_FILE = os.getenv('METRICS_FILE', '/tmp/wananimate_metrics.prom')
+# METRICS_PORT: 0이 아니면 이 포트에서 /metrics HTTP 엔드포인트를 제공
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+
+# 영구 torch.compile 캐시 (entrypoint.sh가 COMPILE_CACHE_DIR/<GPU 아키텍처·패키지 버전 키> 아래로 설정합니다)
+COMPILE_CACHE_KEY = os.getenv('COMPILE_CACHE_KEY', '')
+TORCHINDUCTOR_CACHE_DIR = os.getenv('TORCHINDUCTOR_CACHE_DIR', '')
+TRITON_CACHE_DIR = os.getenv('TRITON_CACHE_DIR', '')
+
+# 해상도/프레임 수 버킷: 요청 크기를 정해진 형태로 맞춰 실행해 컴파일된 그래프를 재사용하고, 마지막에 요청 크기로 되돌립니다.
+# SHAPE_BUCKETING: 기본 사용 여부 (job 입력의 shape_bucketing으로 job별로 바꿀 수 있음)
+SHAPE_BUCKETING = os.getenv('SHAPE_BUCKETING', 'false').lower() == 'true'
+# SHAPE_BUCKETS: 실행 해상도 후보 (너비x높이, 쉼표로 구분)
+SHAPE_BUCKETS = [
+    tuple(int(value) for value in shape.strip().lower().split('x'))
+    for shape in os.getenv('SHAPE_BUCKETS', '832x480,480x832,1280x720,720x1280,640x640').split(',') if shape.strip()
+]
+# SHAPE_FRAME_BUCKETS: 프레임 수 후보. 가장 큰 값보다 길면 그 배수로 올립니다 (빈 값이면 프레임 수는 그대로 둠)
+SHAPE_FRAME_BUCKETS = sorted(int(value) for value in os.getenv('SHAPE_FRAME_BUCKETS', '33,49,77').split(',') if value.strip())
+if SHAPE_FRAME_BUCKETS and MISSING_MEDIA_TOOLS:
+    logger.warning("⚠️ ffmpeg/ffprobe가 없어 프레임 수 버킷(SHAPE_FRAME_BUCKETS)을 사용하지 않습니다.")
+
+# VRAM에 맞춘 블록 스왑 수(196), 프레임 창 크기(198), VAE 타일링(28) 자동 설정
+# VRAM_TUNING: 사용 여부 (job 입력의 vram_tuning: false로 job별로 끌 수 있음)
+VRAM_TUNING = os.getenv('VRAM_TUNING', 'true').lower() == 'true'
+# 계획할 때 여유 VRAM 중 남겨 둘 비율 (조각화, 측정 간격 사이의 순간 최대치 대비)
+VRAM_HEADROOM = float(os.getenv('VRAM_HEADROOM', '0.1'))
+# 보정표에 측정값이 없는 형태에 쓰는 메모리 모델 (Wan 14B fp8 기준)
+# 최대 사용량 ≈ BASE + (MODEL_BLOCKS - 스왑 블록) × BLOCK + 프레임 창의 latent 토큰 수 × TOKEN
+VRAM_MODEL_BLOCKS = int(os.getenv('VRAM_MODEL_BLOCKS', '40'))
+VRAM_BASE_BYTES = int(os.getenv('VRAM_BASE_BYTES', str(4 * 1024 * 1024 * 1024)))
+VRAM_BLOCK_BYTES = int(os.getenv('VRAM_BLOCK_BYTES', str(350 * 1024 * 1024)))
+VRAM_TOKEN_BYTES = int(os.getenv('VRAM_TOKEN_BYTES', str(360 * 1024)))
+# 타일링 없이 VAE로 디코딩할 때 프레임 픽셀 하나당 사용량
+VRAM_VAE_BYTES_PER_PIXEL = int(os.getenv('VRAM_VAE_BYTES_PER_PIXEL', str(12 * 1024)))
+# 블록을 모두 스왑해도 부족할 때 차례로 줄여 볼 프레임 창 크기 (4의 배수 + 1)
+VRAM_WINDOW_SIZES = sorted((int(value) for value in os.getenv('VRAM_WINDOW_SIZES', '77,61,45,29').split(',') if value.strip()), reverse=True)
+# OOM이 난 형태는 다음부터 이만큼 더 스왑합니다.
+VRAM_OOM_BLOCK_STEP = int(os.getenv('VRAM_OOM_BLOCK_STEP', '5'))
+# 실행 중 최대 VRAM 사용량을 확인하는 간격 (초)
+VRAM_SAMPLE_INTERVAL = float(os.getenv('VRAM_SAMPLE_INTERVAL', '0.5'))
+
+# 한 job에서 seed/프롬프트/cfg/steps 목록의 조합으로 만들 수 있는 최대 변형 수
+MAX_VARIANTS = int(os.getenv('MAX_VARIANTS', '16'))
+
+# 한 워커에서 동시에 처리할 job 수 (입력 준비/출력 업로드가 GPU 실행과 겹치도록 함)
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', '2'))
+
+# 예열 설정: job을 받기 전에 실제 템플릿으로 만든 작은 합성 워크플로우를 실행해 모델/컴파일/ONNX 세션을 미리 준비합니다.
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+# WARMUP_WORKFLOWS: 예열할 워크플로우 변형 (replace, animate, replace_points, animate_points 중 쉼표로 구분)
+WARMUP_WORKFLOWS = [name.strip() for name in os.getenv('WARMUP_WORKFLOWS', 'replace').split(',') if name.strip()]
+WARMUP_WIDTH = int(os.getenv('WARMUP_WIDTH', '256'))
+WARMUP_HEIGHT = int(os.getenv('WARMUP_HEIGHT', '256'))
+WARMUP_FRAMES = int(os.getenv('WARMUP_FRAMES', '17'))
+WARMUP_STEPS = int(os.getenv('WARMUP_STEPS', '1'))
+# 예열 때 영구 컴파일 캐시에 미리 채워 둘 해상도 (너비x높이, 쉼표로 구분)
+COMPILE_CACHE_SHAPES = [shape.strip() for shape in os.getenv('COMPILE_CACHE_SHAPES', '832x480,480x832').split(',') if shape.strip()]
+WARMUP_IMAGE = os.getenv('WARMUP_IMAGE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example_image.jpeg'))
+WARMUP_VIDEO = os.getenv('WARMUP_VIDEO', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example_video.mp4'))
+
+
+class ComfyUIConnectionManager:
+    """
+    ComfyUI 웹소켓 연결을 job 사이에서 재사용하는 연결 관리자입니다.
+    한 번 연결되면 keepalive ping으로 연결을 유지하고, 끊어지면 지수 백오프 + 지터로 재연결합니다.
+    수신한 메시지는 백그라운드 스레드가 prompt_id별 큐로 전달합니다.
+    """
+
+    # 구독 전에 도착한 메시지를 보관할 최대 prompt 수
+    MAX_ORPHAN_PROMPTS = 32
+
+    def __init__(self, server_address, client_id, port=8188):
+        self.ws_url = f"ws://{server_address}:{port}/ws?clientId={client_id}"
+        self.http_url = f"http://{server_address}:{port}/"
+        self._ws = None
+        self._lock = threading.RLock()
+        self._connected = threading.Event()
+        self._http_ready = False
+        self._reader = None
+        self._listeners = {}
+        self._orphans = collections.OrderedDict()
+        self._stats = {
+            "connects": 0,
+            "reconnects": 0,
+            "warm_reuses": 0,
+            "http_ready_seconds": None,
+            "last_connect_seconds": None,
+            "last_reconnect_seconds": None,
+            "total_reconnect_seconds": 0.0,
+        }
+
+    def get_stats(self):
+        """연결/재연결 소요 시간 통계를 반환합니다."""
+        with self._lock:
+            return dict(self._stats, connected=self._connected.is_set())
+
+    def ensure_connected(self):
+        """
+        웹소켓이 연결되어 있는지 확인하고, 없으면 연결합니다.
+        이미 연결된 warm 워커에서는 HTTP 준비 확인과 연결 과정을 모두 건너뜁니다.
+        """
+        if self._connected.is_set() and self._reader is not None and self._reader.is_alive():
+            with self._lock:
+                self._stats["warm_reuses"] += 1
+            return
+
+        with self._lock:
+            if not self._http_ready:
+                self._wait_for_http()
+            if self._reader is None or not self._reader.is_alive():
+                self._connect(reconnect=False)
+                self._reader = threading.Thread(target=self._read_loop, name="comfyui-ws-reader", daemon=True)
+                self._reader.start()
+                return
+
+        # 리더 스레드가 재연결 중이면 완료될 때까지 기다립니다.
+        if not self._connected.wait(COMFY_CONNECT_TIMEOUT):
+            raise Exception("웹소켓 연결 시간 초과")
+
+    def subscribe(self, prompt_id, messages=None):
+        """
+        prompt_id에 해당하는 메시지를 받을 큐를 등록합니다. 구독 전에 도착한 메시지도 함께 전달됩니다.
+        messages를 넘기면 put()을 가진 임의의 큐(AsyncMessageQueue 등)를 사용합니다.
+        """
+        if messages is None:
+            messages = queue.Queue()
+        with self._lock:
+            for message in self._orphans.pop(prompt_id, []):
+                messages.put(message)
+            self._listeners[prompt_id] = messages
+        return messages
+
+    def unsubscribe(self, prompt_id):
+        with self._lock:
+            self._listeners.pop(prompt_id, None)
+
+    def _wait_for_http(self):
+        # ComfyUI 서버가 HTTP 요청에 응답할 때까지 대기 (최대 3분, 워커당 한 번만 수행)
+        logger.info(f"Checking HTTP connection to: {self.http_url}")
+        start = time.time()
+        max_http_attempts = 180
+        for http_attempt in range(max_http_attempts):
+            try:
+                urllib.request.urlopen(self.http_url, timeout=5)
+                logger.info(f"HTTP 연결 성공 (시도 {http_attempt+1})")
+                break
+            except Exception as e:
+                logger.warning(f"HTTP 연결 실패 (시도 {http_attempt+1}/{max_http_attempts}): {e}")
+                if http_attempt == max_http_attempts - 1:
+                    raise Exception("ComfyUI 서버에 연결할 수 없습니다. 서버가 실행 중인지 확인하세요.")
+                time.sleep(1)
+        self._http_ready = True
+        self._stats["http_ready_seconds"] = time.time() - start
+
+    def _connect(self, reconnect):
+        """지수 백오프와 지터를 적용해 웹소켓 연결을 시도합니다."""
+        logger.info(f"Connecting to WebSocket: {self.ws_url}")
+        start = time.time()
+        attempt = 0
+        while True:
+            ws = websocket.WebSocket()
+            try:
+                ws.connect(self.ws_url, timeout=10)
+                break
+            except Exception as e:
+                elapsed = time.time() - start
+                if elapsed >= COMFY_CONNECT_TIMEOUT:
+                    raise Exception(f"웹소켓 연결 시간 초과 ({COMFY_CONNECT_TIMEOUT:.0f}초)")
+                delay = min(COMFY_RECONNECT_MAX_DELAY, COMFY_RECONNECT_BASE_DELAY * (2 ** attempt))
+                delay = random.uniform(delay / 2, delay)
+                logger.warning(f"웹소켓 연결 실패 (시도 {attempt+1}): {e} - {delay:.2f}초 후 재시도")
+                time.sleep(delay)
+                attempt += 1
+
+        # recv()가 주기적으로 깨어나 keepalive ping을 보낼 수 있도록 타임아웃을 설정합니다.
+        ws.settimeout(COMFY_KEEPALIVE_INTERVAL)
+        elapsed = time.time() - start
+        with self._lock:
+            self._ws = ws
+            self._stats["connects"] += 1
+            self._stats["last_connect_seconds"] = elapsed
+            if reconnect:
+                self._stats["reconnects"] += 1
+                self._stats["last_reconnect_seconds"] = elapsed
+                self._stats["total_reconnect_seconds"] += elapsed
+        self._connected.set()
+        logger.info(f"웹소켓 연결 성공 (시도 {attempt+1}, {elapsed:.2f}초)")
+
+    def _read_loop(self):
+        while True:
+            try:
+                out = self._ws.recv()
+            except websocket.WebSocketTimeoutException:
+                try:
+                    self._ws.ping()
+                except Exception as e:
+                    self._handle_disconnect(e)
+                continue
+            except Exception as e:
+                self._handle_disconnect(e)
+                continue
+
+            # 바이너리 프레임(미리보기 이미지)은 사용하지 않습니다.
+            if not isinstance(out, str):
+                continue
+            try:
+                message = json.loads(out)
+                if not isinstance(message, dict):
+                    raise ValueError("JSON 객체가 아닙니다")
+            except ValueError as e:
+                # 깨진 메시지 하나 때문에 수신 스레드가 멈추면 모든 job이 응답을 받지 못합니다.
+                logger.warning(f"웹소켓 메시지를 해석할 수 없어 건너뜁니다: {e} ({out[:200]!r})")
+                continue
+            self._dispatch(message)
+
+    def _handle_disconnect(self, error):
+        logger.warning(f"웹소켓 연결이 끊어졌습니다: {error}")
+        self._connected.clear()
+        try:
+            self._ws.close()
+        except Exception:
+            pass
+        try:
+            self._connect(reconnect=True)
+        except Exception as e:
+            logger.error(f"❌ 웹소켓 재연결 실패: {e}")
+            # 대기 중인 job이 무한히 기다리지 않도록 연결 실패를 알립니다.
+            self._notify_listeners({"type": "_connection_lost", "data": {"error": str(e)}})
+            time.sleep(COMFY_RECONNECT_MAX_DELAY)
+            return
+        # 끊겨 있는 동안 놓친 메시지가 있을 수 있음을 대기 중인 job에 알립니다.
+        self._notify_listeners({"type": "_reconnected", "data": {}})
+
+    def _notify_listeners(self, message):
+        with self._lock:
+            for messages in self._listeners.values():
+                messages.put(message)
+
+    def _dispatch(self, message):
+        data = message.get('data') or {}
+        prompt_id = data.get('prompt_id')
+        if prompt_id is None:
+            return
+        with self._lock:
+            messages = self._listeners.get(prompt_id)
+            if messages is not None:
+                messages.put(message)
+                return
+            self._orphans.setdefault(prompt_id, []).append(message)
+            self._orphans.move_to_end(prompt_id)
+            while len(self._orphans) > self.MAX_ORPHAN_PROMPTS:
+                self._orphans.popitem(last=False)
+
+
+class AsyncMessageQueue:
+    """웹소켓 리더 스레드가 받은 메시지를 asyncio 이벤트 루프로 넘겨주는 큐 어댑터"""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def put(self, message):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, message)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+comfy_connection = ComfyUIConnectionManager(server_address, client_id, comfy_port)
+
+# 현재 실행 중인 타이밍 구간 (job마다, asyncio task/스레드마다 분리됩니다)
+current_span = contextvars.ContextVar('current_span', default=None)
+# 현재 job의 입력 파일을 두는 작업 디렉토리 (job_work_dir에서 설정)
+current_work_dir = contextvars.ContextVar('current_work_dir', default=None)
+
+
+class Span:
+    """job 처리 단계 하나의 시간 측정 구간입니다. 자식 구간과 함께 job별 트리를 이룹니다."""
+
+    def __init__(self, name, start=None, **attrs):
+        self.name = name
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.attrs = attrs
+        self.children = []
+        self._lock = threading.Lock()
+
+    @property
+    def seconds(self):
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def add_child(self, name, start=None, **attrs):
+        child = Span(name, start, **attrs)
+        with self._lock:
+            self.children.append(child)
+        return child
+
+    def finish(self, end=None):
+        if self.end is None:
+            self.end = time.time() if end is None else end
+
+    def walk(self, path=()):
+        """(경로, 구간)을 깊이 우선으로 반환합니다. 루트 구간은 경로에 포함하지 않습니다."""
+        for child in list(self.children):
+            child_path = path + (child.name,)
+            yield child_path, child
+            yield from child.walk(child_path)
+
+    def to_dict(self):
+        data = dict(self.attrs, name=self.name, seconds=round(self.seconds, 3))
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+
+@contextlib.contextmanager
+def timed(name, **attrs):
+    """현재 구간 아래에 자식 구간을 기록합니다. 측정 중인 job이 없으면 아무것도 하지 않습니다."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    span = parent.add_child(name, **attrs)
+    token = current_span.set(span)
+    try:
+        yield span
+    finally:
+        span.finish()
+        current_span.reset(token)
+
+
+def run_timed(name, func, *args):
+    with timed(name):
+        return func(*args)
+
+
+def timing_summary(root):
+    """
+    job 출력에 붙일 요약: 전체 시간과 단계별 시간(경로 → 초), 컴파일/텍스트 임베딩/전처리 캐시 적중 여부, VRAM 설정과 최대 사용량.
+    1ms 미만인 하위 구간은 생략합니다.
+    """
+    summary = {"total_seconds": round(root.seconds, 3), "stages": {}}
+    for path, span in root.walk():
+        if len(path) == 1 or span.seconds >= 0.001:
+            summary["stages"]["/".join(path)] = round(span.seconds, 3)
+        for key in ("compile_cache", "text_embed_cache", "preprocess_cache", "vram_tuning"):
+            if key in span.attrs:
+                summary[key] = span.attrs[key]
+    return summary
+
+
+class MetricsRegistry:
+    """
+    Prometheus 텍스트 형식으로 내보내는 카운터/히스토그램 모음입니다.
+    job이 끝날 때마다 METRICS_FILE에 기록하고, METRICS_PORT가 설정되면 HTTP(/metrics)로도 제공합니다.
+    """
+
+    DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+    def __init__(self, prefix, buckets=DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = collections.OrderedDict()
+        self._histograms = collections.OrderedDict()
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def add_collector(self, collect):
+        """render() 때마다 호출되어 {이름: 값} 게이지를 돌려주는 함수를 등록합니다."""
+        self._collectors.append(collect)
+
+    def observe_job(self, root, status):
+        """끝난 job의 구간 트리를 카운터/히스토그램에 반영합니다."""
+        self.inc("jobs_total", status=status)
+        self.observe("job_seconds", root.seconds)
+        for path, span in root.walk():
+            if "class_type" in span.attrs:
+                self.observe("node_seconds", span.seconds, class_type=span.attrs["class_type"])
+            else:
+                self.observe("stage_seconds", span.seconds, stage="/".join(path))
+            if "compile_cache" in span.attrs:
+                self.inc("compile_cache_total", result=span.attrs["compile_cache"]["result"])
+            if "shape_bucket" in span.attrs:
+                self.inc("shape_bucket_total", bucket=span.attrs["shape_bucket"]["bucket"])
+
+    def _format(self, name, labels, value, extra=()):
+        pairs = list(labels) + list(extra)
+        label_text = "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+        return f"{self.prefix}_{name}{label_text} {value}"
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, dict(h, buckets=list(h["buckets"]))) for key, h in self._histograms.items()]
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                lines.append(f"# TYPE {self.prefix}_{name} counter")
+                seen.add(name)
+            lines.append(self._format(name, labels, value))
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                lines.append(f"# TYPE {self.prefix}_{name} histogram")
+                seen.add(name)
+            for bound, count in zip(self.buckets, histogram["buckets"]):
+                lines.append(self._format(f"{name}_bucket", labels, count, (("le", bound),)))
+            lines.append(self._format(f"{name}_bucket", labels, histogram["count"], (("le", "+Inf"),)))
+            lines.append(self._format(f"{name}_sum", labels, round(histogram["sum"], 6)))
+            lines.append(self._format(f"{name}_count", labels, histogram["count"]))
+        for collect in self._collectors:
+            try:
+                gauges = collect()
+            except Exception as e:
+                logger.warning(f"메트릭 수집 실패: {e}")
+                continue
+            for name, value in gauges.items():
+                lines.append(f"# TYPE {self.prefix}_{name} gauge")
+                lines.append(self._format(name, (), value))
+        return "\n".join(lines) + "\n"
+
+    def write_file(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port):
+        """/metrics를 제공하는 HTTP 서버를 데몬 스레드로 시작합니다."""
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"📈 메트릭 엔드포인트: http://0.0.0.0:{port}/metrics")
+        return server
+
+
+metrics = MetricsRegistry('wananimate')
+
+
+@contextlib.contextmanager
+def job_timing(job):
+    """
+    job 하나의 구간 트리를 기록합니다. 끝나면 메트릭에 반영하고 METRICS_FILE을 갱신합니다.
+    with 블록 안에서 result를 span.attrs["status"]에 넣으면 성공/실패가 구분되어 집계됩니다.
+    """
+    root = Span("job", job_id=job.get("id"))
+    token = current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.finish()
+        current_span.reset(token)
+        metrics.observe_job(root, root.attrs.get("status", "error"))
+        if METRICS_FILE:
+            try:
+                metrics.write_file(METRICS_FILE)
+            except OSError as e:
+                logger.warning(f"메트릭 파일 기록 실패: {e}")
+        logger.info(f"⏱️ job 타이밍: {json.dumps(timing_summary(root), ensure_ascii=False)}")
+
+
+@contextlib.contextmanager
+def job_work_dir():
+    """
+    job 입력 파일(입력 캐시의 하드링크, 버킷 길이로 늘린 비디오 등)을 둘 task_<uuid> 디렉토리를 정하고,
+    job이 끝나면 삭제합니다. 결과 비디오는 ComfyUI 출력 디렉토리에 있으므로 영향을 받지 않습니다.
+    """
+    work_dir = f"task_{uuid.uuid4()}"
+    token = current_work_dir.set(work_dir)
+    try:
+        yield work_dir
+    finally:
+        current_work_dir.reset(token)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# 입력 파일 확장자별로 허용하는 컨테이너 형식
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.webm', '.mkv', '.avi', '.gif')
+
+
+def sniff_file_format(header):
+    """파일 앞부분의 매직 바이트로 컨테이너 형식을 추정합니다. 알 수 없으면 None을 반환합니다."""
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg', 'image'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png', 'image'
+    if header.startswith(b'GIF87a') or header.startswith(b'GIF89a'):
+        return 'gif', 'image'
+    if header.startswith(b'BM'):
+        return 'bmp', 'image'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp', 'image'
+    if header[:4] == b'RIFF' and header[8:12] == b'AVI ':
+        return 'avi', 'video'
+    if header[4:8] == b'ftyp':
+        return 'mp4', 'video'
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'webm', 'video'
+    return None
+
+
+def iter_base64_decoded(base64_data, chunk_chars=None):
+    """
+    Base64 입력을 고정 크기 조각 단위로 검증/디코딩하여 bytes 조각을 순서대로 반환합니다.
+    str 입력은 한 번만 ASCII bytes로 바꾸고, 조각은 memoryview로 잘라 복사 없이 처리합니다. 줄바꿈/공백이 섞인 입력도 처리합니다.
+    """
+    chunk_chars = chunk_chars or BASE64_DECODE_CHUNK_CHARS
+    if isinstance(base64_data, str):
+        try:
+            base64_data = base64_data.encode('ascii')
+        except UnicodeEncodeError as e:
+            raise binascii.Error(f"Base64 입력에 ASCII가 아닌 문자가 있습니다: {e}") from e
+        data = memoryview(base64_data)
+        # data:video/mp4;base64,... 형태의 data URI 접두사는 제거합니다.
+        if base64_data.startswith(b'data:'):
+            data = data[base64_data.index(b',') + 1:]
+    else:
+        data = memoryview(base64_data)
+    carry = data[:0]
+    for offset in range(0, len(data), chunk_chars):
+        piece = data[offset:offset + chunk_chars]
+        if len(carry):
+            piece = bytes(carry) + bytes(piece)
+        try:
+            # 대부분의 입력은 공백이 없으므로 바로 검증합니다.
+            usable = len(piece) - len(piece) % 4
+            decoded = base64.b64decode(piece[:usable], validate=True)
+        except binascii.Error:
+            piece = b''.join(bytes(piece).split())
+            usable = len(piece) - len(piece) % 4
+            decoded = base64.b64decode(piece[:usable], validate=True)
+        carry = piece[usable:]
+        yield decoded
+    # 끝에 남은 조각이 줄바꿈/공백뿐이면 정상 입력입니다.
+    if bytes(carry).strip():
+        raise binascii.Error("Incorrect padding")
+
+
+def decode_base64_to_file(base64_data, file_path, expected_kind=None):
+    """
+    Base64 입력을 조각 단위로 디코딩하면서 바로 파일에 씁니다. 메모리에는 한 조각만 유지됩니다.
+    expected_kind('image'/'video')가 주어지면 첫 조각의 매직 바이트를 확인해 잘못된 입력을 즉시 거부합니다.
+    """
+    try:
+        with open(file_path, 'wb') as f:
+            header = b''
+            for decoded in iter_base64_decoded(base64_data):
+                if expected_kind and len(header) < 16:
+                    header += decoded[:16 - len(header)]
+                    if len(header) >= 12:
+                        detected = sniff_file_format(header)
+                        # GIF는 이미지로 판별되지만 driving 비디오로도 쓸 수 있으므로 확장자 목록으로 허용 여부를 확인합니다.
+                        allowed = VIDEO_EXTENSIONS if expected_kind == 'video' else IMAGE_EXTENSIONS
+                        if detected is not None and f".{detected[0]}" not in allowed:
+                            raise ValueError(f"{expected_kind} 입력에 {detected[0]} 형식의 데이터가 전달되었습니다.")
+                        if detected is None:
+                            logger.warning(f"입력 형식을 확인할 수 없습니다: {header[:12]!r}")
+                        expected_kind = None
+                f.write(decoded)
+    except Exception:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    return file_path
+
+
 def save_data_if_base64(data_input, temp_dir, output_filename):
     """
     입력 데이터가 Base64 문자열인지 확인하고, 맞다면 파일로 저장 후 경로를 반환합니다.
@@ -29,16 +722,12 @@ def save_data_if_base64(data_input, temp_dir, output_filename):
         return data_input
 
     try:
-        # Base64 문자열은 디코딩을 시도하면 성공합니다.
-        decoded_data = base64.b64decode(data_input)
-        
         # 디렉토리가 존재하지 않으면 생성
         os.makedirs(temp_dir, exist_ok=True)
         
-        # 디코딩에 성공하면, 임시 파일로 저장합니다.
+        # Base64 문자열은 디코딩을 시도하면 성공합니다. 디코딩과 동시에 임시 파일로 저장합니다.
         file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
-        with open(file_path, 'wb') as f: # 바이너리 쓰기 모드('wb')로 저장
-            f.write(decoded_data)
+        decode_base64_to_file(data_input, file_path)
         
         # 저장된 파일의 경로를 반환합니다.
         print(f"✅ Base64 입력을 '{file_path}' 파일로 저장했습니다.")
@@ -50,7 +739,7 @@ def save_data_if_base64(data_input, temp_dir, output_filename):
         return data_input
     
 def queue_prompt(prompt):
-    url = f"http://{server_address}:8188/prompt"
+    url = f"http://{server_address}:{comfy_port}/prompt"
     logger.info(f"Queueing prompt to: {url}")
     p = {"prompt": prompt, "client_id": client_id}
     data = json.dumps(p).encode('utf-8')
@@ -58,7 +747,7 @@ def queue_prompt(prompt):
     return json.loads(urllib.request.urlopen(req).read())
 
 def get_image(filename, subfolder, folder_type):
-    url = f"http://{server_address}:8188/view"
+    url = f"http://{server_address}:{comfy_port}/view"
     logger.info(f"Getting image from: {url}")
     data = {"filename": filename, "subfolder": subfolder, "type": folder_type}
     url_values = urllib.parse.urlencode(data)
@@ -66,221 +755,2777 @@ def get_image(filename, subfolder, folder_type):
         return response.read()
 
 def get_history(prompt_id):
-    url = f"http://{server_address}:8188/history/{prompt_id}"
+    url = f"http://{server_address}:{comfy_port}/history/{prompt_id}"
     logger.info(f"Getting history from: {url}")
     with urllib.request.urlopen(url) as response:
         return json.loads(response.read())
 
-def get_videos(ws, prompt):
-    prompt_id = queue_prompt(prompt)['prompt_id']
-    output_videos = {}
-    while True:
-        out = ws.recv()
-        if isinstance(out, str):
-            message = json.loads(out)
-            if message['type'] == 'executing':
-                data = message['data']
-                if data['node'] is None and data['prompt_id'] == prompt_id:
-                    break
-        else:
-            continue
+def cancel_prompts(prompt_ids):
+    """ComfyUI에서 아직 끝나지 않은 prompt를 취소합니다. 대기 중이면 큐에서 지우고, 실행 중이면 중단합니다."""
+    base_url = f"http://{server_address}:{comfy_port}"
+
+    def post(path, body):
+        req = urllib.request.Request(f"{base_url}{path}", data=json.dumps(body).encode('utf-8'))
+        urllib.request.urlopen(req, timeout=10).read()
+
+    try:
+        with urllib.request.urlopen(f"{base_url}/queue", timeout=10) as response:
+            running = {item[1] for item in json.loads(response.read()).get("queue_running", [])}
+        post("/queue", {"delete": list(prompt_ids)})
+        for prompt_id in running.intersection(prompt_ids):
+            post("/interrupt", {"prompt_id": prompt_id})
+        logger.info(f"🛑 남은 prompt {len(prompt_ids)}개를 취소했습니다.")
+    except Exception as e:
+        logger.warning(f"남은 prompt 취소 실패: {e}")
+
+def get_system_stats():
+    url = f"http://{server_address}:{comfy_port}/system_stats"
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.loads(response.read())
+
+class PromptExecutionError(Exception):
+    """ComfyUI가 execution_error / execution_interrupted 이벤트를 보냈을 때 발생하는 예외"""
 
-    history = get_history(prompt_id)[prompt_id]
-    for node_id in history['outputs']:
-        node_output = history['outputs'][node_id]
+
+class PromptCompletionTracker:
+    """
+    ComfyUI 실행 이벤트를 소비하여 prompt의 진행 상황과 출력을 추적합니다.
+    출력 맵은 executed 이벤트의 payload로 바로 구성하므로 완료 후 history 조회가 필요 없습니다.
+    """
+
+    # progress_update 호출 최소 간격 (초)
+    PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', '1.0'))
+
+    def __init__(self, prompt_id, prompt, job=None, span_name="comfyui_prompt"):
+        self.prompt_id = prompt_id
+        self.prompt = prompt
+        self.job = job
+        self.outputs = {}
+        self.cached_nodes = set()
+        self.executed_nodes = set()
+        self.current_node = None
+        self.done = False
+        self._last_progress_update = 0.0
+        # 큐 대기 시간과 노드별 실행 시간을 현재 job 구간 아래에 기록합니다.
+        parent = current_span.get()
+        self.span = parent.add_child(span_name, prompt_id=prompt_id) if parent is not None else None
+        self._node_span = None
+        self._started = False
+
+    def handle(self, message):
+        """메시지 하나를 처리하고, prompt 실행이 끝났으면 True를 반환합니다."""
+        message_type = message.get('type')
+        data = message.get('data') or {}
+
+        if message_type == 'execution_start':
+            self._mark_started()
+        elif message_type == 'execution_cached':
+            self.cached_nodes.update(data.get('nodes') or [])
+            self._report(force=True)
+        elif message_type == 'executing':
+            node = data.get('node')
+            if node is None:
+                # 구버전 ComfyUI는 execution_success 대신 node=None인 executing으로 완료를 알립니다.
+                self.done = True
+            else:
+                if self.current_node is not None:
+                    self.executed_nodes.add(self.current_node)
+                self.current_node = node
+                self._start_node_span(node)
+                self._report(force=True)
+        elif message_type == 'progress':
+            if self._node_span is not None:
+                self._node_span.attrs["steps"] = data.get('max')
+            self._report(step=data.get('value'), max_steps=data.get('max'), node=data.get('node'))
+        elif message_type == 'executed':
+            node = data.get('node')
+            self.executed_nodes.add(node)
+            self.outputs[node] = data.get('output') or {}
+            if self._node_span is not None and self._node_span.attrs.get("node") == node:
+                self._finish_node_span()
+        elif message_type == 'execution_success':
+            self.done = True
+        elif message_type == 'execution_error':
+            node = data.get('node_id')
+            raise PromptExecutionError(
+                f"노드 {node} ({data.get('node_type')}) 실행 실패: "
+                f"{data.get('exception_type')}: {data.get('exception_message')}"
+            )
+        elif message_type == 'execution_interrupted':
+            raise PromptExecutionError(f"노드 {data.get('node_id')} 실행 중 중단되었습니다.")
+
+        if self.done:
+            self.finish()
+        return self.done
+
+    def finish(self):
+        """타이밍 구간을 닫습니다. 여러 번 호출해도 됩니다."""
+        if self.span is None:
+            return
+        self._finish_node_span()
+        self.span.attrs["cached_nodes"] = len(self.cached_nodes)
+        self.span.finish()
+
+    def _mark_started(self):
+        if self.span is not None and not self._started:
+            self._started = True
+            self.span.add_child("queue_wait", start=self.span.start).finish()
+
+    def _start_node_span(self, node):
+        if self.span is None:
+            return
+        self._mark_started()
+        self._finish_node_span()
+        class_type = self.prompt.get(node, {}).get('class_type', 'unknown')
+        self._node_span = self.span.add_child(f"{node}:{class_type}", node=node, class_type=class_type)
+
+    def _finish_node_span(self):
+        if self._node_span is not None:
+            self._node_span.finish()
+            self._node_span = None
+
+    def _report(self, step=None, max_steps=None, node=None, force=False):
+        if self.job is None:
+            return
+        now = time.time()
+        if not force and step != max_steps and now - self._last_progress_update < self.PROGRESS_UPDATE_INTERVAL:
+            return
+        self._last_progress_update = now
+
+        node = node or self.current_node
+        progress = {
+            "prompt_id": self.prompt_id,
+            "node": node,
+            "class_type": self.prompt.get(node, {}).get('class_type') if node else None,
+            "nodes_done": len(self.executed_nodes | self.cached_nodes),
+            "nodes_total": len(self.prompt),
+        }
+        if step is not None:
+            progress["step"] = step
+            progress["max_steps"] = max_steps
+        try:
+            runpod.serverless.progress_update(self.job, progress)
+        except Exception as e:
+            logger.warning(f"progress_update 전송 실패: {e}")
+
+
+def _handle_prompt_message(tracker, message):
+    """메시지 하나를 처리하고, 실행이 끝났으면 출력 맵을, 아니면 None을 반환합니다."""
+    if message['type'] == '_connection_lost':
+        raise Exception(f"ComfyUI 웹소켓 연결이 끊어졌습니다: {message['data']['error']}")
+    elif message['type'] == '_reconnected':
+        # 연결이 끊긴 동안 완료 메시지를 놓쳤을 수 있으므로 history로 확인합니다.
+        history = get_history(tracker.prompt_id)
+        if tracker.prompt_id in history:
+            return history[tracker.prompt_id]['outputs']
+    elif tracker.handle(message):
+        return tracker.outputs
+    return None
+
+
+def _collect_video_files(outputs):
+    output_videos = {}
+    for node_id in outputs:
+        node_output = outputs[node_id]
         videos_output = []
         if 'gifs' in node_output:
             for video in node_output['gifs']:
-                # fullpath를 이용하여 직접 파일을 읽고 base64로 인코딩
-                with open(video['fullpath'], 'rb') as f:
-                    video_data = base64.b64encode(f.read()).decode('utf-8')
-                videos_output.append(video_data)
+                # 파일 내용은 읽지 않고 경로만 넘깁니다. 인코딩/업로드는 deliver_output에서 수행합니다.
+                videos_output.append(video['fullpath'])
         output_videos[node_id] = videos_output
-
     return output_videos
 
-def load_workflow(workflow_path):
-    with open(workflow_path, 'r') as file:
-        return json.load(file)
 
+def submit_prompt(prompt, job=None, span_name="comfyui_prompt"):
+    """prompt를 ComfyUI 큐에 넣고, 완료를 기다릴 때 사용할 (tracker, 메시지 큐)를 반환합니다."""
+    prompt_id = queue_prompt(prompt)['prompt_id']
+    messages = comfy_connection.subscribe(prompt_id)
+    return PromptCompletionTracker(prompt_id, prompt, job, span_name), messages
 
-def process_input(input_data, temp_dir, output_filename, input_type):
-    """입력 데이터를 처리하여 파일 경로를 반환하는 함수"""
-    if input_type == "path":
-        # 경로인 경우 그대로 반환
-        logger.info(f"📁 경로 입력 처리: {input_data}")
-        return input_data
-    elif input_type == "url":
-        # URL인 경우 다운로드
-        logger.info(f"🌐 URL 입력 처리: {input_data}")
-        os.makedirs(temp_dir, exist_ok=True)
-        file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
-        return download_file_from_url(input_data, file_path)
-    elif input_type == "base64":
-        # Base64인 경우 디코딩하여 저장
-        logger.info(f"🔢 Base64 입력 처리")
-        return save_base64_to_file(input_data, temp_dir, output_filename)
-    else:
-        raise Exception(f"지원하지 않는 입력 타입: {input_type}")
 
-        
-def download_file_from_url(url, output_path):
-    """URL에서 파일을 다운로드하는 함수"""
+def wait_for_videos(tracker, messages):
+    """submit_prompt로 넣은 prompt의 실행이 끝날 때까지 기다리고 노드별 비디오 파일 경로를 반환합니다."""
     try:
-        # wget을 사용하여 파일 다운로드
-        result = subprocess.run([
-            'wget', '-O', output_path, '--no-verbose', url
-        ], capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            logger.info(f"✅ URL에서 파일을 성공적으로 다운로드했습니다: {url} -> {output_path}")
-            return output_path
-        else:
-            logger.error(f"❌ wget 다운로드 실패: {result.stderr}")
-            raise Exception(f"URL 다운로드 실패: {result.stderr}")
-    except subprocess.TimeoutExpired:
-        logger.error("❌ 다운로드 시간 초과")
-        raise Exception("다운로드 시간 초과")
-    except Exception as e:
-        logger.error(f"❌ 다운로드 중 오류 발생: {e}")
-        raise Exception(f"다운로드 중 오류 발생: {e}")
+        while True:
+            outputs = _handle_prompt_message(tracker, messages.get())
+            if outputs is not None:
+                break
+    finally:
+        tracker.finish()
+        comfy_connection.unsubscribe(tracker.prompt_id)
 
+    return _collect_video_files(outputs)
 
-def save_base64_to_file(base64_data, temp_dir, output_filename):
-    """Base64 데이터를 파일로 저장하는 함수"""
+
+def get_videos(prompt, job=None):
+    return wait_for_videos(*submit_prompt(prompt, job))
+
+
+async def get_videos_async(prompt, job=None):
+    """
+    get_videos의 asyncio 버전입니다. 공유 웹소켓 리더가 prompt_id별 큐로 이벤트를 넘겨주므로
+    여러 job이 동시에 ComfyUI 큐에 prompt를 넣고 각자의 완료만 기다릴 수 있습니다.
+    """
+    loop = asyncio.get_running_loop()
+    prompt_id = (await asyncio.to_thread(queue_prompt, prompt))['prompt_id']
+    messages = comfy_connection.subscribe(prompt_id, AsyncMessageQueue(loop))
+    tracker = PromptCompletionTracker(prompt_id, prompt, job)
     try:
-        # Base64 문자열 디코딩
-        decoded_data = base64.b64decode(base64_data)
-        
-        # 디렉토리가 존재하지 않으면 생성
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        # 파일로 저장
-        file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
-        with open(file_path, 'wb') as f:
-            f.write(decoded_data)
-        
-        logger.info(f"✅ Base64 입력을 '{file_path}' 파일로 저장했습니다.")
-        return file_path
-    except (binascii.Error, ValueError) as e:
-        logger.error(f"❌ Base64 디코딩 실패: {e}")
-        raise Exception(f"Base64 디코딩 실패: {e}")
+        while True:
+            message = await messages.get()
+            if message['type'] == '_reconnected':
+                outputs = await asyncio.to_thread(_handle_prompt_message, tracker, message)
+            else:
+                outputs = _handle_prompt_message(tracker, message)
+            if outputs is not None:
+                break
+    finally:
+        tracker.finish()
+        comfy_connection.unsubscribe(prompt_id)
 
-def handler(job):
-    job_input = job.get("input", {})
+    return _collect_video_files(outputs)
+
+
+def iter_base64_chunks(file_path, chunk_size=None):
+    """파일을 chunk_size 단위로 읽어 각각 독립적으로 디코딩 가능한 base64 문자열로 반환합니다."""
+    chunk_size = chunk_size or OUTPUT_CHUNK_BYTES
+    with open(file_path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk).decode('ascii')
 
-    logger.info(f"Received job input: {job_input}")
-    task_id = f"task_{uuid.uuid4()}"
 
+def output_mode_error(job_input):
+    """
+    요청된 출력 모드를 생성 전에 확인해, 지원하지 않으면 오류 메시지를 반환합니다.
+    stream은 generator 핸들러(OUTPUT_STREAMING=true)에서만 사용할 수 있습니다.
+    """
+    allowed = ("auto", "inline", "upload", "volume") + (("stream",) if OUTPUT_STREAMING else ())
+    output_mode = job_input.get("output_mode") or OUTPUT_MODE
+    if output_mode not in allowed:
+        return f"지원하지 않는 출력 모드: {output_mode!r} (사용 가능: {', '.join(allowed)})"
+    return None
 
-    image_path = None
-    # 이미지 입력 처리 (image_path, image_url, image_base64 중 하나만 사용)
-    if "image_path" in job_input:
-        image_path = process_input(job_input["image_path"], task_id, "input_image.jpg", "path")
-    elif "image_url" in job_input:
-        image_path = process_input(job_input["image_url"], task_id, "input_image.jpg", "url")
-    elif "image_base64" in job_input:
-        image_path = process_input(job_input["image_base64"], task_id, "input_image.jpg", "base64")
 
-    video_path = None
-    # 비디오 입력 처리 (video_path, video_url, video_base64 중 하나만 사용)
-    if "video_path" in job_input:
-        video_path = process_input(job_input["video_path"], task_id, "input_video.mp4", "path")
-    elif "video_url" in job_input:
-        video_path = process_input(job_input["video_url"], task_id, "input_video.mp4", "url")
-    elif "video_base64" in job_input:
-        video_path = process_input(job_input["video_base64"], task_id, "input_video.mp4", "base64")
+def resolve_output_mode(requested_mode, file_size):
+    """auto 모드일 때 파일 크기와 사용 가능한 저장소를 기준으로 실제 전달 방식을 결정합니다."""
+    if requested_mode != "auto":
+        return requested_mode
+    if file_size <= INLINE_OUTPUT_MAX_BYTES:
+        return "inline"
+    if os.getenv('BUCKET_ENDPOINT_URL'):
+        return "upload"
+    if os.path.isdir(NETWORK_VOLUME_PATH):
+        return "volume"
+    logger.warning(f"출력 파일이 인라인 한도({INLINE_OUTPUT_MAX_BYTES} bytes)를 넘지만 업로드 대상이 없어 인라인으로 반환합니다.")
+    return "inline"
 
-    check_coord = job_input.get("points_store", None)
 
+def deliver_output(video_file, job, output_mode=None):
+    """생성된 비디오를 요청된 방식(inline/upload/volume)으로 전달하고 응답 dict를 반환합니다."""
+    job_id = job.get("id", "local")
+    file_size = os.path.getsize(video_file)
+    mode = resolve_output_mode(output_mode or OUTPUT_MODE, file_size)
+    logger.info(f"📦 출력 전달: mode={mode}, size={file_size} bytes")
 
-    if check_coord == None:
-        if job_input.get("mode", "replace") == "animate":
-            prompt = load_workflow('/newWanAnimate_noSAM_animate_api.json')
-        else:
-            prompt = load_workflow('/newWanAnimate_noSAM_api.json')
-
-        prompt["57"]["inputs"]["image"] = image_path
-        prompt["63"]["inputs"]["video"] = video_path
-        prompt["63"]["inputs"]["force_rate"] = job_input["fps"]
-        prompt["30"]["inputs"]["frame_rate"] = job_input["fps"]
-        prompt["65"]["inputs"]["positive_prompt"] = job_input["prompt"]
-        if "negative_prompt" in job_input:
-            prompt["65"]["inputs"]["negative_prompt"] = job_input["negative_prompt"]
-        prompt["27"]["inputs"]["seed"] = job_input["seed"]
-        prompt["27"]["inputs"]["cfg"] = job_input["cfg"]
-        prompt["27"]["inputs"]["steps"] = job_input.get("steps", 4)
-        prompt["150"]["inputs"]["value"] = job_input["width"]
-        prompt["151"]["inputs"]["value"] = job_input["height"]
+    if mode == "inline":
+        return {"video": "".join(iter_base64_chunks(video_file))}
+    elif mode == "upload":
+        # BUCKET_ENDPOINT_URL / BUCKET_ACCESS_KEY_ID / BUCKET_SECRET_ACCESS_KEY 환경변수를 사용합니다.
+        file_name = os.path.basename(video_file)
+        video_url = rp_upload.upload_file_to_bucket(file_name, video_file, prefix=f"wananimate/{job_id}")
+        return {"video_url": video_url, "video_size": file_size}
+    elif mode == "volume":
+        s3_key = f"output/wananimate/{job_id}/{os.path.basename(video_file)}"
+        volume_path = os.path.join(NETWORK_VOLUME_PATH, s3_key)
+        os.makedirs(os.path.dirname(volume_path), exist_ok=True)
+        shutil.copyfile(video_file, volume_path)
+        return {"video_path": volume_path, "s3_key": s3_key, "video_size": file_size}
     else:
-        if job_input.get("mode", "replace") == "animate":
-            prompt = load_workflow('/newWanAnimate_point_animate_api.json')
-        else:
-            prompt = load_workflow('/newWanAnimate_point_api.json')
-        
-        prompt["57"]["inputs"]["image"] = image_path
-        prompt["63"]["inputs"]["video"] = video_path
-        prompt["63"]["inputs"]["force_rate"] = job_input["fps"]
-        prompt["30"]["inputs"]["frame_rate"] = job_input["fps"]
-        prompt["65"]["inputs"]["positive_prompt"] = job_input["prompt"]
-        if "negative_prompt" in job_input:
-            prompt["65"]["inputs"]["negative_prompt"] = job_input["negative_prompt"]
-        prompt["27"]["inputs"]["seed"] = job_input["seed"]
-        prompt["27"]["inputs"]["cfg"] = job_input["cfg"]
-        prompt["27"]["inputs"]["steps"] = job_input.get("steps", 4)
-        prompt["150"]["inputs"]["value"] = job_input["width"]
-        prompt["151"]["inputs"]["value"] = job_input["height"]
-
-        prompt["107"]["inputs"]["points_store"] = job_input["points_store"]
-        prompt["107"]["inputs"]["coordinates"] = job_input["coordinates"]
-        prompt["107"]["inputs"]["neg_coordinates"] = job_input["neg_coordinates"]
-        # prompt["107"]["inputs"]["width"] = job_input["width"]
-        # prompt["107"]["inputs"]["height"] = job_input["height"]
-    
+        # job 시작 시 output_mode_error로 확인하므로 여기에 오지 않습니다.
+        return {"error": f"지원하지 않는 출력 모드: {mode}"}
 
-    ws_url = f"ws://{server_address}:8188/ws?clientId={client_id}"
-    logger.info(f"Connecting to WebSocket: {ws_url}")
-    
-    # 먼저 HTTP 연결이 가능한지 확인
-    http_url = f"http://{server_address}:8188/"
-    logger.info(f"Checking HTTP connection to: {http_url}")
-    
-    # HTTP 연결 확인 (최대 1분)
-    max_http_attempts = 180
-    for http_attempt in range(max_http_attempts):
-        try:
-            import urllib.request
-            response = urllib.request.urlopen(http_url, timeout=5)
-            logger.info(f"HTTP 연결 성공 (시도 {http_attempt+1})")
-            break
-        except Exception as e:
-            logger.warning(f"HTTP 연결 실패 (시도 {http_attempt+1}/{max_http_attempts}): {e}")
-            if http_attempt == max_http_attempts - 1:
-                raise Exception("ComfyUI 서버에 연결할 수 없습니다. 서버가 실행 중인지 확인하세요.")
-            time.sleep(1)
-    
-    ws = websocket.WebSocket()
-    # 웹소켓 연결 시도 (최대 3분)
-    max_attempts = int(180/5)  # 3분 (1초에 한 번씩 시도)
-    for attempt in range(max_attempts):
-        import time
+
+def stream_output(video_file):
+    """
+    generator 핸들러용 출력 스트림입니다.
+    첫 항목은 메타데이터, 이후 항목은 순서대로 이어 붙이면 되는 base64 청크입니다.
+    """
+    file_size = os.path.getsize(video_file)
+    total_chunks = (file_size + OUTPUT_CHUNK_BYTES - 1) // OUTPUT_CHUNK_BYTES
+    yield {"video_stream": {"size": file_size, "chunks": total_chunks, "encoding": "base64"}}
+    for index, chunk in enumerate(iter_base64_chunks(video_file)):
+        yield {"video_chunk": chunk, "index": index}
+
+def load_workflow(workflow_path):
+    with open(workflow_path, 'r') as file:
+        return json.load(file)
+
+
+class WorkflowBindingError(ValueError):
+    """job 입력이 워크플로우 바인딩 규칙(필수값, 타입, 범위)을 만족하지 않을 때 발생하는 예외"""
+
+
+def set_prompt_input(prompt, template_nodes, node_id, input_name, value):
+    """
+    prompt의 노드 입력값을 바꿉니다. 템플릿과 공유 중인 노드는 처음 바꿀 때만 복사합니다(copy-on-write).
+    렌더링된 prompt를 수정할 때는 템플릿이 오염되지 않도록 항상 이 함수를 사용해야 합니다.
+    """
+    node = prompt[node_id]
+    if node is template_nodes.get(node_id):
+        node = dict(node, inputs=dict(node["inputs"]))
+        prompt[node_id] = node
+    node["inputs"][input_name] = value
+
+
+# job 필드 → 워크플로우 노드 입력 바인딩
+# targets: 값을 넣을 (노드 ID, 입력 이름) 목록
+# type: 변환할 타입, required: 필수 여부, default: 생략 시 값 (없으면 템플릿 값 유지), min: 최솟값
+COMMON_BINDINGS = {
+    "image_path": {"targets": [("57", "image")], "type": str, "required": True},
+    "video_path": {"targets": [("63", "video")], "type": str, "required": True},
+    "fps": {"targets": [("63", "force_rate"), ("30", "frame_rate")], "type": int, "required": True, "min": 1},
+    "prompt": {"targets": [("65", "positive_prompt")], "type": str, "required": True},
+    "negative_prompt": {"targets": [("65", "negative_prompt")], "type": str},
+    "seed": {"targets": [("27", "seed")], "type": int, "required": True, "min": 0},
+    "cfg": {"targets": [("27", "cfg")], "type": float, "required": True, "min": 0},
+    "steps": {"targets": [("27", "steps")], "type": int, "default": 4, "min": 1},
+    "width": {"targets": [("150", "value")], "type": int, "required": True, "min": 16},
+    "height": {"targets": [("151", "value")], "type": int, "required": True, "min": 16},
+}
+
+POINT_BINDINGS = dict(COMMON_BINDINGS, **{
+    "points_store": {"targets": [("107", "points_store")], "type": str, "required": True},
+    "coordinates": {"targets": [("107", "coordinates")], "type": str, "required": True},
+    "neg_coordinates": {"targets": [("107", "neg_coordinates")], "type": str, "required": True},
+})
+
+# 워크플로우 변형 목록. 새 변형은 여기에 항목 하나만 추가하면 됩니다.
+# key: (mode, 제어점 사용 여부)
+WORKFLOW_VARIANTS = {
+    ("replace", False): {"file": "newWanAnimate_noSAM_api.json", "bindings": COMMON_BINDINGS},
+    ("animate", False): {"file": "newWanAnimate_noSAM_animate_api.json", "bindings": COMMON_BINDINGS},
+    ("replace", True): {"file": "newWanAnimate_point_api.json", "bindings": POINT_BINDINGS},
+    ("animate", True): {"file": "newWanAnimate_point_animate_api.json", "bindings": POINT_BINDINGS},
+}
+
+
+def bind_values(bindings, values):
+    """job 입력값을 바인딩 규칙으로 검증/변환하여 {필드: 값}을 반환합니다."""
+    bound = {}
+    for field, binding in bindings.items():
+        value = values.get(field)
+        if value is None:
+            if binding.get("required"):
+                raise WorkflowBindingError(f"필수 입력값이 없습니다: {field}")
+            if "default" not in binding:
+                continue
+            value = binding["default"]
         try:
-            ws.connect(ws_url)
-            logger.info(f"웹소켓 연결 성공 (시도 {attempt+1})")
-            break
-        except Exception as e:
-            logger.warning(f"웹소켓 연결 실패 (시도 {attempt+1}/{max_attempts}): {e}")
-            if attempt == max_attempts - 1:
-                raise Exception("웹소켓 연결 시간 초과 (3분)")
-            time.sleep(5)
-    videos = get_videos(ws, prompt)
-    ws.close()
+            value = binding["type"](value)
+        except (TypeError, ValueError):
+            raise WorkflowBindingError(f"'{field}' 값의 타입이 올바르지 않습니다: {value!r}")
+        if "min" in binding and value < binding["min"]:
+            raise WorkflowBindingError(f"'{field}' 값은 {binding['min']} 이상이어야 합니다: {value}")
+        bound[field] = value
+    return bound
+
+
+class WorkflowTemplate:
+    """
+    한 번만 파싱해 두고 job마다 바인딩 값만 채워 prompt를 만드는 워크플로우 템플릿입니다.
+    render()는 최상위 dict만 복사하고, 값이 바뀌는 노드만 복사하므로 job당 비용이 거의 없습니다.
+    """
+
+    def __init__(self, name, path, bindings):
+        self.name = name
+        self.nodes = load_workflow(path)
+        self.bindings = bindings
+        # 바인딩 대상 노드가 템플릿에 모두 있는지 시작 시점에 확인합니다.
+        for field, binding in bindings.items():
+            for node_id, input_name in binding["targets"]:
+                if node_id not in self.nodes:
+                    raise WorkflowBindingError(f"{name}: '{field}' 바인딩 대상 노드 {node_id}가 없습니다.")
+
+    def bind(self, values):
+        """job 입력값을 바인딩 규칙으로 검증/변환하여 {필드: 값}을 반환합니다."""
+        return bind_values(self.bindings, values)
+
+    def render(self, values):
+        """검증된 값으로 새 prompt를 만듭니다. 템플릿 자체는 변경되지 않습니다."""
+        prompt = dict(self.nodes)
+        for field, value in self.bind(values).items():
+            for node_id, input_name in self.bindings[field]["targets"]:
+                set_prompt_input(prompt, self.nodes, node_id, input_name, value)
+        return prompt
+
+
+class WorkflowRegistry:
+    """워커 시작 시 모든 워크플로우 변형을 한 번씩 읽어 두는 템플릿 레지스트리"""
+
+    def __init__(self, workflow_dir, variants):
+        self.templates = {
+            key: WorkflowTemplate(variant["file"], os.path.join(workflow_dir, variant["file"]), variant["bindings"])
+            for key, variant in variants.items()
+        }
+
+    def select(self, job_input):
+        key = (job_input.get("mode", "replace"), job_input.get("points_store") is not None)
+        if key not in self.templates:
+            raise WorkflowBindingError(f"지원하지 않는 워크플로우 변형: mode={key[0]}")
+        return self.templates[key]
+
+
+workflow_registry = WorkflowRegistry(WORKFLOW_DIR, WORKFLOW_VARIANTS)
+
+
+def sha256_file(file_path, chunk_size=1024 * 1024):
+    """파일의 SHA-256 해시를 스트리밍으로 계산합니다."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """src를 dst로 하드링크하고, 불가능하면(다른 파일시스템 등) 복사합니다."""
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class InputCache:
+    """
+    URL/Base64 입력 파일을 job 사이에서 재사용하는 콘텐츠 주소 기반 디스크 캐시입니다.
+
+    - objects/<sha256><ext>: 실제 파일 (내용 해시로 중복 제거)
+    - urls/<sha256(url)>.json: URL → ETag/Last-Modified, 내용 해시
+    - b64/<sha256(base64)>.json: Base64 문자열 → 내용 해시
+
+    모든 쓰기는 임시 파일 + os.replace로 원자적으로 수행되므로 여러 job이 동시에 사용해도 안전하고,
+    전체 크기가 max_bytes를 넘으면 가장 오래 사용되지 않은 파일부터 삭제합니다.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "evictions": 0}
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def fetch_url(self, url, dest_path, download):
+        """URL 입력을 캐시에서 찾아 dest_path에 연결하고, 없으면 download(url, path)로 받아 캐시에 저장합니다."""
+        ext = os.path.splitext(dest_path)[1]
+        index_key = ('urls', hashlib.sha256(url.encode('utf-8')).hexdigest())
+        validators = self._url_validators(url)
+
+        entry = self._read_index(*index_key)
+        if validators and entry and entry.get('validators') == validators:
+            if self._link_object(entry['sha256'], ext, dest_path):
+                return dest_path
+
+        self._record_miss()
+        download(url, dest_path)
+        content_hash = self._store(dest_path, ext)
+        if validators:
+            self._write_index(*index_key, {"url": url, "validators": validators, "sha256": content_hash})
+        return dest_path
+
+    def fetch_base64(self, base64_data, dest_path, decode):
+        """Base64 입력을 캐시에서 찾아 dest_path에 연결하고, 없으면 decode(data, path)로 저장한 뒤 캐시에 넣습니다."""
+        ext = os.path.splitext(dest_path)[1]
+        digest = hashlib.sha256()
+        for offset in range(0, len(base64_data), BASE64_DECODE_CHUNK_CHARS):
+            digest.update(base64_data[offset:offset + BASE64_DECODE_CHUNK_CHARS].encode('ascii', 'ignore'))
+        index_key = ('b64', digest.hexdigest())
+
+        entry = self._read_index(*index_key)
+        if entry and self._link_object(entry['sha256'], ext, dest_path):
+            return dest_path
+
+        self._record_miss()
+        decode(base64_data, dest_path)
+        content_hash = self._store(dest_path, ext)
+        self._write_index(*index_key, {"sha256": content_hash})
+        return dest_path
+
+    def _url_validators(self, url):
+        # HEAD를 거부하는 서버(S3 presigned GET URL 등)는 1바이트 Range GET으로 헤더만 확인합니다.
+        for method, headers in (('HEAD', {}), ('GET', {'Range': 'bytes=0-0'})):
+            try:
+                req = urllib.request.Request(url, method=method, headers=headers)
+                with urllib.request.urlopen(req, timeout=10) as response:
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+                    if etag or last_modified:
+                        return {"etag": etag, "last_modified": last_modified}
+                    return None
+            except Exception as e:
+                logger.debug(f"캐시 검증 헤더 조회 실패 ({method}): {e}")
+        return None
+
+    def _object_path(self, content_hash, ext):
+        return os.path.join(self.cache_dir, 'objects', f"{content_hash}{ext}")
+
+    def _link_object(self, content_hash, ext, dest_path):
+        object_path = self._object_path(content_hash, ext)
+        try:
+            link_or_copy(object_path, dest_path)
+            # LRU 판단을 위해 사용 시각을 갱신합니다.
+            os.utime(object_path)
+        except FileNotFoundError:
+            return False
+        size = os.path.getsize(dest_path)
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["bytes_saved"] += size
+        logger.info(f"♻️ 입력 캐시 적중: {object_path} ({size} bytes)")
+        return True
+
+    def _record_miss(self):
+        with self._lock:
+            self._stats["misses"] += 1
+
+    def _store(self, file_path, ext):
+        content_hash = sha256_file(file_path)
+        object_path = self._object_path(content_hash, ext)
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        if not os.path.exists(object_path):
+            tmp_path = f"{object_path}.{uuid.uuid4().hex}.tmp"
+            link_or_copy(file_path, tmp_path)
+            os.replace(tmp_path, object_path)
+            self._evict()
+        return content_hash
+
+    def _read_index(self, kind, key):
+        try:
+            with open(os.path.join(self.cache_dir, kind, f"{key}.json"), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_index(self, kind, key, entry):
+        index_path = os.path.join(self.cache_dir, kind, f"{key}.json")
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp_path = f"{index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, index_path)
+
+    def _evict(self):
+        objects_dir = os.path.join(self.cache_dir, 'objects')
+        entries = []
+        for entry in os.scandir(objects_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self._lock:
+                self._stats["evictions"] += 1
+            logger.info(f"🧹 입력 캐시 정리: {path} ({size} bytes)")
+
+
+input_cache = InputCache(os.path.join(CACHE_ROOT, 'inputs'), INPUT_CACHE_MAX_BYTES) if INPUT_CACHE_ENABLED else None
+
+
+def prompt_fingerprint(prompt, job_input):
+    """
+    렌더링된 prompt로 요청 지문을 계산합니다.
+    입력 파일 경로는 job마다 달라지므로 파일 내용 해시로 바꾼 뒤 정규화된 JSON을 해시합니다.
+    """
+    canonical = dict(prompt)
+    for field in ("image_path", "video_path"):
+        for node_id, input_name in COMMON_BINDINGS[field]["targets"]:
+            file_path = canonical.get(node_id, {}).get("inputs", {}).get(input_name)
+            if isinstance(file_path, str) and os.path.isfile(file_path):
+                set_prompt_input(canonical, prompt, node_id, input_name, f"sha256:{sha256_file(file_path)}")
+    payload = {
+        "prompt": canonical,
+        "segment_frames": job_input.get("segment_frames"),
+        "segment_overlap": job_input.get("segment_overlap"),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    요청 지문(fingerprint)별로 완료된 결과 비디오를 저장하는 디스크 캐시입니다.
+
+    - objects/<fingerprint><ext>: 결과 비디오
+    - objects/<fingerprint>.json: 생성 시각, 크기, 부가 결과 정보(구간 정보 등)
+    - locks/<fingerprint>.lock: 같은 요청이 실행 중임을 표시 (다른 워커와도 공유)
+
+    같은 지문의 요청이 실행 중이면 새로 실행하지 않고 그 결과를 기다립니다.
+    TTL이 지난 결과는 삭제하고, 전체 크기가 max_bytes를 넘으면 가장 오래 사용되지 않은 결과부터 삭제합니다.
+    """
+
+    def __init__(self, cache_dir, max_bytes, ttl, lock_timeout, poll_interval=2.0):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def get_or_run(self, fingerprint, run):
+        """
+        fingerprint의 결과가 있으면 바로 반환하고, 없으면 run()을 실행해 결과를 저장합니다.
+        run()은 {"video_file": 경로, ...} 또는 {"error": 메시지}를 반환해야 합니다.
+        """
+        waited = False
+        while True:
+            cached = self.lookup(fingerprint)
+            if cached is not None:
+                if waited:
+                    self._count("coalesced")
+                return cached
+            if self._acquire(fingerprint):
+                break
+            if not waited:
+                logger.info(f"⏳ 같은 요청이 실행 중이어서 결과를 기다립니다: {fingerprint[:16]}")
+                waited = True
+            with timed("result_cache_wait"):
+                self._wait_for_release(fingerprint)
+
+        try:
+            # lock을 얻는 사이에 먼저 실행한 job이 결과를 저장했을 수 있습니다.
+            cached = self.lookup(fingerprint)
+            if cached is not None:
+                return cached
+            self._count("misses")
+            result = run()
+            if "video_file" in result:
+                self.store(fingerprint, result)
+            return dict(result, request_fingerprint=fingerprint, cache_hit=False)
+        finally:
+            self._release(fingerprint)
+
+    def coalesce(self, key, run):
+        """
+        같은 key로 실행 중인 job이 있으면 끝날 때까지 기다린 뒤 run()을 실행합니다.
+        클라이언트가 보낸 요청 지문처럼 검증할 수 없는 키에 쓰므로 결과를 조회하거나 저장하지 않습니다.
+        """
+        lock_key = f"request-{key}"
+        waited = False
+        while not self._acquire(lock_key):
+            if not waited:
+                logger.info(f"⏳ 같은 요청이 실행 중이어서 끝날 때까지 기다립니다: {key[:16]}")
+                waited = True
+            with timed("result_cache_wait"):
+                self._wait_for_release(lock_key)
+        try:
+            return run()
+        finally:
+            self._release(lock_key)
+
+    def lookup(self, fingerprint):
+        meta_path = self._meta_path(fingerprint)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        video_path = os.path.join(self.cache_dir, 'objects', meta["file"])
+        if time.time() - meta["created_at"] > self.ttl or not os.path.exists(video_path):
+            self._remove(meta_path, video_path)
+            return None
+        # LRU 판단을 위해 사용 시각을 갱신합니다.
+        os.utime(video_path)
+        self._count("hits")
+        logger.info(f"♻️ 결과 캐시 적중: {fingerprint[:16]} ({meta['size']} bytes)")
+        return dict(meta["extra"], video_file=video_path, request_fingerprint=fingerprint, cache_hit=True)
+
+    def store(self, fingerprint, result):
+        video_file = result["video_file"]
+        file_name = f"{fingerprint}{os.path.splitext(video_file)[1]}"
+        video_path = os.path.join(self.cache_dir, 'objects', file_name)
+        os.makedirs(os.path.dirname(video_path), exist_ok=True)
+        tmp_path = f"{video_path}.{uuid.uuid4().hex}.tmp"
+        link_or_copy(video_file, tmp_path)
+        os.replace(tmp_path, video_path)
+
+        meta = {
+            "file": file_name,
+            "created_at": time.time(),
+            "size": os.path.getsize(video_path),
+            "extra": {key: value for key, value in result.items() if key != "video_file"},
+        }
+        meta_path = self._meta_path(fingerprint)
+        tmp_path = f"{meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        logger.info(f"💾 결과 캐시 저장: {fingerprint[:16]} ({meta['size']} bytes)")
+        self._evict()
+
+    def _meta_path(self, fingerprint):
+        return os.path.join(self.cache_dir, 'objects', f"{fingerprint}.json")
+
+    def _lock_path(self, fingerprint):
+        return os.path.join(self.cache_dir, 'locks', f"{fingerprint}.lock")
+
+    def _acquire(self, fingerprint):
+        lock_path = self._lock_path(fingerprint)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"worker": client_id, "started_at": time.time()}, f)
+        return True
+
+    def _release(self, fingerprint):
+        try:
+            os.remove(self._lock_path(fingerprint))
+        except FileNotFoundError:
+            pass
+
+    def _wait_for_release(self, fingerprint):
+        lock_path = self._lock_path(fingerprint)
+        while True:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > self.lock_timeout:
+                    logger.warning(f"오래된 실행 표시를 무시합니다: {lock_path}")
+                    self._release(fingerprint)
+                    return
+            except FileNotFoundError:
+                return
+            time.sleep(self.poll_interval)
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _remove(self, *paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        objects_dir = os.path.join(self.cache_dir, 'objects')
+        now = time.time()
+        entries = []
+        for entry in os.scandir(objects_dir):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'r') as f:
+                    meta = json.load(f)
+                video_path = os.path.join(objects_dir, meta["file"])
+                last_used = os.path.getmtime(video_path)
+            except (OSError, ValueError, KeyError):
+                continue
+            if now - meta["created_at"] > self.ttl:
+                self._remove(entry.path, video_path)
+                self._count("evictions")
+                continue
+            entries.append((last_used, meta["size"], entry.path, video_path))
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, meta_path, video_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(meta_path, video_path)
+            total -= size
+            self._count("evictions")
+            logger.info(f"🧹 결과 캐시 정리: {video_path} ({size} bytes)")
+
+
+result_cache = ResultCache(
+    os.path.join(CACHE_ROOT, 'results'), RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, RESULT_CACHE_LOCK_TIMEOUT
+) if RESULT_CACHE_ENABLED else None
+
+
+def compile_shape(prompt):
+    """torch.compile(dynamic=False)이 그래프를 새로 컴파일하는 기준인 "너비x높이x프레임 창 크기"를 반환합니다."""
+    width = prompt.get("150", {}).get("inputs", {}).get("value")
+    height = prompt.get("151", {}).get("inputs", {}).get("value")
+    window = prompt.get("198", {}).get("inputs", {}).get("frame_window_size")
+    return f"{width}x{height}x{window}"
+
+
+class CompileCacheMonitor:
+    """
+    영구 torch.compile 캐시(inductor FX 그래프 + Triton 커널)의 적중 여부를 job별로 기록합니다.
+    컴파일은 ComfyUI 프로세스에서 일어나므로, 실행 중에 캐시 디렉토리에 새 항목이 생겼으면 컴파일(miss),
+    아니면 저장된 결과를 재사용(hit)한 것으로 판단합니다. 여러 job이 동시에 실행되면 근사치입니다.
+    한 번이라도 실행된 형태는 shapes.json에 기록해 예열 때 다시 컴파일하지 않습니다.
+    """
+
+    def __init__(self, key, inductor_dir, triton_dir):
+        self.key = key
+        self.inductor_dir = inductor_dir
+        self.triton_dir = triton_dir
+        self.manifest_path = os.path.join(os.path.dirname(inductor_dir.rstrip('/')), 'shapes.json')
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "new_entries": 0}
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    @staticmethod
+    def _count_dirs(path, depth):
+        try:
+            entries = [entry for entry in os.scandir(path) if entry.is_dir()]
+        except FileNotFoundError:
+            return 0
+        if depth == 1:
+            return len(entries)
+        return sum(CompileCacheMonitor._count_dirs(entry.path, depth - 1) for entry in entries)
+
+    def count_entries(self):
+        # inductor: fxgraph/<접두사>/<키>/, Triton: <해시>/
+        fxgraph = self._count_dirs(os.path.join(self.inductor_dir, 'fxgraph'), 2)
+        return fxgraph + (self._count_dirs(self.triton_dir, 1) if self.triton_dir else 0)
+
+    def known_shapes(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @contextlib.contextmanager
+    def track(self, prompt):
+        """with 블록(prompt 실행)이 성공하면 적중 여부를 현재 구간에 기록합니다."""
+        shape = compile_shape(prompt)
+        span = current_span.get()
+        before = self.count_entries()
+        yield
+        new_entries = max(0, self.count_entries() - before)
+        result = "miss" if new_entries else "hit"
+        with self._lock:
+            self._stats["misses" if new_entries else "hits"] += 1
+            self._stats["new_entries"] += new_entries
+            shapes = self.known_shapes()
+            shapes.setdefault(shape, {"first_seen": time.time()})["last_result"] = result
+            try:
+                os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+                tmp_path = f"{self.manifest_path}.{uuid.uuid4().hex}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(shapes, f)
+                os.replace(tmp_path, self.manifest_path)
+            except OSError as e:
+                logger.warning(f"컴파일 캐시 형태 목록 기록 실패: {e}")
+        if span is not None:
+            span.attrs["compile_cache"] = {"result": result, "shape": shape, "new_entries": new_entries}
+        logger.info(f"🧩 컴파일 캐시 {result}: {shape} (새 항목 {new_entries}개, 키 {self.key})")
+
+
+compile_cache = CompileCacheMonitor(
+    COMPILE_CACHE_KEY, TORCHINDUCTOR_CACHE_DIR, TRITON_CACHE_DIR
+) if COMPILE_CACHE_KEY and TORCHINDUCTOR_CACHE_DIR else None
+
+
+def track_compile_cache(prompt):
+    return compile_cache.track(prompt) if compile_cache is not None else contextlib.nullcontext()
+
+
+class VramTuner:
+    """
+    GPU의 여유 VRAM과 요청 크기에 맞춰 블록 스왑 수(196), 프레임 창 크기(198), VAE 타일링(28, 198)을 정합니다.
+
+    - 블록 스왑은 여유 VRAM(에서 VRAM_HEADROOM을 뺀 값)에 들어갈 만큼만 하고, 모든 블록을 스왑해도 부족하면 프레임 창을 줄입니다.
+    - <table_dir>/<GPU>.json: 형태(너비x높이x창 프레임 수)별 보정표. job마다 측정한 최대 사용량을
+      스왑 0 기준으로 환산해 기록하고, 측정값이 있는 형태는 메모리 모델 대신 이 값으로 계획합니다.
+      OOM이 난 형태는 다음부터 VRAM_OOM_BLOCK_STEP만큼 더 스왑합니다.
+
+    여유 VRAM과 사용량은 ComfyUI의 /system_stats로 확인합니다. 다른 job과 실행이 겹친 측정은 보정표에 반영하지 않습니다.
+    """
+
+    def __init__(self, table_dir):
+        self.table_dir = table_dir
+        self._lock = threading.Lock()
+        self._active = []
+        self._idle_device = None
+        self._stats = {"plans": 0, "measurements": 0, "oom": 0, "last_peak_bytes": 0, "last_blocks_to_swap": 0}
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _device(self):
+        """ComfyUI가 사용하는 GPU 정보. 이 워커의 다른 job이 실행 중이면 마지막으로 쉬고 있을 때의 값을 사용합니다."""
+        with self._lock:
+            if self._active and self._idle_device is not None:
+                return self._idle_device
+        device = next(device for device in get_system_stats()["devices"] if device.get("type") == "cuda")
+        with self._lock:
+            if not self._active:
+                self._idle_device = device
+        return device
+
+    @staticmethod
+    def _gpu_key(device):
+        name = "".join(c if c.isalnum() or c in "._-" else "_" for c in device.get("name", "gpu"))
+        return f"{name}-{round(device['vram_total'] / 1024 ** 3)}gb"
+
+    def _table_path(self, gpu):
+        return os.path.join(self.table_dir, f"{gpu}.json")
+
+    def _read_table(self, gpu):
+        try:
+            with open(self._table_path(gpu), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"shapes": {}}
+
+    def _write_table(self, gpu, table):
+        os.makedirs(self.table_dir, exist_ok=True)
+        tmp_path = f"{self._table_path(gpu)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(table, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self._table_path(gpu))
+
+    @staticmethod
+    def peak_estimate(width, height, window_frames):
+        """블록 스왑 없이 실행할 때의 최대 사용량 추정값 (메모리 모델)"""
+        tokens = math.ceil(width / 16) * math.ceil(height / 16) * ((window_frames - 1) // 4 + 1)
+        return VRAM_BASE_BYTES + VRAM_MODEL_BLOCKS * VRAM_BLOCK_BYTES + tokens * VRAM_TOKEN_BYTES
+
+    def plan(self, prompt):
+        """설정을 적용한 새 prompt와 선택 정보를 반환합니다. 원래 prompt는 변경하지 않습니다."""
+        if not all(node_id in prompt for node_id in ("150", "151", "196", "198", "28")):
+            return prompt, None
+        try:
+            device = self._device()
+        except (OSError, ValueError, KeyError, StopIteration) as e:
+            logger.warning(f"GPU 정보를 확인할 수 없어 VRAM 자동 설정을 건너뜁니다: {e}")
+            return prompt, None
+
+        gpu = self._gpu_key(device)
+        table = self._read_table(gpu)["shapes"]
+        budget = device["vram_free"] * (1 - VRAM_HEADROOM)
+        width, height = prompt["150"]["inputs"]["value"], prompt["151"]["inputs"]["value"]
+        # 프레임 수는 frame_load_cap(형태 버킷, 구간 분할)이 있을 때만 알 수 있으므로 없으면 창을 가득 채운다고 봅니다.
+        frames = prompt["63"]["inputs"].get("frame_load_cap") or 0
+        template_window = prompt["198"]["inputs"]["frame_window_size"]
+        windows = [window for window in VRAM_WINDOW_SIZES if window <= template_window] or [template_window]
+
+        for window in windows:
+            window_frames = min(window, frames) if frames else window
+            shape = f"{width}x{height}x{window_frames}"
+            entry = table.get(shape, {})
+            peak = entry.get("peak_bytes") or self.peak_estimate(width, height, window_frames)
+            blocks = max(math.ceil((peak - budget) / VRAM_BLOCK_BYTES), entry.get("min_blocks_to_swap", 0), 0)
+            if blocks <= VRAM_MODEL_BLOCKS:
+                break
+        else:
+            blocks = VRAM_MODEL_BLOCKS
+            logger.warning(f"모든 블록을 스왑하고 프레임 창을 {window}로 줄여도 VRAM이 부족할 수 있습니다: {shape}")
+        # 디코딩은 샘플러가 모델을 내린(force_offload) 뒤에 실행됩니다.
+        vae_tiling = VRAM_BASE_BYTES + width * height * VRAM_VAE_BYTES_PER_PIXEL > budget
+
+        tuned = dict(prompt)
+        set_prompt_input(tuned, prompt, "196", "blocks_to_swap", blocks)
+        set_prompt_input(tuned, prompt, "198", "frame_window_size", window)
+        set_prompt_input(tuned, prompt, "198", "tiled_vae", vae_tiling)
+        set_prompt_input(tuned, prompt, "28", "enable_vae_tiling", vae_tiling)
+
+        info = {
+            "gpu": gpu,
+            "total_bytes": device["vram_total"],
+            "free_bytes": device["vram_free"],
+            "shape": shape,
+            "source": "measured" if "peak_bytes" in entry else "model",
+            "blocks_to_swap": blocks,
+            "frame_window_size": window,
+            "vae_tiling": vae_tiling,
+            "estimate_bytes": peak - blocks * VRAM_BLOCK_BYTES,
+        }
+        with self._lock:
+            self._stats["plans"] += 1
+            self._stats["last_blocks_to_swap"] = blocks
+        span = current_span.get()
+        if span is not None:
+            span.attrs["vram_tuning"] = info
+        logger.info(
+            f"🎛️ VRAM 설정: 블록 스왑 {blocks}, 프레임 창 {window}, VAE 타일링 {vae_tiling} "
+            f"({shape}, 여유 {device['vram_free'] / 1024 ** 3:.1f}GB, 예상 {info['estimate_bytes'] / 1024 ** 3:.1f}GB, {info['source']})"
+        )
+        return tuned, info
+
+    def _sample(self, entry, stop):
+        while not stop.is_set():
+            try:
+                device = next(device for device in get_system_stats()["devices"] if device.get("type") == "cuda")
+                entry["peak_used"] = max(entry["peak_used"], device["vram_total"] - device["vram_free"])
+            except (OSError, ValueError, KeyError, StopIteration):
+                pass
+            stop.wait(VRAM_SAMPLE_INTERVAL)
+
+    @contextlib.contextmanager
+    def track(self, info):
+        """with 블록(prompt 실행) 동안 최대 VRAM 사용량을 측정해 info와 보정표에 기록합니다."""
+        entry = {"peak_used": 0, "overlapped": False}
+        with self._lock:
+            for other in self._active:
+                other["overlapped"] = True
+            entry["overlapped"] = bool(self._active)
+            self._active.append(entry)
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(entry, stop), daemon=True)
+        sampler.start()
+        oom = False
+        try:
+            yield
+        except PromptExecutionError as e:
+            oom = "out of memory" in str(e).lower() or "outofmemory" in str(e).lower()
+            raise
+        finally:
+            stop.set()
+            sampler.join()
+            with self._lock:
+                self._active.remove(entry)
+            self._record(info, entry, oom)
+
+    def _record(self, info, entry, oom):
+        # 계획할 때 이미 사용 중이던 양(CUDA 컨텍스트 등)은 여유 VRAM에 반영되어 있으므로 뺍니다.
+        peak = max(0, entry["peak_used"] - (info["total_bytes"] - info["free_bytes"]))
+        info["peak_bytes"] = peak
+        info["recorded"] = oom or (peak > 0 and not entry["overlapped"])
+        with self._lock:
+            self._stats["last_peak_bytes"] = peak
+            if oom:
+                self._stats["oom"] += 1
+            elif info["recorded"]:
+                self._stats["measurements"] += 1
+            if info["recorded"]:
+                table = self._read_table(info["gpu"])
+                shape = table["shapes"].setdefault(info["shape"], {})
+                if oom:
+                    shape["min_blocks_to_swap"] = min(VRAM_MODEL_BLOCKS, info["blocks_to_swap"] + VRAM_OOM_BLOCK_STEP)
+                else:
+                    # 스왑한 블록이 VRAM에 있었을 때의 최대 사용량으로 환산합니다.
+                    resident_peak = peak + info["blocks_to_swap"] * VRAM_BLOCK_BYTES
+                    shape["peak_bytes"] = max(shape.get("peak_bytes", 0), resident_peak)
+                    shape["jobs"] = shape.get("jobs", 0) + 1
+                shape["updated"] = time.time()
+                try:
+                    self._write_table(info["gpu"], table)
+                except OSError as e:
+                    logger.warning(f"VRAM 보정표 기록 실패: {e}")
+        if oom:
+            logger.warning(f"🎛️ VRAM 부족: {info['shape']}은 다음부터 블록을 {VRAM_OOM_BLOCK_STEP}개 더 스왑합니다.")
+        else:
+            logger.info(
+                f"🎛️ 최대 VRAM 사용량: {peak / 1024 ** 3:.1f}GB (예상 {info['estimate_bytes'] / 1024 ** 3:.1f}GB"
+                + (", 다른 job과 겹쳐 보정표에 반영하지 않음)" if entry["overlapped"] else ")")
+            )
+
+
+vram_tuner = VramTuner(os.path.join(CACHE_ROOT, 'vram')) if VRAM_TUNING else None
+
+
+def use_vram_tuning(job):
+    return vram_tuner is not None and job.get("input", {}).get("vram_tuning", True) is not False
+
+
+def track_vram(info):
+    return vram_tuner.track(info) if info is not None else contextlib.nullcontext()
+
+
+class TextEmbedCache:
+    """
+    WanVideoTextEncodeCached(65) 노드의 디스크 캐시를 job 사이에서 관리합니다.
+
+    - <cache_dir>/<모델>-<정밀도>-<양자화>/<sha256(앞뒤 공백을 제거한 프롬프트)>.pt: 노드가 저장하는 임베딩
+    - 노드의 캐시 디렉토리(node_dir)는 위 디렉토리를 가리키는 심볼릭 링크로 바꿉니다.
+
+    노드는 긍정/부정 프롬프트가 모두 캐시에 있으면 텍스트 인코더를 아예 로드하지 않습니다.
+    노드는 프롬프트 텍스트만으로 파일 이름을 정하므로 인코더 설정별로 디렉토리를 나눠 (모델, 정밀도, 프롬프트)로 구분하고,
+    전체 크기가 max_bytes를 넘으면 가장 오래 사용되지 않은 임베딩부터 삭제합니다.
+    """
+
+    def __init__(self, cache_dir, max_bytes, node_dir, encoder):
+        self.encoder = encoder
+        self.cache_dir = os.path.join(cache_dir, "-".join(
+            "".join(c if c.isalnum() or c in "._-" else "_" for c in str(encoder.get(name)))
+            for name in ("model_name", "precision", "quantization")
+        ))
+        self.max_bytes = max_bytes
+        self.node_dir = node_dir
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._link_node_dir()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _link_node_dir(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if os.path.islink(self.node_dir):
+            if os.path.realpath(self.node_dir) == os.path.realpath(self.cache_dir):
+                return
+            os.remove(self.node_dir)
+        elif os.path.isdir(self.node_dir):
+            # 이미 만들어진 로컬 캐시는 공유 디렉토리로 옮깁니다.
+            for entry in os.scandir(self.node_dir):
+                shutil.move(entry.path, os.path.join(self.cache_dir, entry.name))
+            os.rmdir(self.node_dir)
+        os.symlink(self.cache_dir, self.node_dir)
+        logger.info(f"📝 텍스트 임베딩 캐시: {self.node_dir} -> {self.cache_dir}")
+
+    @staticmethod
+    def cache_key(text):
+        # ComfyUI-WanVideoWrapper의 get_cache_path와 같은 정규화입니다: 앞뒤 공백을 제거한 프롬프트를 키로 씁니다.
+        return text.strip() if isinstance(text, str) else ""
+
+    def _embed_path(self, text):
+        # 노드의 캐시 파일 이름 규칙(sha256(키).pt)과 같아야 합니다.
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(self.cache_key(text).encode('utf-8')).hexdigest()}.pt")
+
+    def prepare(self, prompt, template_nodes):
+        """prompt의 텍스트 인코딩 노드가 디스크 캐시를 쓰도록 하고, 적중 여부를 현재 구간에 기록합니다."""
+        inputs = prompt["65"]["inputs"]
+        if any(inputs.get(name) != value for name, value in self.encoder.items()):
+            # 다른 인코더 설정의 임베딩과 섞이지 않도록 캐시를 사용하지 않습니다.
+            return
+        set_prompt_input(prompt, template_nodes, "65", "use_disk_cache", True)
+        texts = [text for text in (inputs.get("positive_prompt"), inputs.get("negative_prompt")) if self.cache_key(text)]
+        hit = True
+        for text in texts:
+            try:
+                # LRU 판단을 위해 사용 시각을 갱신합니다.
+                os.utime(self._embed_path(text))
+            except FileNotFoundError:
+                hit = False
+        result = "hit" if hit else "miss"
+        with self._lock:
+            self._stats["hits" if hit else "misses"] += 1
+        span = current_span.get()
+        if span is not None:
+            span.attrs["text_embed_cache"] = result
+        logger.info(f"📝 텍스트 임베딩 캐시 {result}" + ("" if hit else " (텍스트 인코더 로드)"))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            with self._lock:
+                self._stats["evictions"] += 1
+            logger.info(f"🧹 텍스트 임베딩 캐시 정리: {path} ({size} bytes)")
+
+
+def create_text_embed_cache():
+    """ComfyUI-WanVideoWrapper가 설치된 환경에서만 텍스트 임베딩 캐시를 만듭니다."""
+    if not TEXT_EMBED_CACHE_ENABLED or not os.path.isdir(os.path.dirname(TEXT_EMBED_NODE_CACHE_DIR)):
+        return None
+    encoder = {
+        name: next(iter(workflow_registry.templates.values())).nodes["65"]["inputs"][name]
+        for name in ("model_name", "precision", "quantization")
+    }
+    try:
+        return TextEmbedCache(
+            os.path.join(CACHE_ROOT, 'text_embeds'), TEXT_EMBED_CACHE_MAX_BYTES, TEXT_EMBED_NODE_CACHE_DIR, encoder
+        )
+    except OSError as e:
+        logger.warning(f"텍스트 임베딩 캐시를 사용할 수 없습니다: {e}")
+        return None
+
+
+text_embed_cache = create_text_embed_cache()
+
+
+# 전처리 캐시 대상 노드 출력. 대상 출력을 모두 캐시에서 불러오면 이를 만들던 검출 노드는 prompt에서 빠집니다.
+# class_type: 대상 노드, output: 출력 번호, kind: image 또는 mask
+PREPROCESS_CACHE_OUTPUTS = {
+    "pose": {"class_type": "DrawViTPose", "output": 0, "kind": "image"},
+    "face": {"class_type": "PoseAndFaceDetection", "output": 1, "kind": "image"},
+    # SAM2 마스크(제어점 또는 검출된 bbox 기반)에 GrowMask/BlockifyMask까지 적용한 최종 마스크.
+    # 캐시에서 불러오면 SAM2 모델 로드와 추론을 모두 건너뜁니다.
+    "mask": {"class_type": "BlockifyMask", "output": 0, "kind": "mask"},
+}
+
+
+def is_link(prompt, value):
+    return isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) and value[0] in prompt
+
+
+def prune_prompt(prompt):
+    """출력 노드(VHS_VideoCombine)에 연결되지 않은 노드를 prompt에서 제거합니다."""
+    reachable = set()
+    stack = [node_id for node_id, node in prompt.items() if node["class_type"] == "VHS_VideoCombine"]
+    while stack:
+        node_id = stack.pop()
+        if node_id in reachable:
+            continue
+        reachable.add(node_id)
+        stack.extend(value[0] for value in prompt[node_id]["inputs"].values() if is_link(prompt, value))
+    for node_id in [node_id for node_id in prompt if node_id not in reachable]:
+        del prompt[node_id]
+
+
+def pack_mask_video(video_path, npz_path):
+    """흑백 마스크 비디오를 프레임별 비트맵(np.packbits)으로 압축해 npz로 저장합니다. 프레임은 하나씩 읽어 바로 압축합니다."""
+    proc = subprocess.Popen(
+        [FFMPEG_PATH, '-v', 'error', '-i', video_path, '-f', 'image2pipe', '-c:v', 'pgm', '-pix_fmt', 'gray', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    packed = []
+    size = None
+    try:
+        # 프레임마다 "P5\n<가로> <세로>\n255\n" 헤더 뒤에 가로*세로 바이트가 이어집니다.
+        while magic := proc.stdout.readline():
+            dims = proc.stdout.readline().split()
+            if magic.strip() != b'P5' or len(dims) != 2 or proc.stdout.readline().strip() != b'255':
+                raise ValueError(f"마스크 프레임을 읽을 수 없습니다: {video_path}")
+            width, height = int(dims[0]), int(dims[1])
+            if size not in (None, (width, height)):
+                raise ValueError(f"마스크 프레임 크기가 일정하지 않습니다: {video_path}")
+            size = (width, height)
+            frame = proc.stdout.read(width * height)
+            if len(frame) != width * height:
+                raise ValueError(f"마스크 프레임이 잘렸습니다: {video_path}")
+            packed.append(np.packbits(np.frombuffer(frame, dtype=np.uint8).reshape(height, width) >= 128, axis=-1))
+    except BaseException:
+        proc.kill()
+        raise
+    finally:
+        proc.stdout.close()
+        stderr = proc.stderr.read()
+        proc.stderr.close()
+        proc.wait()
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, proc.args, stderr=stderr)
+    if not packed:
+        raise ValueError(f"마스크 프레임을 읽을 수 없습니다: {video_path}")
+    with open(npz_path, 'wb') as f:
+        np.savez_compressed(f, bits=np.stack(packed), shape=np.array((len(packed), size[1], size[0])))
+
+
+def unpack_mask_video(npz_path, video_path):
+    """pack_mask_video로 저장한 마스크를 VHS_LoadVideo로 불러올 수 있는 무손실(ffv1) 비디오로 풉니다."""
+    with np.load(npz_path) as data:
+        _, height, width = (int(value) for value in data["shape"])
+        bits = data["bits"]
+    tmp_path = f"{video_path}.{uuid.uuid4().hex}.tmp"
+    proc = subprocess.Popen(
+        [
+            FFMPEG_PATH, '-y', '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'gray', '-s', f'{width}x{height}', '-i', '-',
+            '-c:v', 'ffv1', '-pix_fmt', 'bgr0', '-f', 'matroska', tmp_path,
+        ],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        try:
+            for frame_bits in bits:
+                proc.stdin.write((np.unpackbits(frame_bits, axis=-1, count=width) * np.uint8(255)).tobytes())
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            stderr = proc.stderr.read()
+            proc.stderr.close()
+            if proc.wait():
+                raise subprocess.CalledProcessError(proc.returncode, proc.args, stderr=stderr)
+        os.replace(tmp_path, video_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class PreprocessCache:
+    """
+    포즈/얼굴 검출처럼 driving 비디오에만 의존하는 전처리 결과를 파일로 저장해 job 사이에서 재사용합니다.
+
+    - <cache_dir>/<key>.mkv: 이미지 출력 프레임 (ffv1 RGB, 8비트 무손실)
+    - <cache_dir>/<key>.npz: 마스크 출력 (프레임별 np.packbits 비트맵)
+    - <cache_dir>/decoded/<key>.mkv: hit 때 VHS_LoadVideo로 불러오도록 마스크를 풀어 둔 무손실 비디오
+    - <cache_dir>/<key>.json: 생성 시각, 크기, 캐시에 있었다면 건너뛰었을 노드들의 실행 시간
+
+    키는 대상 출력에 연결된 상위 노드 전체(입력 파일은 내용 해시로 대체)의 해시이므로
+    비디오 내용, fps, 해상도, 검출 모델, 제어점 등 결과에 영향을 주는 값이 모두 포함됩니다.
+    대상 출력이 모두 캐시에 있으면(hit) VHS_LoadVideo로 불러오도록 prompt를 바꿔 검출/분할을 건너뛰고,
+    하나라도 없으면(miss) 실행 중에 출력을 저장하는 노드를 추가합니다.
+    전체 크기가 max_bytes를 넘으면 가장 오래 사용되지 않은 파일부터 삭제합니다.
+    """
+
+    # 출력 종류별 캐시 파일 확장자
+    ENTRY_EXTENSIONS = {"image": ".mkv", "mask": ".npz"}
+
+    def __init__(self, cache_dir, max_bytes, outputs):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.outputs = outputs
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes_read": 0, "seconds_saved": 0.0}
+        self._file_hashes = {}
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _file_hash(self, file_path):
+        # 같은 파일을 job마다 다시 해시하지 않도록 (경로, 크기, 수정 시각)별로 기억합니다.
+        stat = os.stat(file_path)
+        memo_key = (file_path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if memo_key in self._file_hashes:
+                return self._file_hashes[memo_key]
+        content_hash = sha256_file(file_path)
+        with self._lock:
+            if len(self._file_hashes) > 1024:
+                self._file_hashes.clear()
+            self._file_hashes[memo_key] = content_hash
+        return content_hash
+
+    def output_key(self, prompt, node_id, output):
+        """node_id의 output번 출력을 만드는 상위 노드 전체로 캐시 키를 계산합니다."""
+        nodes = {}
+        stack = [node_id]
+        while stack:
+            current = stack.pop()
+            if current in nodes:
+                continue
+            inputs = {}
+            for name, value in prompt[current]["inputs"].items():
+                if is_link(prompt, value):
+                    stack.append(value[0])
+                elif isinstance(value, str) and os.path.isabs(value) and os.path.isfile(value):
+                    value = f"sha256:{self._file_hash(value)}"
+                inputs[name] = value
+            nodes[current] = {"class_type": prompt[current]["class_type"], "inputs": inputs}
+        payload = {"version": PREPROCESS_CACHE_VERSION, "node": node_id, "output": output, "nodes": nodes}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    def _targets(self, prompt):
+        """
+        prompt에 있는 캐시 대상 출력을 {이름: (노드 ID, 출력 번호, 종류)}로 반환합니다.
+        마스크는 ffmpeg로 압축/복원하므로 ffmpeg가 없으면 대상에서 뺍니다.
+        """
+        targets = {}
+        for name, spec in self.outputs.items():
+            if spec["kind"] == "mask" and FFMPEG_PATH in MISSING_MEDIA_TOOLS:
+                continue
+            for node_id, node in prompt.items():
+                if node["class_type"] == spec["class_type"]:
+                    targets[name] = (node_id, spec["output"], spec["kind"])
+        return targets
+
+    def entry_path(self, key, kind):
+        return os.path.join(self.cache_dir, f"{key}{self.ENTRY_EXTENSIONS[kind]}")
+
+    @staticmethod
+    def loadable_path(path):
+        """VHS_LoadVideo로 불러올 파일 경로. 마스크(npz)는 옆의 decoded/ 아래에 풀어 둔 비디오입니다."""
+        if not path.endswith('.npz'):
+            return path
+        return os.path.join(os.path.dirname(path), 'decoded', f"{os.path.splitext(os.path.basename(path))[0]}.mkv")
+
+    def ensure_loadable(self, path):
+        """마스크(npz)를 아직 풀어 두지 않았다면 무손실 비디오로 풀어 둡니다."""
+        decoded_path = self.loadable_path(path)
+        if decoded_path != path and not os.path.isfile(decoded_path):
+            os.makedirs(os.path.dirname(decoded_path), exist_ok=True)
+            unpack_mask_video(path, decoded_path)
+
+    def target_keys(self, prompt, targets=None):
+        """prompt에 있는 캐시 대상 출력별 캐시 키 {이름: 키}를 반환합니다."""
+        targets = self._targets(prompt) if targets is None else targets
+        return {name: self.output_key(prompt, node_id, output) for name, (node_id, output, _) in targets.items()}
+
+    def missing_outputs(self, keys):
+        """{이름: 캐시 키} 중 캐시 파일이 없는 출력의 이름 목록을 반환합니다."""
+        return sorted(
+            name for name, key in keys.items() if not os.path.isfile(self.entry_path(key, self.outputs[name]["kind"]))
+        )
+
+    def apply_outputs(self, prompt, paths):
+        """
+        대상 출력을 주어진 파일 {이름: 경로}에서 불러오도록 바꾼 새 prompt를 반환합니다 (전처리 자산 사용 시).
+        파일이 없는 출력은 원래대로 계산합니다.
+        """
+        planned = dict(prompt)
+        for name, (node_id, output, kind) in self._targets(prompt).items():
+            if name in paths:
+                self.ensure_loadable(paths[name])
+                self._load_output(planned, prompt, name, node_id, output, kind, paths[name])
+        prune_prompt(planned)
+        return planned
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_meta(self, key):
+        try:
+            with open(self._meta_path(key), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def plan(self, prompt):
+        """
+        캐시를 적용한 새 prompt와, 실행 후 store()에 넘길 저장 정보를 반환합니다.
+        원래 prompt는 변경하지 않습니다.
+        """
+        # 출력에 연결되지 않은 노드(다른 모드용 SAM2 로더 등)는 ComfyUI도 실행하지 않으므로 대상에서 제외합니다.
+        prompt = dict(prompt)
+        prune_prompt(prompt)
+        targets = self._targets(prompt)
+        if not targets:
+            return prompt, None
+        with timed("preprocess_key"):
+            keys = self.target_keys(prompt, targets)
+
+        # 모든 출력을 캐시에서 불러오는 prompt. 원래 prompt와의 차이가 캐시로 건너뛰는 노드입니다.
+        cached = dict(prompt)
+        for name, (node_id, output, kind) in targets.items():
+            self._load_output(cached, prompt, name, node_id, output, kind, self.entry_path(keys[name], kind))
+        prune_prompt(cached)
+
+        try:
+            sizes = {}
+            for name, (_, _, kind) in targets.items():
+                entry_path = self.entry_path(keys[name], kind)
+                # LRU 판단을 위해 사용 시각을 갱신합니다.
+                os.utime(entry_path)
+                sizes[name] = os.path.getsize(entry_path)
+                self.ensure_loadable(entry_path)
+            hit = True
+        except FileNotFoundError:
+            hit = False
+        except (OSError, ValueError, subprocess.CalledProcessError) as e:
+            logger.warning(f"전처리 캐시 파일을 불러올 수 없어 다시 계산합니다: {e}")
+            hit = False
+
+        info = {"result": "hit" if hit else "miss", "outputs": sorted(targets)}
+        span = current_span.get()
+        if span is not None:
+            span.attrs["preprocess_cache"] = info
+        if hit:
+            info["bytes"] = sum(sizes.values())
+            info["seconds_saved"] = max(self._read_meta(key).get("seconds", 0.0) for key in keys.values())
+            with self._lock:
+                self._stats["hits"] += 1
+                self._stats["bytes_read"] += info["bytes"]
+                self._stats["seconds_saved"] += info["seconds_saved"]
+            logger.info(
+                f"🦴 전처리 캐시 hit: {', '.join(info['outputs'])} "
+                f"({info['bytes']} bytes, 약 {info['seconds_saved']:.1f}초 절약, 노드 {len(set(prompt) - set(cached))}개 생략)"
+            )
+            return cached, None
+
+        with self._lock:
+            self._stats["misses"] += 1
+        logger.info(f"🦴 전처리 캐시 miss: {', '.join(info['outputs'])}")
+        planned = dict(prompt)
+        saves = {
+            self._save_output(planned, name, node_id, output, kind, keys[name]): (keys[name], kind)
+            for name, (node_id, output, kind) in targets.items()
+        }
+        pending = {"saves": saves, "skipped_nodes": set(prompt) - set(cached), "info": info}
+        return planned, pending
+
+    def _load_output(self, planned, prompt, name, node_id, output, kind, entry_path):
+        loader_id = f"preprocess_load_{name}"
+        planned[loader_id] = {
+            "class_type": "VHS_LoadVideo",
+            "inputs": dict(
+                prompt["63"]["inputs"], video=self.loadable_path(entry_path), force_rate=0, custom_width=0, custom_height=0,
+                frame_load_cap=0, skip_first_frames=0, select_every_nth=1,
+            ),
+            "_meta": {"title": f"Load cached {name}"},
+        }
+        source = [loader_id, 0]
+        if kind == "mask":
+            planned[f"{loader_id}_mask"] = {
+                "class_type": "ImageToMask",
+                "inputs": {"channel": "red", "image": source},
+                "_meta": {"title": f"Cached {name} to mask"},
+            }
+            source = [f"{loader_id}_mask", 0]
+        for consumer_id, consumer in list(planned.items()):
+            for input_name, value in consumer["inputs"].items():
+                if value == [node_id, output]:
+                    set_prompt_input(planned, prompt, consumer_id, input_name, source)
+
+    def _save_output(self, planned, name, node_id, output, kind, key):
+        save_id = f"preprocess_save_{name}"
+        images = [node_id, output]
+        if kind == "mask":
+            planned[f"{save_id}_image"] = {
+                "class_type": "MaskToImage",
+                "inputs": {"mask": images},
+                "_meta": {"title": f"{name} to image"},
+            }
+            images = [f"{save_id}_image", 0]
+        inputs = {key_: value for key_, value in planned["30"]["inputs"].items() if key_ not in ("audio", "crf")}
+        planned[save_id] = {
+            "class_type": "VHS_VideoCombine",
+            "inputs": dict(
+                inputs, images=images, filename_prefix=f"preprocess_{name}", format="video/ffv1-mkv",
+                pix_fmt="bgr0", save_metadata=False, save_output=False,
+            ),
+            "_meta": {"title": f"Save {name} to preprocess cache"},
+        }
+        return save_id
+
+    def store(self, pending, videos):
+        """실행 결과에서 저장 노드의 출력을 캐시로 옮기고, videos에서는 제거합니다."""
+        # 다음 hit에서 절약될 시간: 이번 실행에서 캐시로 건너뛸 수 있는 노드들이 걸린 시간
+        seconds = 0.0
+        job_span = current_span.get()
+        if job_span is not None:
+            seconds = sum(
+                span.seconds for _, span in job_span.walk()
+                if span.attrs.get("node") in pending["skipped_nodes"]
+            )
+        stored_bytes = 0
+        for save_id, (key, kind) in pending["saves"].items():
+            paths = videos.pop(save_id, [])
+            if not paths:
+                continue
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                entry_path = self.entry_path(key, kind)
+                tmp_path = f"{entry_path}.{uuid.uuid4().hex}.tmp"
+                if kind == "mask":
+                    # 마스크는 0/1 값뿐이므로 비트 단위로 압축해 정확히 복원할 수 있게 저장합니다.
+                    pack_mask_video(paths[0], tmp_path)
+                    os.remove(paths[0])
+                else:
+                    shutil.move(paths[0], tmp_path)
+                size = os.path.getsize(tmp_path)
+                os.replace(tmp_path, entry_path)
+                meta_tmp_path = f"{self._meta_path(key)}.{uuid.uuid4().hex}.tmp"
+                with open(meta_tmp_path, 'w') as f:
+                    json.dump({"created": time.time(), "bytes": size, "seconds": round(seconds, 3)}, f)
+                os.replace(meta_tmp_path, self._meta_path(key))
+                stored_bytes += size
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                logger.warning(f"전처리 결과 저장 실패: {e}")
+        pending["info"].update(bytes=stored_bytes, seconds=round(seconds, 3))
+        logger.info(f"🦴 전처리 결과 저장: {stored_bytes} bytes (전처리 {seconds:.1f}초)")
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(tuple(self.ENTRY_EXTENSIONS.values())):
+                stat = entry.stat()
+                size = stat.st_size
+                if entry.name.endswith('.npz'):
+                    # 풀어 둔 마스크 비디오도 캐시 용량에 포함합니다.
+                    with contextlib.suppress(FileNotFoundError):
+                        size += os.path.getsize(self.loadable_path(entry.path))
+                entries.append((stat.st_mtime, size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            for related_path in (f"{os.path.splitext(path)[0]}.json", self.loadable_path(path)):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(related_path)
+            total -= size
+            with self._lock:
+                self._stats["evictions"] += 1
+            logger.info(f"🧹 전처리 캐시 정리: {path} ({size} bytes)")
+
+
+preprocess_cache = PreprocessCache(
+    os.path.join(CACHE_ROOT, 'preprocess'), PREPROCESS_CACHE_MAX_BYTES, PREPROCESS_CACHE_OUTPUTS
+) if PREPROCESS_CACHE_ENABLED else None
+if preprocess_cache and FFMPEG_PATH in MISSING_MEDIA_TOOLS:
+    logger.warning("⚠️ ffmpeg가 없어 전처리 캐시에 마스크는 저장하지 않습니다.")
+
+
+class PreprocessAssetStore:
+    """
+    mode=preprocess job의 결과를 생성 job이 asset_id로 다시 쓸 수 있게 보관합니다.
+
+    - <asset_dir>/<asset_id>/manifest.json: 전처리 때 사용한 입력값(fps, 크기, 제어점 등)과 출력 파일 목록
+    - <asset_dir>/<asset_id>/video<ext>: driving 비디오
+    - <asset_dir>/<asset_id>/<이름>.mkv|.npz: 전처리 출력 (전처리 캐시 파일의 하드링크)
+    - <asset_dir>/<asset_id>/decoded/: 불러오기 위해 풀어 둔 마스크 비디오
+
+    전처리 캐시에서 정리되어도 자산은 유지되며, 마지막으로 사용된 뒤 ttl이 지나면 삭제됩니다.
+    asset_id는 전처리 출력의 캐시 키로 정해지므로 같은 입력으로 다시 전처리하면 같은 자산을 돌려줍니다.
+    """
+
+    # 전처리 결과에 영향을 주므로 생성 job에서도 같은 값을 써야 하는 입력
+    FIELDS = ("fps", "width", "height", "points_store", "coordinates", "neg_coordinates", "shape_bucketing")
+
+    def __init__(self, asset_dir, ttl):
+        self.asset_dir = asset_dir
+        self.ttl = ttl
+
+    def create(self, keys, video_path, job_input):
+        """전처리 출력 {이름: 캐시 키}와 driving 비디오로 자산을 만들고 asset_id를 반환합니다."""
+        asset_id = hashlib.sha256(json.dumps(keys, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+        asset_path = os.path.join(self.asset_dir, asset_id)
+        if os.path.isfile(os.path.join(asset_path, 'manifest.json')):
+            os.utime(os.path.join(asset_path, 'manifest.json'))
+            return asset_id
+
+        tmp_path = f"{asset_path}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp_path)
+        video_name = f"video{os.path.splitext(video_path)[1] or '.mp4'}"
+        link_or_copy(video_path, os.path.join(tmp_path, video_name))
+        outputs = {}
+        try:
+            for name, key in keys.items():
+                kind = preprocess_cache.outputs[name]["kind"]
+                outputs[name] = f"{name}{preprocess_cache.ENTRY_EXTENSIONS[kind]}"
+                link_or_copy(preprocess_cache.entry_path(key, kind), os.path.join(tmp_path, outputs[name]))
+        except OSError:
+            # 그 사이 캐시에서 정리된 출력이 있으면 만들던 자산을 남기지 않습니다.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        manifest = {
+            "asset_id": asset_id,
+            "created": time.time(),
+            "video": video_name,
+            "outputs": outputs,
+            "inputs": {field: job_input.get(field) for field in self.FIELDS},
+        }
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            os.rename(tmp_path, asset_path)
+        except OSError:
+            # 다른 워커가 같은 자산을 먼저 만들었습니다.
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._evict()
+        return asset_id
+
+    def resolve(self, asset_id):
+        """asset_id의 manifest를 파일 경로를 절대 경로로 바꿔 반환합니다."""
+        if not isinstance(asset_id, str) or not re.fullmatch(r'[0-9a-f]{32}', asset_id):
+            raise WorkflowBindingError(f"올바르지 않은 asset_id: {asset_id!r}")
+        asset_path = os.path.join(self.asset_dir, asset_id)
+        manifest_path = os.path.join(asset_path, 'manifest.json')
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            os.utime(manifest_path)
+        except (FileNotFoundError, ValueError):
+            raise WorkflowBindingError(f"전처리 자산을 찾을 수 없습니다 (만료되었을 수 있습니다): {asset_id}")
+        manifest["video"] = os.path.join(asset_path, manifest["video"])
+        manifest["outputs"] = {name: os.path.join(asset_path, path) for name, path in manifest["outputs"].items()}
+        return manifest
+
+    def apply(self, job_input, manifest):
+        """생성 job 입력의 driving 비디오와 전처리 관련 입력을 자산의 값으로 채운 새 입력을 반환합니다."""
+        resolved = {key: value for key, value in job_input.items() if not key.startswith("video_")}
+        for field, value in manifest["inputs"].items():
+            if field in job_input and value is not None and str(job_input[field]) != str(value):
+                raise WorkflowBindingError(f"'{field}' 값은 전처리 자산의 값({value})과 같아야 합니다: {job_input[field]}")
+            if value is not None:
+                resolved[field] = value
+        resolved["video_path"] = manifest["video"]
+        return resolved
+
+    def _evict(self):
+        now = time.time()
+        for entry in os.scandir(self.asset_dir):
+            if not entry.is_dir() or entry.name.endswith('.tmp'):
+                continue
+            try:
+                last_used = os.path.getmtime(os.path.join(entry.path, 'manifest.json'))
+            except FileNotFoundError:
+                continue
+            if now - last_used > self.ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                logger.info(f"🧹 전처리 자산 정리: {entry.name}")
+
+
+preprocess_assets = PreprocessAssetStore(
+    os.path.join(CACHE_ROOT, 'assets'), PREPROCESS_ASSET_TTL
+) if preprocess_cache is not None else None
+
+
+def use_preprocess_cache(job):
+    job_input = job.get("input", {})
+    return (
+        preprocess_cache is not None and job_input.get("preprocess_cache", True) is not False
+        # 구간 분할 실행은 구간마다 불러오는 프레임이 달라지므로 사용하지 않습니다.
+        and not job_input.get("segment_frames")
+    )
+
+
+def numeric_stats(prefix, stats):
+    """통계 dict에서 숫자 값만 골라 메트릭 게이지 이름으로 바꿉니다."""
+    return {
+        f"{prefix}_{key}": float(value) for key, value in stats.items()
+        if isinstance(value, (int, float, bool))
+    }
+
+
+metrics.add_collector(lambda: numeric_stats("comfyui_connection", comfy_connection.get_stats()))
+if input_cache is not None:
+    metrics.add_collector(lambda: numeric_stats("input_cache", input_cache.get_stats()))
+if result_cache is not None:
+    metrics.add_collector(lambda: numeric_stats("result_cache", result_cache.get_stats()))
+if compile_cache is not None:
+    metrics.add_collector(lambda: numeric_stats("compile_cache", compile_cache.get_stats()))
+if text_embed_cache is not None:
+    metrics.add_collector(lambda: numeric_stats("text_embed_cache", text_embed_cache.get_stats()))
+if preprocess_cache is not None:
+    metrics.add_collector(lambda: numeric_stats("preprocess_cache", preprocess_cache.get_stats()))
+if vram_tuner is not None:
+    metrics.add_collector(lambda: numeric_stats("vram_tuning", vram_tuner.get_stats()))
+
+
+def process_input(input_data, temp_dir, output_filename, input_type):
+    """입력 데이터를 처리하여 파일 경로를 반환하는 함수"""
+    if input_type == "path":
+        # 경로인 경우 그대로 반환
+        logger.info(f"📁 경로 입력 처리: {input_data}")
+        return input_data
+    elif input_type == "url":
+        # URL인 경우 다운로드
+        logger.info(f"🌐 URL 입력 처리: {input_data}")
+        os.makedirs(temp_dir, exist_ok=True)
+        file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
+        if input_cache is not None:
+            return input_cache.fetch_url(input_data, file_path, download_file_from_url)
+        return download_file_from_url(input_data, file_path)
+    elif input_type == "base64":
+        # Base64인 경우 디코딩하여 저장
+        logger.info(f"🔢 Base64 입력 처리")
+        if input_cache is not None:
+            os.makedirs(temp_dir, exist_ok=True)
+            file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
+            return input_cache.fetch_base64(
+                input_data, file_path,
+                lambda data, path: save_base64_to_file(data, os.path.dirname(path), os.path.basename(path))
+            )
+        return save_base64_to_file(input_data, temp_dir, output_filename)
+    else:
+        raise Exception(f"지원하지 않는 입력 타입: {input_type}")
+
+        
+# keep-alive 연결을 재사용하는 다운로드 세션 (병렬 Range 요청 수만큼 풀 크기를 잡습니다)
+download_session = requests.Session()
+download_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_WORKERS * 2))
+download_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_WORKERS * 2))
+
+
+def _probe_download(url):
+    """다운로드할 파일의 크기와 Range 요청 지원 여부를 확인합니다."""
+    timeout = (DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)
+    try:
+        response = download_session.head(url, allow_redirects=True, timeout=timeout)
+        if response.ok and response.headers.get('Content-Length'):
+            return int(response.headers['Content-Length']), response.headers.get('Accept-Ranges') == 'bytes'
+    except requests.RequestException as e:
+        logger.debug(f"HEAD 요청 실패: {e}")
+
+    # HEAD를 거부하는 서버는 1바이트 Range GET의 Content-Range로 크기를 확인합니다.
+    try:
+        with download_session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=timeout) as response:
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range and not content_range.endswith('/*'):
+                return int(content_range.rsplit('/', 1)[1]), True
+    except requests.RequestException as e:
+        logger.debug(f"Range 요청 실패: {e}")
+    return None, False
+
+
+def _is_retryable_download_error(error):
+    """4xx 응답은 다시 요청해도 같으므로 408(요청 시간 초과)/429(요청 과다)만 재시도합니다."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status_code = error.response.status_code
+        return not 400 <= status_code < 500 or status_code in (408, 429)
+    return True
+
+
+def _wait_before_retry(attempt):
+    if attempt:
+        time.sleep(DOWNLOAD_RETRY_DELAY * 2 ** (attempt - 1))
+
+
+def _download_range(url, output_path, start, end):
+    """[start, end] 구간을 받아 파일의 해당 위치에 씁니다. 실패하면 받은 위치부터 이어서 재시도합니다."""
+    position = start
+    for attempt in range(DOWNLOAD_RETRIES):
+        _wait_before_retry(attempt)
+        try:
+            headers = {'Range': f'bytes={position}-{end}'}
+            with download_session.get(url, headers=headers, stream=True,
+                                      timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)) as response:
+                if response.status_code != 206:
+                    response.raise_for_status()
+                    raise Exception(f"Range 요청이 거부되었습니다 (HTTP {response.status_code})")
+                with open(output_path, 'r+b') as f:
+                    f.seek(position)
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        f.write(chunk)
+                        position += len(chunk)
+            if position > end:
+                return
+        except Exception as e:
+            if not _is_retryable_download_error(e):
+                raise
+            logger.warning(f"구간 다운로드 실패 ({position}-{end}, 시도 {attempt+1}/{DOWNLOAD_RETRIES}): {e}")
+    raise Exception(f"구간 다운로드 실패: {start}-{end}")
+
+
+def _download_stream(url, output_path, accepts_ranges):
+    """단일 연결로 파일을 받습니다. 중간에 끊기면 Range를 지원하는 서버에서는 받은 위치부터 이어받습니다."""
+    for attempt in range(DOWNLOAD_RETRIES):
+        _wait_before_retry(attempt)
+        received = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+        headers = {'Range': f'bytes={received}-'} if accepts_ranges and received else {}
+        try:
+            with download_session.get(url, headers=headers, stream=True,
+                                      timeout=(DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)) as response:
+                response.raise_for_status()
+                # 서버가 Range를 무시하고 전체를 보내면 처음부터 다시 씁니다.
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                if mode == 'wb':
+                    received = 0
+                with open(output_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        received += len(chunk)
+                        if received > DOWNLOAD_MAX_BYTES:
+                            raise ValueError(f"파일 크기가 최대 허용치({DOWNLOAD_MAX_BYTES} bytes)를 초과했습니다.")
+                        f.write(chunk)
+            return
+        except ValueError:
+            raise
+        except Exception as e:
+            if not _is_retryable_download_error(e) or attempt == DOWNLOAD_RETRIES - 1:
+                raise
+            logger.warning(f"다운로드 실패 (시도 {attempt+1}/{DOWNLOAD_RETRIES}): {e}")
+
+
+def download_file_from_url(url, output_path):
+    """URL에서 파일을 다운로드하는 함수"""
+    try:
+        start = time.time()
+        size, accepts_ranges = _probe_download(url)
+        if size is not None and size > DOWNLOAD_MAX_BYTES:
+            raise ValueError(f"파일 크기({size} bytes)가 최대 허용치({DOWNLOAD_MAX_BYTES} bytes)를 초과했습니다.")
+
+        if size and accepts_ranges and size >= 2 * DOWNLOAD_PART_BYTES:
+            # 큰 파일은 Range 요청으로 여러 구간을 병렬로 받습니다.
+            with open(output_path, 'wb') as f:
+                f.truncate(size)
+            ranges = [(offset, min(offset + DOWNLOAD_PART_BYTES, size) - 1)
+                      for offset in range(0, size, DOWNLOAD_PART_BYTES)]
+            with ThreadPoolExecutor(max_workers=min(DOWNLOAD_WORKERS, len(ranges))) as executor:
+                for future in [executor.submit(_download_range, url, output_path, s, e) for s, e in ranges]:
+                    future.result()
+        else:
+            _download_stream(url, output_path, accepts_ranges)
+
+        elapsed = time.time() - start
+        downloaded = os.path.getsize(output_path)
+        logger.info(
+            f"✅ URL에서 파일을 성공적으로 다운로드했습니다: {url} -> {output_path} "
+            f"({downloaded / (1024*1024):.1f}MB, {elapsed:.2f}초, {downloaded / max(elapsed, 1e-6) / (1024*1024):.1f}MB/s)"
+        )
+        return output_path
+    except Exception as e:
+        logger.error(f"❌ 다운로드 중 오류 발생: {e}")
+        raise Exception(f"다운로드 중 오류 발생: {e}")
+
+
+def save_base64_to_file(base64_data, temp_dir, output_filename):
+    """Base64 데이터를 파일로 저장하는 함수"""
+    try:
+        # 디렉토리가 존재하지 않으면 생성
+        os.makedirs(temp_dir, exist_ok=True)
+        
+        # Base64 문자열을 조각 단위로 디코딩하면서 파일로 저장
+        file_path = os.path.abspath(os.path.join(temp_dir, output_filename))
+        ext = os.path.splitext(output_filename)[1].lower()
+        expected_kind = 'video' if ext in VIDEO_EXTENSIONS and ext != '.gif' else 'image' if ext in IMAGE_EXTENSIONS else None
+        decode_base64_to_file(base64_data, file_path, expected_kind)
+        
+        logger.info(f"✅ Base64 입력을 '{file_path}' 파일로 저장했습니다.")
+        return file_path
+    except (binascii.Error, ValueError) as e:
+        logger.error(f"❌ Base64 디코딩 실패: {e}")
+        raise Exception(f"Base64 디코딩 실패: {e}")
+
+# 버킷 실행 결과를 요청 크기로 되돌리는 리사이즈 노드 ID (템플릿 노드 ID와 겹치지 않게 합니다)
+BUCKET_RESTORE_NODE = "bucket_restore"
+
+
+def use_shape_bucketing(job_input):
+    return bool(SHAPE_BUCKETS) and job_input.get("shape_bucketing", SHAPE_BUCKETING) is True
+
+
+def select_size_bucket(width, height, buckets=None):
+    """
+    요청 해상도와 가로세로 비율이 같은 버킷 중 배율이 가장 가까운 것을 고릅니다.
+    비율이 다른 버킷으로 실행하면 되돌릴 때 영상이 늘어나므로, 같은 비율의 버킷이 없으면 None을 반환합니다.
+    """
+    candidates = [bucket for bucket in buckets or SHAPE_BUCKETS if bucket[0] * height == bucket[1] * width]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda bucket: abs(math.log(bucket[0] / width)))
+
+
+def select_frame_bucket(frames, buckets=None):
+    """frames 이상인 가장 작은 프레임 버킷을 고릅니다. 가장 큰 버킷보다 길면 그 배수로 올립니다."""
+    buckets = buckets or SHAPE_FRAME_BUCKETS
+    if not buckets:
+        return frames
+    for bucket in buckets:
+        if frames <= bucket:
+            return bucket
+    return -(-frames // buckets[-1]) * buckets[-1]
+
+
+def pad_video_frames(video_path, output_path, fps, frames):
+    """fps 기준으로 마지막 프레임을 반복해 비디오를 frames 프레임 길이로 늘립니다."""
+    result = subprocess.run([
+        FFMPEG_PATH, '-y', '-v', 'error', '-i', video_path,
+        '-vf', f'fps={fps},tpad=stop_mode=clone:stop=-1', '-frames:v', str(frames),
+        '-c:v', 'libx264', '-crf', '12', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', output_path
+    ], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"비디오 프레임 채우기 실패: {result.stderr}")
+    return output_path
+
+
+def apply_shape_bucket(prompt, template, job_input, work_dir):
+    """
+    렌더링된 prompt를 가장 가까운 해상도/프레임 버킷으로 실행하도록 바꾸고 선택한 버킷 정보를 반환합니다.
+    - 해상도: 150/151에 같은 비율의 버킷 크기를 넣고, 결과 프레임을 요청 크기로 리사이즈하는 노드를 VHS_VideoCombine(30) 앞에 추가합니다.
+      같은 비율의 버킷이 없으면 요청 해상도로 실행합니다.
+    - 프레임 수: driving 비디오 끝을 마지막 프레임으로 채운 사본을 work_dir에 만들어 버킷 길이로 맞추고, 결과는 VHS_SplitImages(194)에서 원래 길이로 자릅니다.
+    구간 분할 실행(segment_frames)은 구간마다 길이가 정해지므로 프레임 수는 버킷에 맞추지 않습니다.
+    ffmpeg/ffprobe가 없으면(MISSING_MEDIA_TOOLS) 프레임 수 버킷도 건너뛰고 해상도 버킷만 적용합니다.
+    """
+    width = prompt["150"]["inputs"]["value"]
+    height = prompt["151"]["inputs"]["value"]
+    bucket_width, bucket_height = select_size_bucket(width, height) or (width, height)
+    info = {"requested": f"{width}x{height}", "bucket": f"{bucket_width}x{bucket_height}"}
+    if (bucket_width, bucket_height) != (width, height):
+        # 비율이 같으므로 요청 크기로 되돌리는 리사이즈는 균일한 배율 변경입니다.
+        # divisible_by는 요청 크기를 그대로 유지하는 값 중 가장 큰 것을 사용합니다.
+        divisible_by = next(d for d in (16, 8, 4, 2, 1) if width % d == 0 and height % d == 0)
+        set_prompt_input(prompt, template.nodes, "150", "value", bucket_width)
+        set_prompt_input(prompt, template.nodes, "151", "value", bucket_height)
+        # 템플릿의 ImageResizeKJv2(64) 입력을 바탕으로 만들어 설치된 노드 버전과 입력 목록을 맞춥니다.
+        prompt[BUCKET_RESTORE_NODE] = {
+            "class_type": "ImageResizeKJv2",
+            "inputs": dict(
+                template.nodes["64"]["inputs"], width=width, height=height, keep_proportion="stretch",
+                divisible_by=divisible_by, image=["194", 0],
+            ),
+            "_meta": {"title": "Restore requested size"},
+        }
+        set_prompt_input(prompt, template.nodes, "30", "images", [BUCKET_RESTORE_NODE, 0])
+
+    if SHAPE_FRAME_BUCKETS and not MISSING_MEDIA_TOOLS and not job_input.get("segment_frames"):
+        video_path = prompt["63"]["inputs"]["video"]
+        fps = prompt["63"]["inputs"]["force_rate"]
+        frames = max(1, int(probe_media(video_path)["duration"] * fps))
+        bucket_frames = select_frame_bucket(frames)
+        info.update(frames=frames, bucket_frames=bucket_frames)
+        if bucket_frames != frames:
+            os.makedirs(work_dir, exist_ok=True)
+            padded_path = os.path.abspath(os.path.join(work_dir, f"input_video_bucket{bucket_frames}.mp4"))
+            with timed("bucket_pad", frames=frames, bucket_frames=bucket_frames):
+                pad_video_frames(video_path, padded_path, fps, bucket_frames)
+            set_prompt_input(prompt, template.nodes, "63", "video", padded_path)
+            set_prompt_input(prompt, template.nodes, "63", "frame_load_cap", bucket_frames)
+            set_prompt_input(prompt, template.nodes, "194", "split_index", frames)
+    return info
+
+
+def prepare_prompt(job):
+    """job 입력 파일을 준비하고 ComfyUI에 보낼 prompt를 구성합니다."""
+    job_input = job.get("input", {})
+
+    logger.info(f"Received job input: {job_input}")
+    task_id = current_work_dir.get() or f"task_{uuid.uuid4()}"
+
+    # 전처리 자산(asset_id)을 쓰면 driving 비디오와 전처리 관련 입력은 자산의 값을 사용합니다.
+    asset = None
+    if job_input.get("asset_id"):
+        if preprocess_assets is None:
+            raise WorkflowBindingError("전처리 자산을 사용할 수 없습니다 (PREPROCESS_CACHE_ENABLED=false).")
+        asset = preprocess_assets.resolve(job_input["asset_id"])
+        job_input = preprocess_assets.apply(job_input, asset)
+
+    # 이미지/비디오 입력 처리 (각각 *_path, *_url, *_base64 중 하나만 사용)
+    # 두 입력은 서로 독립적이므로 동시에 준비합니다.
+    input_specs = {}
+    for name, filename in (("image", "input_image.jpg"), ("video", "input_video.mp4")):
+        for input_type in ("path", "url", "base64"):
+            if f"{name}_{input_type}" in job_input:
+                input_specs[name] = (job_input[f"{name}_{input_type}"], task_id, filename, input_type)
+                break
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, run_timed, f"input_{name}", process_input, *spec)
+            for name, spec in input_specs.items()
+        }
+        image_path = futures["image"].result() if "image" in futures else None
+        video_path = futures["video"].result() if "video" in futures else None
+
+    if input_cache is not None:
+        logger.info(f"입력 캐시 통계: {input_cache.get_stats()}")
+
+    template = workflow_registry.select(job_input)
+    logger.info(f"워크플로우 템플릿: {template.name}")
+    with timed("render", template=template.name):
+        prompt = template.render(dict(job_input, image_path=image_path, video_path=video_path))
+
+    if use_shape_bucketing(job_input):
+        with timed("bucket") as span:
+            shape_bucket = apply_shape_bucket(prompt, template, job_input, task_id)
+            if span is not None:
+                span.attrs["shape_bucket"] = shape_bucket
+        logger.info(f"📐 형태 버킷: {shape_bucket}")
+    if text_embed_cache is not None:
+        text_embed_cache.prepare(prompt, template.nodes)
+    if asset is not None:
+        with timed("asset", asset_id=asset["asset_id"]):
+            prompt = preprocess_cache.apply_outputs(prompt, asset["outputs"])
+        logger.info(f"🦴 전처리 자산 사용: {asset['asset_id']} ({', '.join(sorted(asset['outputs']))})")
+
+    return prompt
+
+
+def run_preprocess(job):
+    """
+    mode=preprocess: 생성 없이 driving 비디오의 전처리(포즈/얼굴 검출, SAM2 마스크)만 실행하고
+    생성 job에서 video_path/points_store 대신 쓸 수 있는 asset_id를 반환합니다.
+    참조 이미지는 전처리 결과에 영향을 주지 않으므로 예제 이미지로 템플릿을 채웁니다.
+    """
+    if preprocess_assets is None:
+        return {"error": "mode=preprocess를 사용하려면 PREPROCESS_CACHE_ENABLED=true 이어야 합니다."}
+    job_input = job.get("input", {})
+    preprocess_input = {
+        key: value for key, value in job_input.items() if not key.startswith("image_") and not key.startswith("video_")
+    }
+    # 자산에는 버킷 적용 전의 원본 비디오를 보관해야 하므로 비디오 입력은 여기서 먼저 준비합니다.
+    video_input = next((input_type for input_type in ("path", "url", "base64") if f"video_{input_type}" in job_input), None)
+    if video_input is None:
+        return {"error": "필수 입력값이 없습니다: video_path"}
+    try:
+        with timed("prepare"):
+            video_path = run_timed(
+                "input_video", process_input,
+                job_input[f"video_{video_input}"], current_work_dir.get() or f"task_{uuid.uuid4()}",
+                "input_video.mp4", video_input,
+            )
+    except Exception as e:
+        logger.error(f"❌ 입력 준비 실패: {e}")
+        return {"error": str(e)}
+    # 교체 모드 템플릿은 포즈/얼굴과 마스크를 모두 만들므로 두 모드의 생성 job에 모두 쓸 수 있습니다.
+    preprocess_input.update(
+        mode="replace", image_path=WARMUP_IMAGE, video_path=video_path, prompt="preprocess", seed=0, cfg=1.0,
+        shape_bucketing=use_shape_bucketing(job_input),
+    )
+    preprocess_input.pop("segment_frames", None)
+    try:
+        with timed("prepare"):
+            prompt = prepare_prompt(dict(job, input=preprocess_input))
+    except WorkflowBindingError as e:
+        logger.error(f"❌ 잘못된 입력: {e}")
+        return {"error": str(e)}
+
+    with timed("comfyui_connect"):
+        comfy_connection.ensure_connected()
+    try:
+        with timed("preprocess_cache"):
+            planned, pending = preprocess_cache.plan(prompt)
+        if pending:
+            # 생성 노드(VHS_VideoCombine 30)를 빼고 전처리 출력을 저장하는 노드에 필요한 부분만 실행합니다.
+            del planned["30"]
+            prune_prompt(planned)
+            with timed("execute"):
+                videos = get_videos(planned, job)
+            preprocess_cache.store(pending, videos)
+    except PromptExecutionError as e:
+        logger.error(f"❌ ComfyUI 실행 실패: {e}")
+        return {"error": str(e)}
+
+    keys = preprocess_cache.target_keys(prompt)
+    if not keys:
+        return {"error": "워크플로우에 전처리 출력 노드가 없습니다."}
+    # store()는 저장 실패를 경고로만 남기므로 자산을 만들기 전에 모든 출력이 캐시에 있는지 확인합니다.
+    missing = preprocess_cache.missing_outputs(keys)
+    if missing:
+        return {"error": f"전처리 결과를 저장하지 못했습니다: {', '.join(missing)}"}
+    try:
+        with timed("asset"):
+            asset_id = preprocess_assets.create(keys, video_path, preprocess_input)
+    except OSError as e:
+        logger.error(f"❌ 전처리 자산 생성 실패: {e}")
+        return {"error": f"전처리 자산 생성 실패: {e}"}
+    logger.info(f"🦴 전처리 자산 생성: {asset_id} ({', '.join(sorted(keys))})")
+    return {"asset_id": asset_id, "outputs": sorted(keys), "expires_after_seconds": PREPROCESS_ASSET_TTL}
+
+
+def select_video_file(videos):
+    # 이미지가 없는 경우 처리
+    for node_id in videos:
+        if videos[node_id]:
+            return {"video_file": videos[node_id][0]}
+    
+    return {"error": "비디오를를 찾을 수 없습니다."}
+
+
+def probe_media(file_path):
+    """ffprobe로 미디어 파일의 길이(초)와 오디오 스트림 유무를 확인합니다."""
+    result = subprocess.run([
+        FFPROBE_PATH, '-v', 'error', '-show_entries', 'format=duration:stream=codec_type', '-of', 'json', file_path
+    ], capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        raise Exception(f"ffprobe 실패: {result.stderr}")
+    info = json.loads(result.stdout)
+    return {
+        "duration": float(info["format"]["duration"]),
+        "has_audio": any(stream.get("codec_type") == "audio" for stream in info.get("streams", [])),
+    }
+
+
+def plan_segments(total_frames, segment_frames, overlap, offset=0):
+    """
+    전체 프레임을 overlap만큼 겹치는 구간 [(시작 프레임, 프레임 수), ...]으로 나눕니다.
+    시작 프레임은 offset(앞에서 건너뛴 프레임 수)부터 셉니다.
+    """
+    segments = []
+    start = 0
+    while start < total_frames:
+        length = min(segment_frames, total_frames - start)
+        segments.append((start, length))
+        if start + length >= total_frames:
+            break
+        start += segment_frames - overlap
+    # 마지막 구간이 겹침 구간보다 짧으면 이전 구간에 합칩니다.
+    if len(segments) > 1 and segments[-1][1] <= overlap:
+        segments.pop()
+        previous_start, _ = segments.pop()
+        segments.append((previous_start, total_frames - previous_start))
+    return [(offset + start, length) for start, length in segments]
+
+
+def stitch_segments(clip_paths, overlap_seconds, output_path):
+    """구간별 결과 클립을 겹치는 구간에서 크로스페이드하며 하나의 비디오로 이어 붙입니다."""
+    if len(clip_paths) == 1:
+        shutil.copyfile(clip_paths[0], output_path)
+        return output_path
+
+    infos = [probe_media(path) for path in clip_paths]
+    with_audio = all(info["has_audio"] for info in infos)
+
+    filters = []
+    offset = 0.0
+    video_label, audio_label = "[0:v]", "[0:a]"
+    for index in range(1, len(clip_paths)):
+        offset += infos[index - 1]["duration"] - overlap_seconds
+        filters.append(
+            f"{video_label}[{index}:v]xfade=transition=fade:duration={overlap_seconds:.4f}:offset={offset:.4f}[v{index}]"
+        )
+        video_label = f"[v{index}]"
+        if with_audio:
+            filters.append(f"{audio_label}[{index}:a]acrossfade=d={overlap_seconds:.4f}[a{index}]")
+            audio_label = f"[a{index}]"
+
+    command = [FFMPEG_PATH, '-y', '-v', 'error']
+    for path in clip_paths:
+        command += ['-i', path]
+    command += ['-filter_complex', ';'.join(filters), '-map', video_label]
+    command += ['-map', audio_label] if with_audio else ['-an']
+    command += ['-c:v', 'libx264', '-crf', '19', '-pix_fmt', 'yuv420p', output_path]
+
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"구간 비디오 합치기 실패: {result.stderr}")
+    return output_path
+
+
+def run_segmented_workflow(prompt, job):
+    """
+    긴 driving 비디오를 겹치는 프레임 구간으로 나눠 구간마다 별도 prompt로 실행하고 결과를 이어 붙입니다.
+    모든 구간 prompt를 한 번에 큐에 넣어 GPU가 쉬지 않게 하고, 실패한 구간만 다시 실행합니다.
+    구간 사이의 연속성을 위해 모든 구간에 같은 seed를 사용합니다.
+    """
+    if MISSING_MEDIA_TOOLS:
+        raise WorkflowBindingError(f"구간 분할 실행에 필요한 {', '.join(MISSING_MEDIA_TOOLS)}를 찾을 수 없습니다.")
+    job_input = job.get("input", {})
+    try:
+        segment_frames = int(job_input["segment_frames"])
+        overlap = int(job_input.get("segment_overlap", 8))
+        retries = int(job_input.get("segment_retries", 1))
+    except (TypeError, ValueError) as e:
+        raise WorkflowBindingError(f"구간 분할 설정이 올바르지 않습니다: {e}")
+    if overlap < 0 or segment_frames <= overlap * 2:
+        raise WorkflowBindingError("segment_frames는 segment_overlap의 두 배보다 커야 합니다.")
+
+    loader = prompt["63"]["inputs"]
+    fps = loader["force_rate"]
+    video_info = probe_media(loader["video"])
+    # 요청에서 이미 잘라낸 범위(skip_first_frames, frame_load_cap) 안에서만 구간을 나눕니다.
+    skip_frames = int(loader.get("skip_first_frames") or 0)
+    total_frames = max(0, int(video_info["duration"] * fps) - skip_frames)
+    if loader.get("frame_load_cap"):
+        total_frames = min(total_frames, int(loader["frame_load_cap"]))
+    segments = plan_segments(total_frames, segment_frames, overlap, skip_frames)
+    if not segments:
+        raise WorkflowBindingError(f"구간으로 나눌 프레임이 없습니다 (skip_first_frames={skip_frames}).")
+    logger.info(f"🎞️ 구간 분할: 전체 {total_frames}프레임 → {len(segments)}개 구간 (구간 {segment_frames}, 겹침 {overlap})")
+
+    def submit_segment(index):
+        start, length = segments[index]
+        segment_prompt = dict(prompt)
+        set_prompt_input(segment_prompt, prompt, "63", "skip_first_frames", start)
+        set_prompt_input(segment_prompt, prompt, "63", "frame_load_cap", length)
+        return submit_prompt(segment_prompt, job)
+
+    # 모든 구간을 먼저 큐에 넣은 뒤 순서대로 결과를 기다립니다.
+    pending = []
+    waited = 0
+    clip_paths = []
+    try:
+        for index in range(len(segments)):
+            pending.append(submit_segment(index))
+        for index in range(len(segments)):
+            # wait_for_videos는 끝나면 구독을 해제하므로 여기까지의 구간은 정리할 필요가 없습니다.
+            waited = index + 1
+            attempt = 0
+            while True:
+                try:
+                    videos = wait_for_videos(*pending[index])
+                    result = select_video_file(videos)
+                    if "error" in result:
+                        raise PromptExecutionError(result["error"])
+                    clip_paths.append(result["video_file"])
+                    break
+                except PromptExecutionError as e:
+                    attempt += 1
+                    if attempt > retries:
+                        raise PromptExecutionError(f"구간 {index + 1}/{len(segments)} 실행 실패: {e}")
+                    logger.warning(f"구간 {index + 1}/{len(segments)} 실패, 재시도 {attempt}/{retries}: {e}")
+                    pending[index] = submit_segment(index)
+            logger.info(f"✅ 구간 {index + 1}/{len(segments)} 완료: {clip_paths[-1]}")
+    finally:
+        # 실패로 끝났다면 기다리지 않은 구간이 job이 끝난 뒤에도 GPU를 쓰거나 이벤트를 쌓지 않도록 정리합니다.
+        leftover = pending[waited:]
+        if leftover:
+            cancel_prompts([tracker.prompt_id for tracker, _ in leftover])
+            for tracker, _ in leftover:
+                tracker.finish()
+                comfy_connection.unsubscribe(tracker.prompt_id)
+
+    output_path = f"{os.path.splitext(clip_paths[0])[0]}_stitched.mp4"
+    with timed("stitch", segments=len(clip_paths)):
+        stitch_segments(clip_paths, overlap / fps, output_path)
+    return {
+        "video_file": output_path,
+        "segments": [{"start_frame": start, "frames": length} for start, length in segments],
+    }
+
+
+# 목록으로 보내면 변형을 만드는 job 필드. 모두 샘플러(27)와 텍스트 인코딩(65) 노드의 입력입니다.
+VARIANT_FIELDS = ("prompt", "negative_prompt", "seed", "cfg", "steps")
+
+
+def use_variants(job_input):
+    return any(isinstance(job_input.get(field), list) for field in VARIANT_FIELDS)
+
+
+def expand_variants(job_input):
+    """목록으로 온 VARIANT_FIELDS 값의 모든 조합을 변형 목록 [{필드: 값}, ...]으로 반환합니다."""
+    fields = [field for field in VARIANT_FIELDS if isinstance(job_input.get(field), list)]
+    if any(not job_input[field] for field in fields):
+        raise WorkflowBindingError("변형 목록은 비어 있을 수 없습니다.")
+    count = math.prod(len(job_input[field]) for field in fields)
+    if count > MAX_VARIANTS:
+        raise WorkflowBindingError(f"변형 수({count})가 최대값({MAX_VARIANTS})을 넘습니다.")
+    if job_input.get("segment_frames"):
+        raise WorkflowBindingError("구간 분할 job에서는 변형 목록을 사용할 수 없습니다.")
+    return [dict(zip(fields, values)) for values in itertools.product(*(job_input[field] for field in fields))]
+
+
+def render_variant(prompt, variant):
+    """prompt에서 변형 필드의 노드 입력만 바꾼 새 prompt를 만듭니다. 원래 prompt는 변경하지 않습니다."""
+    bindings = {field: COMMON_BINDINGS[field] for field in variant}
+    variant_prompt = dict(prompt)
+    for field, value in bind_values(bindings, variant).items():
+        for node_id, input_name in bindings[field]["targets"]:
+            set_prompt_input(variant_prompt, prompt, node_id, input_name, value)
+    return variant_prompt
+
+
+def variant_timing(tracker):
+    """변형 prompt 하나의 큐 대기 시간과 실제 실행 시간을 반환합니다."""
+    if tracker.span is None:
+        return None
+    queue_seconds = sum(child.seconds for child in tracker.span.children if child.name == "queue_wait")
+    return {
+        "seconds": round(tracker.span.seconds - queue_seconds, 3),
+        "queue_seconds": round(queue_seconds, 3),
+        "cached_nodes": len(tracker.cached_nodes),
+    }
+
+
+def run_variants(job):
+    """
+    seed/프롬프트/cfg/steps만 다른 변형 prompt들을 한 job에서 한 번에 큐에 넣고, 결과를 변형 순서대로 반환합니다.
+    나머지 노드는 입력이 같으므로 ComfyUI 노드 캐시가 첫 변형의 결과(모델 로드, 입력 전처리, 포즈/마스크)를 재사용해
+    두 번째 변형부터는 텍스트 인코딩(프롬프트가 다를 때), 샘플러, 디코딩만 실행됩니다.
+    """
+    job_input = job.get("input", {})
+    try:
+        variants = expand_variants(job_input)
+        with timed("prepare"):
+            prompt = prepare_prompt(dict(job, input=dict(job_input, **variants[0])))
+    except WorkflowBindingError as e:
+        logger.error(f"❌ 잘못된 입력: {e}")
+        return {"error": str(e)}
+    logger.info(f"🎲 변형 {len(variants)}개: {', '.join(field for field in VARIANT_FIELDS if field in variants[0])}")
+
+    with timed("comfyui_connect"):
+        comfy_connection.ensure_connected()
+    pending = None
+    vram_plan = None
+    try:
+        if use_preprocess_cache(job):
+            with timed("preprocess_cache"):
+                prompt, pending = preprocess_cache.plan(prompt)
+        if use_vram_tuning(job):
+            # 변형은 크기가 같으므로 설정도 같습니다.
+            with timed("vram_plan"):
+                prompt, vram_plan = vram_tuner.plan(prompt)
+        prompts = [render_variant(prompt, variant) for variant in variants]
+        for variant_prompt in prompts[1:]:
+            if text_embed_cache is not None and variant_prompt["65"] is not prompt["65"]:
+                text_embed_cache.prepare(variant_prompt, prompt)
+            if pending:
+                # 전처리 결과는 첫 변형에서만 저장합니다.
+                for save_id in pending["saves"]:
+                    del variant_prompt[save_id]
+                prune_prompt(variant_prompt)
+
+        results = []
+        with timed("execute"), track_compile_cache(prompts[0]), track_vram(vram_plan):
+            # 모든 변형을 먼저 큐에 넣은 뒤 순서대로 결과를 기다립니다.
+            submitted = [
+                submit_prompt(variant_prompt, job, f"variant_{index + 1}")
+                for index, variant_prompt in enumerate(prompts)
+            ]
+            for index, (tracker, messages) in enumerate(submitted):
+                try:
+                    videos = wait_for_videos(tracker, messages)
+                    if index == 0 and pending:
+                        preprocess_cache.store(pending, videos)
+                    result = select_video_file(videos)
+                except PromptExecutionError as e:
+                    logger.error(f"❌ 변형 {index + 1}/{len(variants)} 실행 실패: {e}")
+                    result = {"error": str(e)}
+                result = dict(variants[index], **result)
+                if TIMING_IN_OUTPUT and tracker.span is not None:
+                    result["timing"] = variant_timing(tracker)
+                results.append(result)
+                logger.info(f"✅ 변형 {index + 1}/{len(variants)} 완료: {result.get('video_file', result.get('error'))}")
+    except (PromptExecutionError, WorkflowBindingError) as e:
+        logger.error(f"❌ ComfyUI 실행 실패: {e}")
+        return {"error": str(e)}
+    finally:
+        logger.info(f"ComfyUI 연결 통계: {comfy_connection.get_stats()}")
+
+    if all("error" in result for result in results):
+        return {"error": f"모든 변형 실행 실패: {results[0]['error']}"}
+    return {"variants": results}
+
+
+def execute_prompt(prompt, job):
+    """prompt를 ComfyUI에서 실행하고 {"video_file": 경로} 또는 {"error": 메시지}를 반환합니다."""
+    with timed("comfyui_connect"):
+        comfy_connection.ensure_connected()
+    pending = None
+    vram_plan = None
+    try:
+        if use_preprocess_cache(job):
+            with timed("preprocess_cache"):
+                prompt, pending = preprocess_cache.plan(prompt)
+        if use_vram_tuning(job):
+            with timed("vram_plan"):
+                prompt, vram_plan = vram_tuner.plan(prompt)
+        with timed("execute"), track_compile_cache(prompt), track_vram(vram_plan):
+            if job.get("input", {}).get("segment_frames"):
+                return run_segmented_workflow(prompt, job)
+            videos = get_videos(prompt, job)
+        if pending:
+            preprocess_cache.store(pending, videos)
+    except (PromptExecutionError, WorkflowBindingError) as e:
+        logger.error(f"❌ ComfyUI 실행 실패: {e}")
+        return {"error": str(e)}
+    finally:
+        logger.info(f"ComfyUI 연결 통계: {comfy_connection.get_stats()}")
+
+    return select_video_file(videos)
+
+
+def use_result_cache(job):
+    return result_cache is not None and job.get("input", {}).get("result_cache", True) is not False
+
+
+def request_fingerprint_hint(job_input):
+    """클라이언트가 보낸 요청 지문을 반환합니다. 파일 이름에 쓰이므로 sha256 hex가 아니면 무시합니다."""
+    fingerprint = job_input.get("request_fingerprint")
+    if fingerprint is None:
+        return None
+    if not isinstance(fingerprint, str) or not re.fullmatch(r'[0-9a-f]{64}', fingerprint):
+        logger.warning(f"올바르지 않은 request_fingerprint를 무시합니다: {fingerprint!r}")
+        return None
+    return fingerprint
+
+
+def run_workflow(job):
+    """job 입력으로 워크플로우를 실행하고 {"video_file": 경로} 또는 {"error": 메시지}를 반환합니다."""
+    job_input = job.get("input", {})
+    error = output_mode_error(job_input)
+    if error:
+        return {"error": error}
+    if job_input.get("mode") == "preprocess":
+        return run_preprocess(job)
+    if use_variants(job_input):
+        # 변형마다 결과가 다르므로 결과 캐시를 사용하지 않습니다.
+        return run_variants(job)
+    hint = request_fingerprint_hint(job_input) if use_result_cache(job) else None
+    if hint:
+        # 클라이언트가 보낸 요청 지문은 검증할 수 없으므로 입력을 받기 전에 같은 요청을 기다리는 데만 쓰고,
+        # 결과는 입력을 받은 뒤 서버에서 계산한 지문으로 조회합니다.
+        return result_cache.coalesce(hint, lambda: _run_workflow(job, True))
+    return _run_workflow(job, use_result_cache(job))
+
+
+def _run_workflow(job, with_cache):
+    try:
+        with timed("prepare"):
+            prompt = prepare_prompt(job)
+    except WorkflowBindingError as e:
+        logger.error(f"❌ 잘못된 입력: {e}")
+        return {"error": str(e)}
+
+    if not with_cache:
+        return execute_prompt(prompt, job)
+    with timed("fingerprint"):
+        fingerprint = prompt_fingerprint(prompt, job.get("input", {}))
+    result = result_cache.get_or_run(fingerprint, lambda: execute_prompt(prompt, job))
+    logger.info(f"결과 캐시 통계: {result_cache.get_stats()}")
+    return result
+
+
+async def execute_prompt_async(prompt, job):
+    """execute_prompt의 asyncio 버전입니다."""
+    with timed("comfyui_connect"):
+        await asyncio.to_thread(comfy_connection.ensure_connected)
+    pending = None
+    vram_plan = None
+    try:
+        if use_preprocess_cache(job):
+            with timed("preprocess_cache"):
+                prompt, pending = await asyncio.to_thread(preprocess_cache.plan, prompt)
+        if use_vram_tuning(job):
+            with timed("vram_plan"):
+                prompt, vram_plan = await asyncio.to_thread(vram_tuner.plan, prompt)
+        with timed("execute"), track_compile_cache(prompt), track_vram(vram_plan):
+            if job.get("input", {}).get("segment_frames"):
+                return await asyncio.to_thread(run_segmented_workflow, prompt, job)
+            videos = await get_videos_async(prompt, job)
+        if pending:
+            await asyncio.to_thread(preprocess_cache.store, pending, videos)
+    except (PromptExecutionError, WorkflowBindingError) as e:
+        logger.error(f"❌ ComfyUI 실행 실패: {e}")
+        return {"error": str(e)}
+    finally:
+        logger.info(f"ComfyUI 연결 통계: {comfy_connection.get_stats()}")
+
+    return select_video_file(videos)
+
+
+async def run_workflow_async(job):
+    """
+    run_workflow의 asyncio 버전입니다. 입력 다운로드/디코딩은 스레드에서 수행되어
+    다른 job의 GPU 실행과 겹쳐서 진행됩니다.
+    """
+    error = output_mode_error(job.get("input", {}))
+    if error:
+        return {"error": error}
+    if job.get("input", {}).get("mode") == "preprocess":
+        return await asyncio.to_thread(run_preprocess, job)
+    if use_variants(job.get("input", {})):
+        return await asyncio.to_thread(run_variants, job)
+    loop = asyncio.get_running_loop()
+
+    def cached(fingerprint, run_async):
+        # 결과 캐시 대기는 스레드에서 하고, 실제 실행은 이벤트 루프에서 진행합니다.
+        return asyncio.to_thread(
+            result_cache.get_or_run, fingerprint,
+            lambda: asyncio.run_coroutine_threadsafe(run_async(), loop).result()
+        )
+
+    job_input = job.get("input", {})
+    with_cache = use_result_cache(job)
+
+    async def prepare_and_execute():
+        try:
+            with timed("prepare"):
+                prompt = await asyncio.to_thread(prepare_prompt, job)
+        except WorkflowBindingError as e:
+            logger.error(f"❌ 잘못된 입력: {e}")
+            return {"error": str(e)}
+        if not with_cache:
+            return await execute_prompt_async(prompt, job)
+        with timed("fingerprint"):
+            prompt_key = await asyncio.to_thread(prompt_fingerprint, prompt, job_input)
+        return await cached(prompt_key, lambda: execute_prompt_async(prompt, job))
+
+    hint = request_fingerprint_hint(job_input) if with_cache else None
+    if hint:
+        # 클라이언트가 보낸 요청 지문은 같은 요청을 기다리는 데만 쓰고, 결과는 서버에서 계산한 지문으로 조회합니다.
+        return await asyncio.to_thread(
+            result_cache.coalesce, hint,
+            lambda: asyncio.run_coroutine_threadsafe(prepare_and_execute(), loop).result()
+        )
+    return await prepare_and_execute()
+
+
+def build_response(result, delivered):
+    """전달 결과에 워크플로우 실행 결과의 부가 정보(구간 정보 등)를 합칩니다."""
+    response = dict(delivered)
+    response.update({key: value for key, value in result.items() if key != "video_file"})
+    return response
+
+
+def deliver_variants(result, job, output_mode=None):
+    """변형별 결과 비디오를 각각 전달하고, 변형 목록의 video_file을 전달 결과로 바꿉니다."""
+    variants = []
+    for variant in result["variants"]:
+        if "video_file" in variant:
+            variant = build_response(variant, deliver_output(variant["video_file"], job, output_mode))
+        variants.append(variant)
+    return dict(result, variants=variants)
+
+
+def with_timing(response, root):
+    """응답에 선택된 형태 버킷을 붙이고, TIMING_IN_OUTPUT이면 단계별 시간 요약도 붙입니다."""
+    shape_bucket = next((span.attrs["shape_bucket"] for _, span in root.walk() if "shape_bucket" in span.attrs), None)
+    if shape_bucket is not None and "error" not in response:
+        response = dict(response, shape_bucket=shape_bucket)
+    if not TIMING_IN_OUTPUT:
+        return response
+    return dict(response, timing=timing_summary(root))
+
+
+def handler(job):
+    with job_timing(job) as root, job_work_dir():
+        result = run_workflow(job)
+        if "error" not in result:
+            # 변형 목록은 변형마다 전달하고, mode=preprocess 결과(asset_id)는 전달할 비디오가 없습니다.
+            output_mode = job.get("input", {}).get("output_mode")
+            if "video_file" in result:
+                with timed("deliver"):
+                    result = build_response(result, deliver_output(result["video_file"], job, output_mode))
+            elif "variants" in result:
+                with timed("deliver"):
+                    result = deliver_variants(result, job, output_mode)
+            root.attrs["status"] = "success"
+    return with_timing(result, root)
+
+
+async def async_handler(job):
+    """
+    여러 job을 한 워커에서 동시에 처리하는 비동기 핸들러입니다.
+    한 job이 GPU에서 실행되는 동안 다음 job의 입력 준비와 이전 job의 출력 업로드가 함께 진행되고,
+    ComfyUI 큐에는 다음 prompt가 미리 들어가 있게 됩니다.
+    """
+    with job_timing(job) as root, job_work_dir():
+        result = await run_workflow_async(job)
+        if "error" not in result:
+            output_mode = job.get("input", {}).get("output_mode")
+            if "video_file" in result:
+                with timed("deliver"):
+                    delivered = await asyncio.to_thread(deliver_output, result["video_file"], job, output_mode)
+                result = build_response(result, delivered)
+            elif "variants" in result:
+                with timed("deliver"):
+                    result = await asyncio.to_thread(deliver_variants, result, job, output_mode)
+            root.attrs["status"] = "success"
+    return with_timing(result, root)
+
+
+def concurrency_modifier(current_concurrency):
+    return MAX_CONCURRENCY
+
+
+def stream_handler(job):
+    """OUTPUT_STREAMING=true 일 때 사용하는 generator 핸들러입니다. 결과 비디오를 base64 청크로 나누어 전달합니다."""
+    output_mode = job.get("input", {}).get("output_mode", "stream")
+    # generator는 yield 사이에 컨텍스트가 바뀔 수 있으므로 yield 전에 측정을 끝냅니다.
+    with job_timing(job) as root, job_work_dir():
+        result = run_workflow(job)
+        if "error" not in result:
+            if output_mode != "stream" and "video_file" in result:
+                with timed("deliver"):
+                    result = build_response(result, deliver_output(result["video_file"], job, output_mode))
+            elif "variants" in result:
+                # 변형 목록은 하나의 스트림으로 보낼 수 없으므로 stream 모드면 auto로 전달합니다.
+                with timed("deliver"):
+                    result = deliver_variants(result, job, "auto" if output_mode == "stream" else output_mode)
+            root.attrs["status"] = "success"
+    if "error" in result or output_mode != "stream" or "video_file" not in result:
+        yield with_timing(result, root)
+        return
+    chunks = stream_output(result["video_file"])
+    yield with_timing(next(chunks), root)
+    yield from chunks
+
+
+warmup_state = {"status": "pending", "seconds": 0.0, "workflows": {}}
+metrics.add_collector(lambda: {
+    "warmup_seconds": warmup_state["seconds"],
+    "warmup_success": float(warmup_state["status"] == "success"),
+})
+
+
+def build_warmup_prompt(name, width=WARMUP_WIDTH, height=WARMUP_HEIGHT, frames=WARMUP_FRAMES):
+    """
+    예열용 prompt를 실제 워크플로우 템플릿으로 만듭니다.
+    모델 로더 노드의 입력은 실제 job과 같으므로 ComfyUI가 로드한 모델을 그대로 재사용하고,
+    해상도/프레임 수/스텝 수만 줄여 GPU 시간은 최소로 합니다.
+    """
+    mode, _, suffix = name.partition("_")
+    job_input = {
+        "mode": mode,
+        "prompt": "warmup",
+        "seed": 0,
+        "cfg": 1.0,
+        "fps": 16,
+        "steps": WARMUP_STEPS,
+        "width": width,
+        "height": height,
+        "image_path": WARMUP_IMAGE,
+        "video_path": WARMUP_VIDEO,
+    }
+    if suffix == "points":
+        center = [{"x": width / 2, "y": height / 2}]
+        negative = [{"x": 0, "y": 0}]
+        job_input.update(
+            points_store=json.dumps({"positive": center, "negative": negative}),
+            coordinates=json.dumps(center),
+            neg_coordinates=json.dumps(negative),
+        )
+    elif suffix:
+        raise WorkflowBindingError(f"알 수 없는 예열 워크플로우: {name}")
+    template = workflow_registry.select(job_input)
+    prompt = template.render(job_input)
+    if frames is None:
+        # 프레임 창 하나를 꽉 채워 실제 job과 같은 형태로 컴파일되게 합니다.
+        frames = prompt["198"]["inputs"]["frame_window_size"]
+    set_prompt_input(prompt, template.nodes, "63", "frame_load_cap", frames)
+    return prompt
+
+
+def run_warmup_prompt(name, prompt):
+    """예열 prompt 하나를 실행하고 결과 파일은 지웁니다."""
+    with timed(name) as span, track_compile_cache(prompt):
+        videos = get_videos(prompt)
+    warmup_state["workflows"][name] = round(span.seconds, 3)
+    for paths in videos.values():
+        for path in paths:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+def warmup():
+    """
+    워커가 job을 받기 전에 예열 워크플로우를 실행합니다.
+    노드별 시간(모델 로드, 텍스트 인코딩, 포즈 검출, torch.compile 등)을 기록하고, 실패해도 워커는 계속 시작합니다.
+    """
+    root = Span("warmup")
+    token = current_span.set(root)
+    try:
+        with timed("comfyui_connect"):
+            comfy_connection.ensure_connected()
+        for name in WARMUP_WORKFLOWS:
+            logger.info(f"🔥 예열 워크플로우 실행: {name} ({WARMUP_WIDTH}x{WARMUP_HEIGHT}, {WARMUP_FRAMES}프레임, {WARMUP_STEPS}스텝)")
+            run_warmup_prompt(name, build_warmup_prompt(name))
+        if compile_cache is not None:
+            # 자주 쓰는 해상도를 영구 컴파일 캐시에 미리 채웁니다. 이미 실행된 형태는 건너뜁니다.
+            name = WARMUP_WORKFLOWS[0] if WARMUP_WORKFLOWS else "replace"
+            known = compile_cache.known_shapes()
+            for size in COMPILE_CACHE_SHAPES:
+                width, height = (int(value) for value in size.lower().split("x"))
+                prompt = build_warmup_prompt(name, width, height, frames=None)
+                if compile_shape(prompt) in known:
+                    continue
+                logger.info(f"🧩 컴파일 캐시 채우기: {compile_shape(prompt)}")
+                run_warmup_prompt(f"compile_{size}", prompt)
+        warmup_state["status"] = "success"
+    except Exception as e:
+        warmup_state["status"] = "failed"
+        logger.error(f"❌ 예열 실패 (워커는 계속 시작합니다): {e}")
+    finally:
+        root.finish()
+        current_span.reset(token)
+        warmup_state["seconds"] = round(root.seconds, 3)
+        logger.info(f"🔥 예열 타이밍: {json.dumps(timing_summary(root), ensure_ascii=False)}")
+
+
+def serverless_config():
+    """OUTPUT_STREAMING / MAX_CONCURRENCY 설정에 맞는 runpod.serverless.start 설정을 반환합니다."""
+    if OUTPUT_STREAMING:
+        return {"handler": stream_handler, "return_aggregate_stream": True}
+    if MAX_CONCURRENCY > 1:
+        return {"handler": async_handler, "concurrency_modifier": concurrency_modifier}
+    return {"handler": handler}
 
-    # 이미지가 없는 경우 처리
-    for node_id in videos:
-        if videos[node_id]:
-            return {"video": videos[node_id][0]}
-    
-    return {"error": "비디오를를 찾을 수 없습니다."}
 
-runpod.serverless.start({"handler": handler})
\ No newline at end of file
+# import만 할 때(벤치마크 등)는 워커를 시작하지 않습니다.
+if __name__ == "__main__":
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+    if WARMUP_ENABLED:
+        # runpod.serverless.start 전에 실행하므로 예열이 끝나야 워커가 job을 받기 시작합니다.
+        warmup()
+    runpod.serverless.start(serverless_config())
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# handler는 import 시점에 환경 변수를 읽고 캐시 디렉터리를 만들므로, import 전에 임시 경로로 돌려 둡니다.
+os.environ.setdefault("CACHE_ROOT", tempfile.mkdtemp(prefix="wananimate_test_cache_"))
+os.environ.setdefault("METRICS_FILE", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
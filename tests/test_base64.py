@@ -0,0 +1,41 @@
+import base64
+import binascii
+
+import pytest
+
+from handler import decode_base64_to_file, iter_base64_decoded
+
+RAW = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 40
+ENCODED = base64.b64encode(RAW).decode()
+
+
+def wrap(text, width=76):
+    return "\n".join(text[i:i + width] for i in range(0, len(text), width))
+
+
+@pytest.mark.parametrize("data", [
+    ENCODED,
+    ENCODED.encode(),
+    wrap(ENCODED),
+    wrap(ENCODED).encode(),
+    "data:video/mp4;base64," + ENCODED,
+    ENCODED + "\n",
+])
+@pytest.mark.parametrize("chunk_chars", [4, 400, 401, 1 << 20])
+def test_decodes_in_chunks(data, chunk_chars):
+    assert b"".join(iter_base64_decoded(data, chunk_chars)) == RAW
+
+
+@pytest.mark.parametrize("data", [ENCODED[:-1], ENCODED[:-4] + "!!!!", ENCODED[:8] + "한"])
+def test_rejects_invalid_input(data):
+    with pytest.raises(binascii.Error):
+        b"".join(iter_base64_decoded(data, 400))
+
+
+def test_decode_to_file_checks_expected_kind(tmp_path):
+    path = tmp_path / "input_image.jpg"
+    with pytest.raises(ValueError, match="mp4"):
+        decode_base64_to_file(ENCODED, str(path), expected_kind="image")
+    assert not path.exists()
+    decode_base64_to_file(ENCODED, str(tmp_path / "input_video.mp4"), expected_kind="video")
+    assert (tmp_path / "input_video.mp4").read_bytes() == RAW
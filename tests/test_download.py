@@ -0,0 +1,101 @@
+import http.server
+import re
+import threading
+
+import pytest
+
+import handler
+from handler import download_file_from_url
+
+CONTENT = bytes(range(256)) * 64
+
+
+class FileServer(http.server.ThreadingHTTPServer):
+    """CONTENT를 제공하는 테스트 서버. fail_ranges에 상태 코드를 넣으면 Range GET에 그 코드로 응답합니다."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FileHandler)
+        self.accept_ranges = True
+        self.fail_ranges = None
+        self.requests = []
+
+
+class FileHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(CONTENT)))
+        if self.server.accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        self.server.requests.append(self.headers.get("Range"))
+        if match and self.server.fail_ranges:
+            self.send_response(self.server.fail_ranges)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if match and self.server.accept_ranges:
+            start = int(match.group(1))
+            end = int(match.group(2) or len(CONTENT) - 1)
+            body = CONTENT[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(CONTENT)}")
+        else:
+            body = CONTENT
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(handler, "DOWNLOAD_PART_BYTES", 1024)
+    monkeypatch.setattr(handler, "DOWNLOAD_RETRY_DELAY", 0)
+    server = FileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_port}/input.mp4"
+
+
+def test_large_file_is_downloaded_in_parallel_ranges(server, tmp_path):
+    output = tmp_path / "input.mp4"
+    download_file_from_url(url(server), str(output))
+    assert output.read_bytes() == CONTENT
+    assert len(server.requests) == len(CONTENT) // 1024
+
+
+def test_server_without_ranges_uses_single_stream(server, tmp_path):
+    server.accept_ranges = False
+    output = tmp_path / "input.mp4"
+    download_file_from_url(url(server), str(output))
+    assert output.read_bytes() == CONTENT
+    assert server.requests == [None]
+
+
+def test_client_errors_are_not_retried(server, tmp_path):
+    server.fail_ranges = 403
+    with pytest.raises(Exception, match="403"):
+        download_file_from_url(url(server), str(tmp_path / "input.mp4"))
+    # 구간마다 한 번씩만 요청합니다.
+    assert len(server.requests) <= len(CONTENT) // 1024
+
+
+def test_server_errors_are_retried(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(handler, "DOWNLOAD_PART_BYTES", len(CONTENT) // 2)
+    monkeypatch.setattr(handler, "DOWNLOAD_WORKERS", 1)
+    server.fail_ranges = 503
+    with pytest.raises(Exception, match="구간 다운로드 실패"):
+        download_file_from_url(url(server), str(tmp_path / "input.mp4"))
+    assert len(server.requests) == 2 * handler.DOWNLOAD_RETRIES
@@ -0,0 +1,52 @@
+import base64
+import os
+import time
+
+import pytest
+
+from handler import InputCache, decode_base64_to_file
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return InputCache(str(tmp_path / "inputs"), max_bytes=1024)
+
+
+def test_base64_input_is_decoded_once(cache, tmp_path):
+    data = base64.b64encode(b"x" * 100).decode()
+    decoded = []
+
+    def decode(base64_data, path):
+        decoded.append(path)
+        return decode_base64_to_file(base64_data, path)
+
+    cache.fetch_base64(data, str(tmp_path / "a.mp4"), decode)
+    cache.fetch_base64(data, str(tmp_path / "b.mp4"), decode)
+
+    assert decoded == [str(tmp_path / "a.mp4")]
+    assert (tmp_path / "b.mp4").read_bytes() == b"x" * 100
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["bytes_saved"]) == (1, 1, 100)
+
+
+def test_identical_content_is_stored_once(cache, tmp_path):
+    for name in ("a", "b"):
+        data = base64.b64encode(b"same").decode() + "\n" * (name == "b")
+        cache.fetch_base64(data, str(tmp_path / f"{name}.mp4"), decode_base64_to_file)
+    assert len(os.listdir(tmp_path / "inputs" / "objects")) == 1
+
+
+def test_least_recently_used_objects_are_evicted(cache, tmp_path):
+    for index in range(3):
+        data = base64.b64encode(bytes([index]) * 400).decode()
+        cache.fetch_base64(data, str(tmp_path / f"{index}.mp4"), decode_base64_to_file)
+        time.sleep(0.01)
+    objects = os.listdir(tmp_path / "inputs" / "objects")
+    assert len(objects) == 2
+    assert cache.get_stats()["evictions"] == 1
+
+    # 지워진 객체의 색인은 남아 있어도 다시 디코딩합니다.
+    decoded = []
+    data = base64.b64encode(bytes([0]) * 400).decode()
+    cache.fetch_base64(data, str(tmp_path / "again.mp4"), lambda b, p: decoded.append(p) or decode_base64_to_file(b, p))
+    assert decoded == [str(tmp_path / "again.mp4")]
@@ -0,0 +1,78 @@
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+import handler
+from handler import pack_mask_video, unpack_mask_video
+
+
+@pytest.fixture
+def ffmpeg(monkeypatch):
+    path = shutil.which(handler.FFMPEG_PATH)
+    if path is None:
+        try:
+            import imageio_ffmpeg
+            path = imageio_ffmpeg.get_ffmpeg_exe()
+        except (ImportError, RuntimeError):
+            pytest.skip("ffmpeg를 찾을 수 없습니다.")
+    monkeypatch.setattr(handler, "FFMPEG_PATH", path)
+    return path
+
+
+@pytest.fixture
+def masks():
+    rng = np.random.default_rng(0)
+    # 가로가 8의 배수가 아니어도 비트맵을 정확히 되돌려야 합니다.
+    return (rng.random((5, 24, 30)) > 0.5).astype(np.uint8) * 255
+
+
+def write_mask_video(ffmpeg, masks, path):
+    frames, height, width = masks.shape
+    rgb = np.repeat(masks[..., None], 3, axis=-1)
+    subprocess.run(
+        [ffmpeg, '-y', '-v', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-i', '-',
+         '-c:v', 'ffv1', '-pix_fmt', 'bgr0', '-f', 'matroska', path],
+        input=rgb.tobytes(), check=True,
+    )
+
+
+def test_pack_stores_one_bitmap_per_frame(ffmpeg, masks, tmp_path):
+    video = str(tmp_path / "mask.mkv")
+    write_mask_video(ffmpeg, masks, video)
+    pack_mask_video(video, str(tmp_path / "mask.npz"))
+    with np.load(tmp_path / "mask.npz") as data:
+        assert tuple(data["shape"]) == masks.shape
+        unpacked = np.unpackbits(data["bits"], axis=-1, count=masks.shape[2]) * np.uint8(255)
+    assert np.array_equal(unpacked, masks)
+
+
+def test_unpack_round_trips_through_video(ffmpeg, masks, tmp_path):
+    video = str(tmp_path / "mask.mkv")
+    write_mask_video(ffmpeg, masks, video)
+    pack_mask_video(video, str(tmp_path / "mask.npz"))
+    unpack_mask_video(str(tmp_path / "mask.npz"), str(tmp_path / "decoded.mkv"))
+    pack_mask_video(str(tmp_path / "decoded.mkv"), str(tmp_path / "decoded.npz"))
+    with np.load(tmp_path / "mask.npz") as original, np.load(tmp_path / "decoded.npz") as decoded:
+        assert np.array_equal(original["bits"], decoded["bits"])
+    assert sorted(os.listdir(tmp_path)) == ["decoded.mkv", "decoded.npz", "mask.mkv", "mask.npz"]
+
+
+def test_pack_reports_ffmpeg_failure(ffmpeg, tmp_path):
+    with pytest.raises(subprocess.CalledProcessError):
+        pack_mask_video(str(tmp_path / "missing.mkv"), str(tmp_path / "mask.npz"))
+    assert not (tmp_path / "mask.npz").exists()
+
+
+def test_unpack_removes_partial_output_on_failure(tmp_path, monkeypatch):
+    # 출력 파일을 일부만 쓰고 실패하는 ffmpeg
+    fake_ffmpeg = tmp_path / "ffmpeg"
+    fake_ffmpeg.write_text('#!/bin/sh\ncat > /dev/null\nfor last; do :; done\necho partial > "$last"\nexit 1\n')
+    fake_ffmpeg.chmod(0o755)
+    monkeypatch.setattr(handler, "FFMPEG_PATH", str(fake_ffmpeg))
+    np.savez_compressed(tmp_path / "mask.npz", bits=np.zeros((2, 4, 1), np.uint8), shape=np.array((2, 4, 8)))
+    with pytest.raises(subprocess.CalledProcessError):
+        unpack_mask_video(str(tmp_path / "mask.npz"), str(tmp_path / "mask.mkv"))
+    assert sorted(os.listdir(tmp_path)) == ["ffmpeg", "mask.npz"]
@@ -0,0 +1,165 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from handler import ResultCache, prompt_fingerprint
+from wananimate_s3_client import WanAnimateClientBase
+
+
+def make_prompt(image_path, video_path, seed=1):
+    return {
+        "57": {"class_type": "LoadImage", "inputs": {"image": image_path}},
+        "63": {"class_type": "VHS_LoadVideo", "inputs": {"video": video_path, "force_rate": 16}},
+        "27": {"class_type": "Sampler", "inputs": {"seed": seed}},
+    }
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    paths = {}
+    for name, content in (("image", b"image-bytes"), ("video", b"video-bytes")):
+        for job in ("a", "b"):
+            path = tmp_path / job / f"input_{name}"
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(content)
+            paths[name, job] = str(path)
+    return paths
+
+
+def test_fingerprint_ignores_per_job_file_paths(inputs):
+    prompt_a = make_prompt(inputs["image", "a"], inputs["video", "a"])
+    prompt_b = make_prompt(inputs["image", "b"], inputs["video", "b"])
+    assert prompt_fingerprint(prompt_a, {}) == prompt_fingerprint(prompt_b, {})
+
+
+def test_fingerprint_changes_with_parameters_and_content(inputs, tmp_path):
+    prompt = make_prompt(inputs["image", "a"], inputs["video", "a"])
+    fingerprint = prompt_fingerprint(prompt, {})
+    assert prompt_fingerprint(make_prompt(inputs["image", "a"], inputs["video", "a"], seed=2), {}) != fingerprint
+    assert prompt_fingerprint(prompt, {"segment_frames": 81}) != fingerprint
+    other_video = tmp_path / "other_video"
+    other_video.write_bytes(b"other-video-bytes")
+    assert prompt_fingerprint(make_prompt(inputs["image", "a"], str(other_video)), {}) != fingerprint
+
+
+def test_fingerprint_does_not_modify_prompt(inputs):
+    prompt = make_prompt(inputs["image", "a"], inputs["video", "a"])
+    loader = prompt["63"]
+    prompt_fingerprint(prompt, {})
+    assert prompt["63"] is loader
+    assert loader["inputs"]["video"] == inputs["video", "a"]
+
+
+@pytest.fixture
+def result_cache(tmp_path):
+    return ResultCache(str(tmp_path / "results"), max_bytes=1024, ttl=3600, lock_timeout=60, poll_interval=0.01)
+
+
+def write_video(tmp_path, name, size=10):
+    path = tmp_path / name
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+
+def test_result_cache_stores_and_returns_result(result_cache, tmp_path):
+    video = write_video(tmp_path, "out.mp4")
+    result = result_cache.get_or_run("f1", lambda: {"video_file": video, "segments": [1]})
+    assert result["cache_hit"] is False
+    cached = result_cache.get_or_run("f1", lambda: pytest.fail("cached result should be reused"))
+    assert cached["cache_hit"] is True
+    assert cached["segments"] == [1]
+    assert open(cached["video_file"], "rb").read() == b"x" * 10
+
+
+def test_result_cache_does_not_store_errors(result_cache):
+    assert result_cache.get_or_run("f1", lambda: {"error": "boom"}) == {
+        "error": "boom", "request_fingerprint": "f1", "cache_hit": False
+    }
+    assert result_cache.lookup("f1") is None
+
+
+def test_result_cache_runs_identical_requests_once(result_cache, tmp_path):
+    video = write_video(tmp_path, "out.mp4")
+    started = threading.Event()
+    runs = []
+
+    def run():
+        runs.append(1)
+        started.set()
+        time.sleep(0.2)
+        return {"video_file": video}
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(result_cache.get_or_run("f1", run)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(result_cache.get_or_run("f1", run)))
+    second.start()
+    first.join(5)
+    second.join(5)
+
+    assert len(runs) == 1
+    assert sorted(result["cache_hit"] for result in results) == [False, True]
+    assert result_cache.get_stats()["coalesced"] == 1
+
+
+def test_result_cache_releases_lock_when_run_fails(result_cache):
+    def run():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        result_cache.get_or_run("f1", run)
+    assert result_cache._acquire("f1")
+
+
+def test_result_cache_evicts_least_recently_used(result_cache, tmp_path):
+    for index in range(3):
+        video = write_video(tmp_path, f"out{index}.mp4", size=400)
+        result_cache.store(f"f{index}", {"video_file": video})
+        time.sleep(0.01)
+    # 1024 bytes에는 두 개만 들어가므로 가장 오래 사용하지 않은 f0이 지워집니다.
+    assert result_cache.lookup("f0") is None
+    assert result_cache.lookup("f1") is not None
+    assert result_cache.lookup("f2") is not None
+
+
+def test_result_cache_expires_entries(tmp_path):
+    cache = ResultCache(str(tmp_path / "results"), max_bytes=1024, ttl=0, lock_timeout=60)
+    cache.store("f1", {"video_file": write_video(tmp_path, "out.mp4")})
+    time.sleep(0.01)
+    assert cache.lookup("f1") is None
+
+
+@pytest.fixture
+def client():
+    return WanAnimateClientBase(
+        "endpoint", "key", "http://s3.invalid", "access", "secret", "bucket", inflight_ttl=60
+    )
+
+
+def test_client_reuses_in_flight_request(client):
+    pending, owner = client._claim_fingerprint("fp", Future)
+    assert owner
+    assert client._claim_fingerprint("fp", Future) == (pending, False)
+    client._release_fingerprint("fp", "job-1")
+    client._forget_job("job-1")
+    assert client._claim_fingerprint("fp", Future)[1]
+
+
+def test_client_forgets_failed_submission(client):
+    client._claim_fingerprint("fp", Future)
+    client._release_fingerprint("fp", None)
+    assert client._inflight_jobs == {}
+    assert client._inflight_started == {}
+
+
+def test_client_expires_stale_in_flight_entries(client):
+    client._claim_fingerprint("fp", Future)
+    client._release_fingerprint("fp", "job-1")
+    client.inflight_ttl = 0
+    time.sleep(0.01)
+    assert client._claim_fingerprint("other", Future)[1]
+    assert set(client._inflight_jobs) == {"other"}
+    assert client._job_fingerprints == {}
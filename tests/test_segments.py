@@ -0,0 +1,45 @@
+import pytest
+
+from handler import plan_segments
+
+
+def covered_frames(segments):
+    frames = set()
+    for start, length in segments:
+        frames.update(range(start, start + length))
+    return frames
+
+
+def test_short_video_is_a_single_segment():
+    assert plan_segments(50, 81, 8) == [(0, 50)]
+    assert plan_segments(81, 81, 8) == [(0, 81)]
+
+
+def test_segments_overlap_by_requested_frames():
+    assert plan_segments(200, 81, 8) == [(0, 81), (73, 81), (146, 54)]
+
+
+def test_tail_segment_is_longer_than_overlap():
+    # 마지막 구간에도 겹침 구간 뒤로 새 프레임이 남아 있어야 합니다.
+    assert plan_segments(155, 81, 8) == [(0, 81), (73, 81), (146, 9)]
+
+
+@pytest.mark.parametrize("total_frames", [1, 80, 81, 82, 154, 155, 500, 1001])
+@pytest.mark.parametrize("segment_frames,overlap", [(81, 8), (33, 0), (49, 16)])
+def test_segments_cover_every_frame_exactly_once_per_step(total_frames, segment_frames, overlap):
+    segments = plan_segments(total_frames, segment_frames, overlap)
+    assert covered_frames(segments) == set(range(total_frames))
+    assert segments[0][0] == 0
+    for (start, length), (next_start, _) in zip(segments, segments[1:]):
+        assert next_start == start + segment_frames - overlap
+        assert length == segment_frames
+    if len(segments) > 1:
+        assert segments[-1][1] > overlap
+
+
+def test_offset_shifts_start_frames():
+    assert plan_segments(200, 81, 8, offset=32) == [(32, 81), (105, 81), (178, 54)]
+
+
+def test_no_frames_means_no_segments():
+    assert plan_segments(0, 81, 8) == []
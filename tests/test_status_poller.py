@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+import requests
+
+from wananimate_s3_client import JobStatusPoller
+
+
+class FakeResponse:
+    def __init__(self, body):
+        self.body = body
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        if isinstance(self.body, Exception):
+            raise self.body
+        return self.body
+
+
+class FakeSession:
+    """job ID별로 정해 둔 상태 응답을 차례로 돌려주는 세션. 마지막 응답은 계속 반복합니다."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        job_id = url.rsplit('/', 1)[1]
+        with self._lock:
+            self.urls.append(url)
+            queue = self.responses[job_id]
+            body = queue.pop(0) if len(queue) > 1 else queue[0]
+        if isinstance(body, requests.RequestException):
+            raise body
+        return FakeResponse(body)
+
+
+def parse_status(job_id, status_data):
+    if status_data.get('status') in ('COMPLETED', 'FAILED'):
+        return {'status': status_data['status'], 'job_id': job_id, 'output': status_data.get('output')}
+    return None
+
+
+def make_poller(responses, **kwargs):
+    session = FakeSession(responses)
+    poller = JobStatusPoller(
+        session, "http://api/status", "http://api/stream", parse_status,
+        min_interval=0.01, max_interval=0.05, **kwargs
+    )
+    return poller, session
+
+
+def test_tracks_job_until_completion():
+    poller, session = make_poller({"job-1": [
+        {"status": "IN_QUEUE"}, {"status": "IN_PROGRESS"}, {"status": "COMPLETED", "output": "video"},
+    ]})
+    results = []
+    future = poller.track("job-1", callback=results.append)
+    assert future.result(timeout=5) == {"status": "COMPLETED", "job_id": "job-1", "output": "video"}
+    assert results == [future.result()]
+    assert poller.request_count == 3
+    assert session.urls == ["http://api/status/job-1"] * 3
+
+
+def test_many_jobs_share_one_loop():
+    poller, _ = make_poller({
+        f"job-{index}": [{"status": "IN_PROGRESS"}] * index + [{"status": "COMPLETED"}] for index in range(5)
+    })
+    futures = [poller.track(f"job-{index}") for index in range(5)]
+    assert [future.result(timeout=5)["job_id"] for future in futures] == [f"job-{index}" for index in range(5)]
+    assert poller._jobs == {}
+
+
+def test_duplicate_track_shares_future():
+    poller, _ = make_poller({"job-1": [{"status": "IN_PROGRESS"}, {"status": "COMPLETED"}]})
+    assert poller.track("job-1") is poller.track("job-1")
+
+
+def test_network_errors_keep_polling():
+    poller, _ = make_poller({"job-1": [requests.ConnectionError("reset"), {"status": "COMPLETED"}]})
+    assert poller.track("job-1").result(timeout=5)["status"] == "COMPLETED"
+
+
+def test_unexpected_errors_fail_the_future():
+    poller, _ = make_poller({"job-1": [ValueError("not json")]})
+    results = []
+    future = poller.track("job-1", callback=results.append)
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+    assert results == [{"status": "FAILED", "error": "not json", "job_id": "job-1"}]
+    assert poller._jobs == {}
+
+
+def test_times_out_at_deadline():
+    poller, _ = make_poller({"job-1": [{"status": "IN_QUEUE"}]})
+    assert poller.track("job-1", max_wait_time=0.1).result(timeout=5) == {"status": "TIMEOUT", "job_id": "job-1"}
+
+
+def test_stream_items_are_collected():
+    poller, session = make_poller({"job-1": [
+        {"status": "IN_PROGRESS", "stream": [{"output": 1}]},
+        {"status": "COMPLETED", "stream": [{"output": 2}]},
+    ]})
+    assert poller.track("job-1", use_stream=True).result(timeout=5)["output"] == [1, 2]
+    assert session.urls[0] == "http://api/stream/job-1"
+
+
+def test_interval_backs_off_while_queued_and_speeds_up_near_completion():
+    poller = JobStatusPoller(None, "", "", parse_status, min_interval=1, max_interval=10, backoff=2)
+    entry = {"submitted_at": 0, "interval": 1, "max_interval": 10, "use_stream": False}
+    assert [poller._next_interval(entry, "IN_QUEUE", 0) for _ in range(5)] == [2, 4, 8, 10, 10]
+    poller._expected_duration = 100
+    assert poller._next_interval(entry, "IN_PROGRESS", 90) == 5
+    assert poller._next_interval(entry, "IN_PROGRESS", 120) == 1
@@ -0,0 +1,71 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from handler import TextEmbedCache
+
+ENCODER = {"model_name": "umt5-xxl-enc-bf16.safetensors", "precision": "bf16", "quantization": "disabled"}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    node_dir = tmp_path / "node_cache"
+    node_dir.mkdir()
+    (node_dir / "old.pt").write_bytes(b"old")
+    return TextEmbedCache(str(tmp_path / "text_embeds"), 1024, str(node_dir), ENCODER)
+
+
+def make_prompt(positive, negative=""):
+    return {"65": {"class_type": "WanVideoTextEncodeCached", "inputs": dict(
+        ENCODER, positive_prompt=positive, negative_prompt=negative, use_disk_cache=False,
+    )}}
+
+
+def test_node_dir_points_at_shared_cache(cache, tmp_path):
+    assert os.path.islink(tmp_path / "node_cache")
+    assert os.path.realpath(tmp_path / "node_cache") == os.path.realpath(cache.cache_dir)
+    assert os.listdir(cache.cache_dir) == ["old.pt"]
+    assert os.path.basename(cache.cache_dir) == "umt5-xxl-enc-bf16.safetensors-bf16-disabled"
+
+
+def test_embed_path_matches_node_file_name(cache):
+    expected = hashlib.sha256("a dancer".encode("utf-8")).hexdigest()
+    assert cache._embed_path("  a dancer\n") == os.path.join(cache.cache_dir, f"{expected}.pt")
+
+
+def test_prepare_enables_disk_cache_and_counts_hits(cache):
+    template = make_prompt("a dancer")
+    prompt = dict(template)
+    cache.prepare(prompt, template)
+    assert prompt["65"]["inputs"]["use_disk_cache"] is True
+    assert template["65"]["inputs"]["use_disk_cache"] is False
+
+    with open(cache._embed_path("a dancer"), "wb") as f:
+        f.write(b"embedding")
+    cache.prepare(dict(template), template)
+    assert cache.get_stats() == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_prepare_skips_other_encoder_settings(cache):
+    template = make_prompt("a dancer")
+    template["65"]["inputs"]["precision"] = "fp32"
+    prompt = dict(template)
+    cache.prepare(prompt, template)
+    assert prompt["65"]["inputs"]["use_disk_cache"] is False
+    assert cache.get_stats()["misses"] == 0
+
+
+def test_least_recently_used_embeddings_are_evicted(cache):
+    os.remove(os.path.join(cache.cache_dir, "old.pt"))
+    for text in ("first", "second", "third"):
+        with open(cache._embed_path(text), "wb") as f:
+            f.write(b"x" * 400)
+        time.sleep(0.01)
+    template = make_prompt("second")
+    cache.prepare(dict(template), template)
+    assert not os.path.exists(cache._embed_path("first"))
+    assert os.path.exists(cache._embed_path("second"))
+    assert os.path.exists(cache._embed_path("third"))
+    assert cache.get_stats()["evictions"] == 1
@@ -0,0 +1,47 @@
+import pytest
+
+import handler
+from handler import WorkflowBindingError, expand_variants, render_variant, use_variants
+
+
+def test_scalar_inputs_are_not_variants():
+    assert not use_variants({"prompt": "dance", "seed": 1})
+    assert use_variants({"prompt": "dance", "seed": [1, 2]})
+
+
+def test_expands_all_combinations_in_field_order():
+    variants = expand_variants({"prompt": ["a", "b"], "seed": [1, 2, 3], "cfg": 1.0})
+    assert variants == [
+        {"prompt": "a", "seed": 1}, {"prompt": "a", "seed": 2}, {"prompt": "a", "seed": 3},
+        {"prompt": "b", "seed": 1}, {"prompt": "b", "seed": 2}, {"prompt": "b", "seed": 3},
+    ]
+
+
+def test_rejects_empty_list():
+    with pytest.raises(WorkflowBindingError):
+        expand_variants({"seed": []})
+
+
+def test_rejects_too_many_variants(monkeypatch):
+    monkeypatch.setattr(handler, "MAX_VARIANTS", 4)
+    expand_variants({"seed": [1, 2], "steps": [4, 8]})
+    with pytest.raises(WorkflowBindingError, match="4"):
+        expand_variants({"seed": [1, 2, 3], "steps": [4, 8]})
+
+
+def test_rejects_variants_in_segmented_jobs():
+    with pytest.raises(WorkflowBindingError):
+        expand_variants({"seed": [1, 2], "segment_frames": 81})
+
+
+def test_render_variant_changes_only_variant_nodes():
+    prompt = {
+        "27": {"class_type": "Sampler", "inputs": {"seed": 0, "cfg": 1.0, "steps": 4}},
+        "65": {"class_type": "TextEncode", "inputs": {"positive_prompt": "a", "negative_prompt": ""}},
+        "63": {"class_type": "VHS_LoadVideo", "inputs": {"video": "in.mp4"}},
+    }
+    variant_prompt = render_variant(prompt, {"seed": "7"})
+    assert variant_prompt["27"]["inputs"] == {"seed": 7, "cfg": 1.0, "steps": 4}
+    assert variant_prompt["65"] is prompt["65"]
+    assert variant_prompt["63"] is prompt["63"]
+    assert prompt["27"]["inputs"]["seed"] == 0
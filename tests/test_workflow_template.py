@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import handler
+from handler import WorkflowBindingError, WorkflowTemplate, bind_values
+
+
+BINDINGS = {
+    "prompt": {"targets": [("1", "text")], "type": str, "required": True},
+    "seed": {"targets": [("2", "seed"), ("3", "seed")], "type": int, "required": True, "min": 0},
+    "steps": {"targets": [("2", "steps")], "type": int, "default": 4, "min": 1},
+    "negative_prompt": {"targets": [("1", "negative")], "type": str},
+}
+
+
+@pytest.fixture
+def template(tmp_path):
+    nodes = {
+        "1": {"class_type": "Text", "inputs": {"text": "", "negative": "blurry"}},
+        "2": {"class_type": "Sampler", "inputs": {"seed": 0, "steps": 8}},
+        "3": {"class_type": "Noise", "inputs": {"seed": 0}},
+        "4": {"class_type": "Output", "inputs": {"images": ["2", 0]}},
+    }
+    path = tmp_path / "workflow.json"
+    path.write_text(json.dumps(nodes))
+    return WorkflowTemplate("workflow.json", str(path), BINDINGS)
+
+
+def test_bind_values_converts_types_and_applies_defaults():
+    bound = bind_values(BINDINGS, {"prompt": "dance", "seed": "42"})
+    assert bound == {"prompt": "dance", "seed": 42, "steps": 4}
+
+
+def test_bind_values_rejects_missing_required_field():
+    with pytest.raises(WorkflowBindingError, match="prompt"):
+        bind_values(BINDINGS, {"seed": 1})
+
+
+def test_bind_values_rejects_bad_type_and_minimum():
+    with pytest.raises(WorkflowBindingError, match="seed"):
+        bind_values(BINDINGS, {"prompt": "dance", "seed": "abc"})
+    with pytest.raises(WorkflowBindingError, match="steps"):
+        bind_values(BINDINGS, {"prompt": "dance", "seed": 1, "steps": 0})
+
+
+def test_render_fills_every_target(template):
+    prompt = template.render({"prompt": "dance", "seed": 7})
+    assert prompt["1"]["inputs"] == {"text": "dance", "negative": "blurry"}
+    assert prompt["2"]["inputs"] == {"seed": 7, "steps": 4}
+    assert prompt["3"]["inputs"] == {"seed": 7}
+
+
+def test_render_copies_only_changed_nodes(template):
+    prompt = template.render({"prompt": "dance", "seed": 7})
+    assert prompt["4"] is template.nodes["4"]
+    assert prompt["2"] is not template.nodes["2"]
+    # 템플릿은 job 사이에 공유되므로 render()가 바꾸면 안 됩니다.
+    assert template.nodes["2"]["inputs"] == {"seed": 0, "steps": 8}
+    assert template.nodes["1"]["inputs"]["text"] == ""
+
+
+def test_template_rejects_binding_to_missing_node(tmp_path):
+    path = tmp_path / "workflow.json"
+    path.write_text(json.dumps({"1": {"class_type": "Text", "inputs": {}}}))
+    with pytest.raises(WorkflowBindingError, match="노드 2"):
+        WorkflowTemplate("workflow.json", str(path), BINDINGS)
+
+
+def test_registry_loads_shipped_workflows():
+    for key, variant in handler.WORKFLOW_VARIANTS.items():
+        template = handler.workflow_registry.templates[key]
+        assert template.name == variant["file"]
+    with pytest.raises(WorkflowBindingError):
+        handler.workflow_registry.select({"mode": "unknown"})
@@ -8,17 +8,688 @@ import os
 import requests
 import json
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
+from botocore.exceptions import ClientError
 import time
 import base64
-from typing import Optional, Dict, Any, List, Union
+import hashlib
+import threading
+import queue
+import heapq
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, List, Union, Tuple, Callable
 import logging
+import asyncio
+
+# Optional dependencies of AsyncWanAnimateS3Client
+try:
+    import aiohttp
+    import aioboto3
+except ImportError:
+    aiohttp = None
+    aioboto3 = None
 
 # Logging configuration
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class WanAnimateS3Client:
+class JobStatusPoller:
+    """
+    Shared RunPod job status poller
+    
+    Tracks many job IDs from a single scheduling loop instead of one polling loop per job.
+    Each job gets an adaptive interval: fast right after submission and close to the
+    expected completion time (learned from finished jobs), backing off while the job
+    waits in the queue. Callers receive a Future per job and an optional callback.
+    """
+    
+    def __init__(
+        self,
+        session: requests.Session,
+        status_url: str,
+        stream_url: str,
+        parse_status: Callable[[str, Dict[str, Any]], Optional[Dict[str, Any]]],
+        min_interval: float = 1.0,
+        max_interval: float = 15.0,
+        backoff: float = 1.5,
+        max_workers: int = 8
+    ):
+        """
+        Initialize job status poller
+        
+        Args:
+            session: HTTP session with RunPod authorization headers
+            status_url: RunPod /status URL (without job ID)
+            stream_url: RunPod /stream URL (without job ID)
+            parse_status: Function converting a status response into a result dictionary (None while running)
+            min_interval: Shortest interval between checks of one job (seconds)
+            max_interval: Longest interval between checks of one job (seconds)
+            backoff: Interval multiplier while a job is queued
+            max_workers: Concurrent status requests
+        """
+        self.session = session
+        self.status_url = status_url
+        self.stream_url = stream_url
+        self.parse_status = parse_status
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.request_count = 0
+        
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._schedule: List[Tuple[float, str]] = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="status-poll")
+        self._expected_duration: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+    
+    def track(
+        self,
+        job_id: str,
+        callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+        max_wait_time: float = 1800,
+        max_interval: Optional[float] = None,
+        use_stream: bool = False
+    ) -> Future:
+        """
+        Start tracking a job
+        
+        Args:
+            job_id: Job ID
+            callback: Called with the job result dictionary when the job finishes (optional);
+                an unexpected status check error is passed as a FAILED result
+            max_wait_time: Maximum wait time (seconds)
+            max_interval: Per-job cap on the polling interval (optional)
+            use_stream: Poll /stream and collect streamed output items (for streaming workers)
+        
+        Returns:
+            Future resolving to the job result dictionary, or raising an unexpected status check error
+        """
+        now = time.time()
+        with self._condition:
+            entry = self._jobs.get(job_id)
+            if entry is not None:
+                # Already tracked (e.g. a coalesced duplicate request): share its result
+                future = entry["future"]
+            else:
+                future = Future()
+                self._jobs[job_id] = {
+                    "future": future,
+                    "submitted_at": now,
+                    "deadline": now + max_wait_time,
+                    "interval": self.min_interval,
+                    "max_interval": min(max_interval or self.max_interval, self.max_interval),
+                    "use_stream": use_stream,
+                    "stream_items": []
+                }
+                heapq.heappush(self._schedule, (now + self.min_interval, job_id))
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="status-poller", daemon=True)
+                    self._thread.start()
+                self._condition.notify()
+        if callback:
+            def on_done(f: Future):
+                error = f.exception()
+                callback({'status': 'FAILED', 'error': str(error), 'job_id': job_id} if error else f.result())
+            future.add_done_callback(on_done)
+        return future
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._schedule:
+                    if not self._condition.wait(timeout=60) and not self._schedule:
+                        # Exit when idle; track() restarts the loop
+                        self._thread = None
+                        return
+                next_check, job_id = self._schedule[0]
+                delay = next_check - time.time()
+                if delay > 0:
+                    self._condition.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._schedule)
+                entry = self._jobs.get(job_id)
+            if entry is not None:
+                self._executor.submit(self._check, job_id, entry)
+    
+    def _check(self, job_id: str, entry: Dict[str, Any]):
+        result = None
+        status = None
+        try:
+            url = f"{self.stream_url if entry['use_stream'] else self.status_url}/{job_id}"
+            with self._condition:
+                self.request_count += 1
+            response = self.session.get(url, timeout=30)
+            response.raise_for_status()
+            status_data = response.json()
+            status = status_data.get('status')
+            if entry["use_stream"]:
+                entry["stream_items"].extend(item.get('output') for item in status_data.get('stream', []))
+                if status == 'COMPLETED':
+                    status_data = dict(status_data, output=entry["stream_items"])
+            result = self.parse_status(job_id, status_data)
+        except requests.exceptions.RequestException as e:
+            # Transient network errors: keep polling until the deadline
+            logger.error(f"❌ Error checking status: {e}")
+        except Exception as e:
+            # Anything else (e.g. an unexpected response shape) would otherwise leave the
+            # future pending forever, since this runs on an executor thread
+            logger.error(f"❌ Error checking status (Job ID: {job_id}): {e}")
+            with self._condition:
+                self._jobs.pop(job_id, None)
+            entry["future"].set_exception(e)
+            return
+        
+        now = time.time()
+        if result is None and now >= entry["deadline"]:
+            logger.error(f"❌ Job wait timeout (Job ID: {job_id})")
+            result = {'status': 'TIMEOUT', 'job_id': job_id}
+        
+        if result is not None:
+            with self._condition:
+                self._jobs.pop(job_id, None)
+                if result.get('status') == 'COMPLETED':
+                    duration = now - entry["submitted_at"]
+                    # Exponential moving average of end-to-end job duration
+                    self._expected_duration = duration if self._expected_duration is None else (
+                        0.8 * self._expected_duration + 0.2 * duration
+                    )
+            entry["future"].set_result(result)
+            return
+        
+        interval = self._next_interval(entry, status, now)
+        with self._condition:
+            heapq.heappush(self._schedule, (now + interval, job_id))
+            self._condition.notify()
+    
+    def _next_interval(self, entry: Dict[str, Any], status: Optional[str], now: float) -> float:
+        elapsed = now - entry["submitted_at"]
+        if status == 'IN_PROGRESS' and self._expected_duration is not None:
+            # Poll quickly as the job approaches its expected completion time
+            remaining = self._expected_duration - elapsed
+            interval = remaining / 2 if remaining > 0 else self.min_interval
+        elif status == 'IN_PROGRESS' and entry["use_stream"]:
+            interval = self.min_interval
+        else:
+            # Back off while queued (or while the duration is still unknown)
+            interval = entry["interval"] * self.backoff
+        entry["interval"] = max(self.min_interval, min(interval, entry["max_interval"]))
+        return entry["interval"]
+
+
+class BatchRun:
+    """
+    Bookkeeping shared by the batch pipelines
+    
+    Builds the work items of a folder batch, keeps the resumable manifest and
+    collects per-file results and per-stage timings. Safe to use from several threads.
+    """
+    
+    def __init__(self, manifest_path: str, total_files: int):
+        self.manifest_path = manifest_path
+        self.manifest = self._load_manifest()
+        self.lock = threading.Lock()
+        self.results: Dict[str, Any] = {
+            "total_files": total_files,
+            "successful": 0,
+            "failed": 0,
+            "results": []
+        }
+        self.stage_seconds: Dict[str, List[float]] = {"upload": [], "run": [], "save": []}
+        self.work_items: List[Dict[str, Any]] = []
+        self.started_at = time.time()
+    
+    @classmethod
+    def from_folders(
+        cls,
+        image_folder_path: str,
+        video_folder_path: Optional[str],
+        output_folder_path: str,
+        valid_image_extensions: tuple,
+        valid_video_extensions: tuple,
+        seed: int,
+        manifest_path: Optional[str] = None
+    ) -> "BatchRun":
+        """
+        Build a batch from image (and optional video) folders
+        
+        Files already completed according to the manifest are counted as successful and
+        skipped; jobs that were submitted before an interruption keep their job ID.
+        
+        Raises:
+            ValueError: If a folder does not exist or there are no images to process
+        """
+        # Check paths
+        if not os.path.isdir(image_folder_path):
+            raise ValueError(f"Image folder does not exist: {image_folder_path}")
+        
+        if video_folder_path and not os.path.isdir(video_folder_path):
+            raise ValueError(f"Video folder does not exist: {video_folder_path}")
+        
+        # Create output folder
+        os.makedirs(output_folder_path, exist_ok=True)
+        
+        # Get image file list (sorted so seeds stay stable when a batch is resumed)
+        image_files = sorted(
+            f for f in os.listdir(image_folder_path)
+            if f.lower().endswith(valid_image_extensions)
+        )
+        
+        if not image_files:
+            raise ValueError(f"No image files to process: {image_folder_path}")
+        
+        # Get video file list (if video folder provided)
+        video_files = []
+        if video_folder_path:
+            video_files = sorted(
+                f for f in os.listdir(video_folder_path)
+                if f.lower().endswith(valid_video_extensions)
+            )
+        
+        logger.info(f"Batch processing started: {len(image_files)} images, {len(video_files)} videos")
+        
+        batch = cls(
+            manifest_path or os.path.join(output_folder_path, "batch_manifest.json"),
+            total_files=len(image_files)
+        )
+        
+        # Build work items and skip those already finished in a previous run
+        for i, image_filename in enumerate(image_files):
+            base_filename = os.path.splitext(image_filename)[0]
+            output_filename = os.path.join(output_folder_path, f"animation_{base_filename}.mp4")
+            entry = batch.manifest.get(image_filename, {})
+            if entry.get("status") == "success" and os.path.exists(entry.get("output_file", "")):
+                logger.info(f"⏭️ [{image_filename}] Already completed, skipping")
+                batch.results["successful"] += 1
+                batch.results["results"].append({
+                    "filename": image_filename,
+                    "status": "success",
+                    "output_file": entry["output_file"],
+                    "job_id": entry.get("job_id")
+                })
+                continue
+            
+            # Find corresponding video file (if video folder provided)
+            video_path = None
+            if video_files:
+                # Try to find video with same base name
+                for video_filename in video_files:
+                    if os.path.splitext(video_filename)[0] == base_filename:
+                        video_path = os.path.join(video_folder_path, video_filename)
+                        break
+                
+                # If no matching video found, use first video
+                if not video_path:
+                    video_path = os.path.join(video_folder_path, video_files[0])
+            
+            batch.work_items.append({
+                "filename": image_filename,
+                "image_path": os.path.join(image_folder_path, image_filename),
+                "video_path": video_path,
+                "seed": seed + i,  # Different seed for each file
+                "output_file": output_filename,
+                "job_id": entry.get("job_id") if entry.get("status") == "submitted" else None
+            })
+        
+        return batch
+    
+    def update_manifest(self, filename: str, **fields):
+        with self.lock:
+            self.manifest.setdefault(filename, {}).update(fields)
+            self._save_manifest()
+    
+    def record_stage(self, stage: str, seconds: float):
+        with self.lock:
+            self.stage_seconds[stage].append(seconds)
+    
+    def finish(self, filename: str, status: str, **fields):
+        with self.lock:
+            self.results["successful" if status == "success" else "failed"] += 1
+            self.results["results"].append(dict({"filename": filename, "status": status}, **fields))
+        self.update_manifest(filename, status=status, **fields)
+    
+    def finish_job(self, item: Dict[str, Any], result: Dict[str, Any], saved: bool):
+        """Record the outcome of a finished job (saved: whether the result video was written)"""
+        if result.get('status') != 'COMPLETED':
+            logger.error(f"[{item['filename']}] Job failed: {result.get('error', 'Unknown error')}")
+            self.finish(item["filename"], "failed", error=result.get('error', 'Unknown error'), job_id=result.get('job_id'))
+        elif saved:
+            logger.info(f"✅ [{item['filename']}] Processing completed")
+            self.finish(item["filename"], "success", output_file=item["output_file"], job_id=result.get('job_id'))
+        else:
+            logger.error(f"[{item['filename']}] Result save failed")
+            self.finish(item["filename"], "failed", error="Result save failed", job_id=result.get('job_id'))
+    
+    def summary(self) -> Dict[str, Any]:
+        """Return the batch result dictionary with elapsed time and per-stage timing"""
+        results = dict(self.results)
+        results["elapsed_seconds"] = time.time() - self.started_at
+        results["stage_timing"] = {
+            stage: {
+                "count": len(values),
+                "total_seconds": sum(values),
+                "avg_seconds": sum(values) / len(values) if values else 0.0
+            }
+            for stage, values in self.stage_seconds.items()
+        }
+        logger.info(f"\n🎉 Batch processing completed: {results['successful']}/{results['total_files']} successful")
+        return results
+    
+    def _load_manifest(self) -> Dict[str, Any]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.manifest_path}: {e}")
+            return {}
+    
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+
+class WanAnimateClientBase:
+    """
+    Configuration and helpers shared by the synchronous and asyncio clients
+    """
+    
+    def __init__(
+        self,
+        runpod_endpoint_id: str,
+        runpod_api_key: str,
+        s3_endpoint_url: str,
+        s3_access_key_id: str,
+        s3_secret_access_key: str,
+        s3_bucket_name: str,
+        s3_region: str = 'eu-ro-1',
+        max_upload_workers: int = 8,
+        multipart_threshold: int = 16 * 1024 * 1024,
+        multipart_chunksize: int = 16 * 1024 * 1024,
+        max_transfer_concurrency: int = 8,
+        runpod_api_base: str = "https://api.runpod.ai/v2",
+        inflight_ttl: float = 1800
+    ):
+        self.runpod_endpoint_id = runpod_endpoint_id
+        self.runpod_api_key = runpod_api_key
+        endpoint_url = f"{runpod_api_base.rstrip('/')}/{runpod_endpoint_id}"
+        self.runpod_api_endpoint = f"{endpoint_url}/run"
+        self.status_url = f"{endpoint_url}/status"
+        self.runsync_url = f"{endpoint_url}/runsync"
+        self.stream_url = f"{endpoint_url}/stream"
+        self.cancel_url = f"{endpoint_url}/cancel"
+        
+        # S3 configuration
+        self.s3_endpoint_url = s3_endpoint_url
+        self.s3_access_key_id = s3_access_key_id
+        self.s3_secret_access_key = s3_secret_access_key
+        self.s3_bucket_name = s3_bucket_name
+        self.s3_region = s3_region
+        self.max_upload_workers = max_upload_workers
+        self.max_transfer_concurrency = max_transfer_concurrency
+        
+        # Multipart tuning
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_transfer_concurrency,
+            use_threads=True
+        )
+        
+        # Content hash cache (path, size, mtime) -> sha256 and keys known to exist in the bucket
+        self._hash_cache: Dict[Tuple[str, int, float], str] = {}
+        self._known_keys: set = set()
+        self._transfer_lock = threading.Lock()
+        self.transfer_stats: List[Dict[str, Any]] = []
+        
+        # Identical requests in flight: fingerprint -> pending job ID, and job ID -> fingerprint.
+        # Entries older than inflight_ttl are dropped even if nobody waited for the job.
+        self.inflight_ttl = inflight_ttl
+        self._inflight_lock = threading.Lock()
+        self._inflight_jobs: Dict[str, Any] = {}
+        self._inflight_started: Dict[str, float] = {}
+        self._job_fingerprints: Dict[str, str] = {}
+    
+    def file_content_hash(self, file_path: str) -> str:
+        """
+        Compute the SHA-256 of a file, reusing the result while size and mtime are unchanged
+        
+        Args:
+            file_path: Local file path
+        
+        Returns:
+            Hex digest of the file content
+        """
+        stat = os.stat(file_path)
+        cache_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime)
+        with self._transfer_lock:
+            cached = self._hash_cache.get(cache_key)
+        if cached:
+            return cached
+        
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        with self._transfer_lock:
+            self._hash_cache[cache_key] = content_hash
+        return content_hash
+    
+    def _record_transfer(self, s3_key: str, size: int, seconds: float, skipped: bool):
+        bytes_per_sec = size / seconds if seconds > 0 else None
+        with self._transfer_lock:
+            self.transfer_stats.append({
+                "s3_key": s3_key,
+                "bytes": size,
+                "seconds": seconds,
+                "bytes_per_sec": bytes_per_sec,
+                "skipped": skipped
+            })
+        if not skipped:
+            logger.info(
+                f"S3 transfer: {s3_key} {size / (1024*1024):.1f}MB in {seconds:.2f}s "
+                f"({(bytes_per_sec or 0) / (1024*1024):.1f}MB/s)"
+            )
+    
+    @staticmethod
+    def request_fingerprint(input_data: Dict[str, Any]) -> str:
+        """
+        Compute the canonical fingerprint of a request
+        
+        Input files are referenced by content-hash keys, so the fingerprint changes only when
+        the inputs or generation parameters change. Delivery options are not part of it.
+        
+        Args:
+            input_data: API input data
+        
+        Returns:
+            Hex digest identifying the request
+        """
+        canonical = {
+            key: value for key, value in input_data.items()
+            if key not in ('output_mode', 'request_fingerprint', 'result_cache')
+        }
+        return hashlib.sha256(
+            json.dumps(canonical, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+    
+    def _forget_job(self, job_id: str):
+        with self._inflight_lock:
+            fingerprint = self._job_fingerprints.pop(job_id, None)
+            if fingerprint:
+                self._inflight_jobs.pop(fingerprint, None)
+                self._inflight_started.pop(fingerprint, None)
+    
+    def _claim_fingerprint(self, fingerprint: str, new_pending) -> Tuple[Any, bool]:
+        """
+        Return the pending job for a fingerprint, registering new_pending() if there is none
+        
+        Expired entries are pruned first so the in-flight maps stay bounded.
+        
+        Returns:
+            (pending future, whether the caller owns it and must submit the job)
+        """
+        with self._inflight_lock:
+            deadline = time.time() - self.inflight_ttl
+            expired = {fp for fp, started in self._inflight_started.items() if started < deadline}
+            if expired:
+                for fp in expired:
+                    self._inflight_jobs.pop(fp, None)
+                    del self._inflight_started[fp]
+                self._job_fingerprints = {
+                    job_id: fp for job_id, fp in self._job_fingerprints.items() if fp not in expired
+                }
+            
+            pending = self._inflight_jobs.get(fingerprint)
+            if pending is not None:
+                return pending, False
+            pending = self._inflight_jobs[fingerprint] = new_pending()
+            self._inflight_started[fingerprint] = time.time()
+            return pending, True
+    
+    def _release_fingerprint(self, fingerprint: str, job_id: Optional[str]):
+        with self._inflight_lock:
+            if job_id:
+                self._job_fingerprints[job_id] = fingerprint
+            else:
+                self._inflight_jobs.pop(fingerprint, None)
+                self._inflight_started.pop(fingerprint, None)
+    
+    def _parse_status(self, job_id: str, status_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Convert a RunPod status response into a job result dictionary
+        
+        Args:
+            job_id: Job ID
+            status_data: Response body of /status/{job_id}
+        
+        Returns:
+            Job result dictionary, or None while the job is still queued or running
+        """
+        status = status_data.get('status')
+        if status not in ['IN_QUEUE', 'IN_PROGRESS']:
+            self._forget_job(job_id)
+        
+        if status == 'COMPLETED':
+            logger.info(f"✅ Job completed! (Job ID: {job_id})")
+            return {
+                'status': 'COMPLETED',
+                'output': status_data.get('output'),
+                'job_id': job_id
+            }
+        elif status == 'FAILED':
+            logger.error(f"❌ Job failed. (Job ID: {job_id})")
+            return {
+                'status': 'FAILED',
+                'error': status_data.get('error', 'Unknown error'),
+                'job_id': job_id
+            }
+        elif status in ['IN_QUEUE', 'IN_PROGRESS']:
+            logger.info(f"🏃 Job in progress... (Job ID: {job_id}, status: {status})")
+            return None
+        else:
+            logger.warning(f"❓ Unknown status: {status}")
+            return {
+                'status': 'UNKNOWN',
+                'data': status_data,
+                'job_id': job_id
+            }
+    
+    def _write_embedded_video(self, output: Union[Dict[str, Any], List[Dict[str, Any]]], output_path: str) -> bool:
+        """
+        Decode a video embedded in the job output (aggregated stream chunks or inline base64)
+        
+        Returns:
+            Whether video data was found and written
+        """
+        if isinstance(output, list):
+            # Aggregated stream output: metadata item followed by base64 chunks
+            chunks = sorted(
+                (item for item in output if 'video_chunk' in item),
+                key=lambda item: item['index']
+            )
+            if not chunks:
+                logger.error("No video chunks in stream output")
+                return False
+            with open(output_path, 'wb') as f:
+                for item in chunks:
+                    f.write(base64.b64decode(item['video_chunk']))
+            return True
+        
+        video_b64 = output.get('video_base64') or output.get('video')
+        
+        if not video_b64:
+            logger.error("No video data available")
+            return False
+        
+        # Decode in slices (multiple of 4 characters) to avoid a second full copy in memory
+        slice_size = 4 * 1024 * 1024
+        with open(output_path, 'wb') as f:
+            for offset in range(0, len(video_b64), slice_size):
+                f.write(base64.b64decode(video_b64[offset:offset + slice_size]))
+        return True
+    
+    def _build_input_data(
+        self,
+        image_s3_path: str,
+        video_s3_path: Optional[str],
+        prompt: str,
+        negative_prompt: Optional[str],
+        seed: int,
+        width: int,
+        height: int,
+        fps: int,
+        cfg: float,
+        steps: int,
+        points_store: Optional[str] = None,
+        coordinates: Optional[str] = None,
+        neg_coordinates: Optional[str] = None,
+        output_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        # Configure API input data
+        input_data = {
+            "prompt": prompt,
+            "seed": seed,
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "cfg": cfg,
+            "steps": steps
+        }
+        
+        # Set negative prompt (if provided)
+        if negative_prompt:
+            input_data["negative_prompt"] = negative_prompt
+        
+        # Set image input
+        input_data["image_path"] = image_s3_path
+        
+        # Set video input (if provided)
+        if video_s3_path:
+            input_data["video_path"] = video_s3_path
+        
+        # Set control points (if provided)
+        if points_store and coordinates and neg_coordinates:
+            input_data["points_store"] = points_store
+            input_data["coordinates"] = coordinates
+            input_data["neg_coordinates"] = neg_coordinates
+        
+        # Idempotency key: the worker returns the stored result of an identical request
+        input_data["request_fingerprint"] = self.request_fingerprint(input_data)
+        
+        # Set output delivery mode (if provided)
+        if output_mode:
+            input_data["output_mode"] = output_mode
+        
+        return input_data
+
+
+class WanAnimateS3Client(WanAnimateClientBase):
     def __init__(
         self,
         runpod_endpoint_id: str,
@@ -27,7 +698,13 @@ class WanAnimateS3Client:
         s3_access_key_id: str,
         s3_secret_access_key: str,
         s3_bucket_name: str,
-        s3_region: str = 'eu-ro-1'
+        s3_region: str = 'eu-ro-1',
+        max_upload_workers: int = 8,
+        multipart_threshold: int = 16 * 1024 * 1024,
+        multipart_chunksize: int = 16 * 1024 * 1024,
+        max_transfer_concurrency: int = 8,
+        runpod_api_base: str = "https://api.runpod.ai/v2",
+        inflight_ttl: float = 1800
     ):
         """
         Initialize WanAnimate S3 client
@@ -40,18 +717,28 @@ class WanAnimateS3Client:
             s3_secret_access_key: S3 secret access key
             s3_bucket_name: S3 bucket name
             s3_region: S3 region
+            max_upload_workers: Number of files uploaded concurrently by the shared upload pool
+            multipart_threshold: File size (bytes) above which multipart upload is used
+            multipart_chunksize: Multipart part size (bytes)
+            max_transfer_concurrency: Parallel part uploads per file
+            runpod_api_base: RunPod API base URL (override for a local or mock API)
+            inflight_ttl: Seconds a submitted request stays eligible for deduplication
         """
-        self.runpod_endpoint_id = runpod_endpoint_id
-        self.runpod_api_key = runpod_api_key
-        self.runpod_api_endpoint = f"https://api.runpod.ai/v2/{runpod_endpoint_id}/run"
-        self.status_url = f"https://api.runpod.ai/v2/{runpod_endpoint_id}/status"
-        
-        # S3 configuration
-        self.s3_endpoint_url = s3_endpoint_url
-        self.s3_access_key_id = s3_access_key_id
-        self.s3_secret_access_key = s3_secret_access_key
-        self.s3_bucket_name = s3_bucket_name
-        self.s3_region = s3_region
+        super().__init__(
+            runpod_endpoint_id=runpod_endpoint_id,
+            runpod_api_key=runpod_api_key,
+            s3_endpoint_url=s3_endpoint_url,
+            s3_access_key_id=s3_access_key_id,
+            s3_secret_access_key=s3_secret_access_key,
+            s3_bucket_name=s3_bucket_name,
+            s3_region=s3_region,
+            max_upload_workers=max_upload_workers,
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_transfer_concurrency=max_transfer_concurrency,
+            runpod_api_base=runpod_api_base,
+            inflight_ttl=inflight_ttl
+        )
         
         # Initialize S3 client
         self.s3_client = boto3.client(
@@ -60,9 +747,15 @@ class WanAnimateS3Client:
             aws_access_key_id=s3_access_key_id,
             aws_secret_access_key=s3_secret_access_key,
             region_name=s3_region,
-            config=Config(signature_version='s3v4')
+            config=Config(
+                signature_version='s3v4',
+                max_pool_connections=max_upload_workers * max_transfer_concurrency
+            )
         )
         
+        # Shared upload pool
+        self.upload_executor = ThreadPoolExecutor(max_workers=max_upload_workers, thread_name_prefix="s3-upload")
+        
         # Initialize HTTP session
         self.session = requests.Session()
         self.session.headers.update({
@@ -70,6 +763,14 @@ class WanAnimateS3Client:
             'Content-Type': 'application/json'
         })
         
+        # Shared status poller for every job submitted through this client
+        self.status_poller = JobStatusPoller(
+            session=self.session,
+            status_url=self.status_url,
+            stream_url=self.stream_url,
+            parse_status=self._parse_status
+        )
+        
         logger.info(f"WanAnimateS3Client initialized - Endpoint: {runpod_endpoint_id}")
     
     def upload_to_s3(self, file_path: str, s3_key: str) -> Optional[str]:
@@ -90,7 +791,10 @@ class WanAnimateS3Client:
             
             logger.info(f"S3 upload started: {file_path} -> s3://{self.s3_bucket_name}/{s3_key}")
             
-            self.s3_client.upload_file(file_path, self.s3_bucket_name, s3_key)
+            file_size = os.path.getsize(file_path)
+            start_time = time.time()
+            self.s3_client.upload_file(file_path, self.s3_bucket_name, s3_key, Config=self.transfer_config)
+            self._record_transfer(s3_key, file_size, time.time() - start_time, skipped=False)
             
             s3_path = f"/runpod-volume/{s3_key}"
             logger.info(f"✅ S3 upload successful: {s3_path}")
@@ -100,9 +804,852 @@ class WanAnimateS3Client:
             logger.error(f"❌ S3 upload failed: {e}")
             return None
     
-    def upload_multiple_files(self, file_paths: List[str], s3_keys: List[str]) -> Dict[str, Optional[str]]:
+    def upload_deduplicated(self, file_path: str, prefix: str = "input/wananimate") -> Optional[str]:
+        """
+        Upload file under a content-hash key, skipping the upload if that key already exists
+        
+        Args:
+            file_path: Local path of file to upload
+            prefix: S3 key prefix
+        
+        Returns:
+            S3 path or None (on failure)
+        """
+        try:
+            if not os.path.exists(file_path):
+                logger.error(f"File does not exist: {file_path}")
+                return None
+            
+            extension = os.path.splitext(file_path)[1].lower()
+            s3_key = f"{prefix}/{self.file_content_hash(file_path)}{extension}"
+            
+            if self._s3_key_exists(s3_key):
+                self._record_transfer(s3_key, os.path.getsize(file_path), 0.0, skipped=True)
+                logger.info(f"♻️ S3 upload skipped, identical file already exists: {s3_key}")
+                return f"/runpod-volume/{s3_key}"
+            
+            s3_path = self.upload_to_s3(file_path, s3_key)
+            if s3_path:
+                with self._transfer_lock:
+                    self._known_keys.add(s3_key)
+            return s3_path
+            
+        except Exception as e:
+            logger.error(f"❌ S3 upload failed: {e}")
+            return None
+    
+    def _s3_key_exists(self, s3_key: str) -> bool:
+        with self._transfer_lock:
+            if s3_key in self._known_keys:
+                return True
+        try:
+            self.s3_client.head_object(Bucket=self.s3_bucket_name, Key=s3_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        with self._transfer_lock:
+            self._known_keys.add(s3_key)
+        return True
+    
+    def upload_multiple_files(self, file_paths: List[str], s3_keys: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Upload multiple files to S3 concurrently
+        
+        Args:
+            file_paths: List of local paths of files to upload
+            s3_keys: List of keys to store in S3
+        
+        Returns:
+            Dictionary with filename as key and S3 path as value
+        """
+        futures = {
+            os.path.basename(file_path): self.upload_executor.submit(self.upload_to_s3, file_path, s3_key)
+            for file_path, s3_key in zip(file_paths, s3_keys)
+        }
+        return {filename: future.result() for filename, future in futures.items()}
+    
+    def submit_job(self, input_data: Dict[str, Any]) -> Optional[str]:
+        """
+        Submit job to RunPod
+        
+        A request whose fingerprint matches a job that is still in flight is not submitted
+        again; the job ID of the running job is returned instead.
+        
+        Args:
+            input_data: API input data
+        
+        Returns:
+            Job ID or None (on failure)
+        """
+        fingerprint = input_data.get("request_fingerprint")
+        if not fingerprint:
+            return self._post_job(input_data)
+        
+        pending, owner = self._claim_fingerprint(fingerprint, Future)
+        if not owner:
+            job_id = pending.result()
+            if job_id:
+                logger.info(f"♻️ Identical request already in flight, reusing Job ID: {job_id}")
+            return job_id
+        
+        job_id = None
+        try:
+            job_id = self._post_job(input_data)
+        finally:
+            self._release_fingerprint(fingerprint, job_id)
+            pending.set_result(job_id)
+        return job_id
+    
+    def _post_job(self, input_data: Dict[str, Any]) -> Optional[str]:
+        payload = {"input": input_data}
+        
+        try:
+            logger.info(f"Submitting job to RunPod: {self.runpod_api_endpoint}")
+            logger.info(f"Input data: {json.dumps(input_data, indent=2, ensure_ascii=False)}")
+            
+            response = self.session.post(self.runpod_api_endpoint, json=payload, timeout=30)
+            response.raise_for_status()
+            
+            response_data = response.json()
+            job_id = response_data.get('id')
+            
+            if job_id:
+                logger.info(f"✅ Job submission successful! Job ID: {job_id}")
+                return job_id
+            else:
+                logger.error(f"❌ Failed to receive Job ID: {response_data}")
+                return None
+                
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Job submission failed: {e}")
+            return None
+    
+    def submit_job_sync(self, input_data: Dict[str, Any], wait_ms: int = 90000, max_wait_time: int = 1800) -> Dict[str, Any]:
+        """
+        Submit a short job through /runsync and return its result directly
+        
+        If the job does not finish within the /runsync wait window, it is handed over
+        to the shared status poller.
+        
+        Args:
+            input_data: API input data
+            wait_ms: How long /runsync waits for the result (milliseconds)
+            max_wait_time: Maximum total wait time (seconds)
+        
+        Returns:
+            Job result dictionary
+        """
+        try:
+            logger.info(f"Submitting job to RunPod: {self.runsync_url}")
+            response = self.session.post(
+                f"{self.runsync_url}?wait={wait_ms}",
+                json={"input": input_data},
+                timeout=wait_ms / 1000 + 30
+            )
+            response.raise_for_status()
+            response_data = response.json()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ Job submission failed: {e}")
+            return {"error": "Job submission failed"}
+        
+        job_id = response_data.get('id')
+        if not job_id:
+            logger.error(f"❌ Failed to receive Job ID: {response_data}")
+            return {"error": "Job submission failed"}
+        
+        result = self._parse_status(job_id, response_data)
+        if result is not None:
+            return result
+        return self.wait_for_completion(job_id, max_wait_time=max_wait_time)
+    
+    def wait_for_completion(
+        self,
+        job_id: str,
+        check_interval: int = 10,
+        max_wait_time: int = 1800,
+        use_stream: bool = False
+    ) -> Dict[str, Any]:
+        """
+        Wait for job completion
+        
+        The job is tracked by the shared status poller, which adapts the polling
+        interval to the job state (never longer than check_interval).
+        
+        Args:
+            job_id: Job ID
+            check_interval: Maximum status check interval (seconds)
+            max_wait_time: Maximum wait time (seconds)
+            use_stream: Collect streamed output items via /stream (for streaming workers)
+        
+        Returns:
+            Job result dictionary
+        """
+        try:
+            future = self.status_poller.track(
+                job_id,
+                max_wait_time=max_wait_time,
+                max_interval=check_interval,
+                use_stream=use_stream
+            )
+            return future.result()
+        finally:
+            self._forget_job(job_id)
+    
+    def save_video_result(self, result: Dict[str, Any], output_path: str) -> bool:
+        """
+        Save video file from job result
+        
+        Supports every output delivery mode of the handler: inline base64 (`video`),
+        aggregated stream chunks (list output), presigned URL (`video_url`) and
+        network volume key (`s3_key`). Data is written to disk incrementally.
+        
+        Args:
+            result: Job result dictionary
+            output_path: File path to save
+        
+        Returns:
+            Save success status
+        """
+        try:
+            if result.get('status') != 'COMPLETED':
+                logger.error(f"Job not completed: {result.get('status')}")
+                return False
+            
+            output = result.get('output', {})
+            
+            # Create directory
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+            
+            if isinstance(output, dict) and output.get('video_url'):
+                with self.session.get(output['video_url'], stream=True, timeout=60,
+                                      headers={'Authorization': None}) as response:
+                    response.raise_for_status()
+                    with open(output_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=1024 * 1024):
+                            f.write(chunk)
+            elif isinstance(output, dict) and output.get('s3_key'):
+                self.s3_client.download_file(self.s3_bucket_name, output['s3_key'], output_path)
+            elif not self._write_embedded_video(output, output_path):
+                return False
+            
+            file_size = os.path.getsize(output_path)
+            logger.info(f"✅ Video saved successfully: {output_path} ({file_size / (1024*1024):.1f}MB)")
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ Video save failed: {e}")
+            return False
+    
+    def _prepare_job_input(
+        self,
+        image_path: str,
+        video_path: Optional[str],
+        prompt: str,
+        negative_prompt: Optional[str],
+        seed: int,
+        width: int,
+        height: int,
+        fps: int,
+        cfg: float,
+        steps: int,
+        points_store: Optional[str] = None,
+        coordinates: Optional[str] = None,
+        neg_coordinates: Optional[str] = None,
+        output_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Upload input files and build the API input data
+        
+        Returns:
+            API input data, or a dictionary with an "error" key on failure
+        """
+        # Check file existence
+        if not os.path.exists(image_path):
+            return {"error": f"Image file does not exist: {image_path}"}
+        
+        if video_path and not os.path.exists(video_path):
+            return {"error": f"Video file does not exist: {video_path}"}
+        
+        # Upload image and video (if provided) concurrently under content-hash keys
+        image_future = self.upload_executor.submit(self.upload_deduplicated, image_path)
+        video_future = self.upload_executor.submit(self.upload_deduplicated, video_path) if video_path else None
+        
+        image_s3_path = image_future.result()
+        video_s3_path = video_future.result() if video_future else None
+        
+        if not image_s3_path:
+            return {"error": "Image S3 upload failed"}
+        
+        if video_path and not video_s3_path:
+            return {"error": "Video S3 upload failed"}
+        
+        return self._build_input_data(
+            image_s3_path=image_s3_path,
+            video_s3_path=video_s3_path,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            seed=seed,
+            width=width,
+            height=height,
+            fps=fps,
+            cfg=cfg,
+            steps=steps,
+            points_store=points_store,
+            coordinates=coordinates,
+            neg_coordinates=neg_coordinates,
+            output_mode=output_mode
+        )
+    
+    def create_animation_from_files(
+        self,
+        image_path: str,
+        video_path: Optional[str] = None,
+        prompt: str = "A person walking in a natural way",
+        negative_prompt: Optional[str] = None,
+        seed: int = 12345,
+        width: int = 832,
+        height: int = 480,
+        fps: int = 16,
+        cfg: float = 1.0,
+        steps: int = 6,
+        points_store: Optional[str] = None,
+        coordinates: Optional[str] = None,
+        neg_coordinates: Optional[str] = None,
+        output_mode: Optional[str] = None,
+        sync_wait_ms: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Create animation from local files (including S3 upload)
+        
+        Args:
+            image_path: Image file path
+            video_path: Reference video file path (optional)
+            prompt: Animation description text
+            negative_prompt: Negative prompt to avoid unwanted elements (optional)
+            seed: Random seed for generation
+            width: Output width
+            height: Output height
+            fps: Frame rate
+            cfg: Classifier-free guidance scale
+            steps: Number of denoising steps
+            points_store: JSON string containing positive control points
+            coordinates: JSON string containing coordinate points
+            neg_coordinates: JSON string containing negative coordinate points
+            output_mode: Output delivery mode (auto, inline, upload, volume, stream) (optional)
+            sync_wait_ms: Submit through /runsync and wait up to this long for short jobs (optional)
+        
+        Returns:
+            Job result dictionary
+        """
+        input_data = self._prepare_job_input(
+            image_path=image_path,
+            video_path=video_path,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            seed=seed,
+            width=width,
+            height=height,
+            fps=fps,
+            cfg=cfg,
+            steps=steps,
+            points_store=points_store,
+            coordinates=coordinates,
+            neg_coordinates=neg_coordinates,
+            output_mode=output_mode
+        )
+        if "error" in input_data:
+            return input_data
+        
+        # Short jobs: /runsync returns the result without any polling
+        if sync_wait_ms:
+            return self.submit_job_sync(input_data, wait_ms=sync_wait_ms)
+        
+        # Submit job and wait
+        job_id = self.submit_job(input_data)
+        if not job_id:
+            return {"error": "Job submission failed"}
+        
+        result = self.wait_for_completion(job_id, use_stream=output_mode == "stream")
+        return result
+    
+    def create_animation_with_control_points(
+        self,
+        image_path: str,
+        video_path: Optional[str] = None,
+        prompt: str = "A person walking in a natural way",
+        negative_prompt: Optional[str] = None,
+        seed: int = 12345,
+        width: int = 832,
+        height: int = 480,
+        fps: int = 16,
+        cfg: float = 1.0,
+        steps: int = 6,
+        positive_points: Optional[List[Dict[str, float]]] = None,
+        negative_points: Optional[List[Dict[str, float]]] = None,
+        output_mode: Optional[str] = None,
+        sync_wait_ms: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Create animation with control points from local files
+        
+        Args:
+            image_path: Image file path
+            video_path: Reference video file path (optional)
+            prompt: Animation description text
+            negative_prompt: Negative prompt to avoid unwanted elements (optional)
+            seed: Random seed for generation
+            width: Output width
+            height: Output height
+            fps: Frame rate
+            cfg: Classifier-free guidance scale
+            steps: Number of denoising steps
+            positive_points: List of positive control points [{"x": float, "y": float}]
+            negative_points: List of negative control points [{"x": float, "y": float}]
+            output_mode: Output delivery mode (auto, inline, upload, volume, stream) (optional)
+            sync_wait_ms: Submit through /runsync and wait up to this long for short jobs (optional)
+        
+        Returns:
+            Job result dictionary
+        """
+        # Prepare control points
+        points_store = None
+        coordinates = None
+        neg_coordinates = None
+        
+        if positive_points and negative_points:
+            points_store = json.dumps({
+                "positive": positive_points,
+                "negative": negative_points
+            })
+            coordinates = json.dumps(positive_points)
+            neg_coordinates = json.dumps(negative_points)
+        
+        return self.create_animation_from_files(
+            image_path=image_path,
+            video_path=video_path,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            seed=seed,
+            width=width,
+            height=height,
+            fps=fps,
+            cfg=cfg,
+            steps=steps,
+            points_store=points_store,
+            coordinates=coordinates,
+            neg_coordinates=neg_coordinates,
+            output_mode=output_mode,
+            sync_wait_ms=sync_wait_ms
+        )
+    
+    def batch_process_animations(
+        self,
+        image_folder_path: str,
+        video_folder_path: Optional[str] = None,
+        output_folder_path: str = "output/wananimate_batch",
+        valid_image_extensions: tuple = ('.jpg', '.jpeg', '.png', '.bmp'),
+        valid_video_extensions: tuple = ('.mp4', '.avi', '.mov', '.mkv'),
+        prompt: str = "A person walking in a natural way",
+        negative_prompt: Optional[str] = None,
+        seed: int = 12345,
+        width: int = 832,
+        height: int = 480,
+        fps: int = 16,
+        cfg: float = 1.0,
+        steps: int = 6,
+        max_in_flight: int = 4,
+        manifest_path: Optional[str] = None,
+        check_interval: int = 10,
+        max_wait_time: int = 1800
+    ) -> Dict[str, Any]:
+        """
+        Batch process animations from folder
+        
+        Runs a pipeline of concurrent stages (upload -> submit -> shared status poller -> save).
+        At most `max_in_flight` jobs are submitted to the endpoint at once, and uploads stop
+        running ahead when the submission stage is full. Progress is written to a manifest
+        file so an interrupted batch can be resumed without re-running finished or in-flight jobs.
+        
+        Args:
+            image_folder_path: Folder path containing image files
+            video_folder_path: Folder path containing video files (optional)
+            output_folder_path: Folder path to save results
+            valid_image_extensions: Image file extensions to process
+            valid_video_extensions: Video file extensions to process
+            prompt: Animation description text
+            negative_prompt: Negative prompt to avoid unwanted elements (optional)
+            seed: Random seed for generation
+            width: Output width
+            height: Output height
+            fps: Frame rate
+            cfg: Classifier-free guidance scale
+            steps: Number of denoising steps
+            max_in_flight: Maximum number of jobs submitted but not yet finished
+            manifest_path: Resumable manifest file (default: <output_folder_path>/batch_manifest.json)
+            check_interval: Maximum status polling interval (seconds)
+            max_wait_time: Maximum wait time per job after submission (seconds)
+        
+        Returns:
+            Batch processing result dictionary
+        """
+        try:
+            batch = BatchRun.from_folders(
+                image_folder_path,
+                video_folder_path,
+                output_folder_path,
+                valid_image_extensions,
+                valid_video_extensions,
+                seed,
+                manifest_path
+            )
+        except ValueError as e:
+            return {"error": str(e)}
+        work_items = batch.work_items
+        
+        in_flight = threading.BoundedSemaphore(max_in_flight)
+        submit_queue: "queue.Queue" = queue.Queue(maxsize=max_in_flight)
+        save_queue: "queue.Queue" = queue.Queue()
+        remaining = [len(work_items)]
+        all_done = threading.Event()
+        if not work_items:
+            all_done.set()
+        
+        def item_done():
+            with batch.lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    all_done.set()
+        
+        def on_job_finished(item: Dict[str, Any], result: Dict[str, Any]):
+            in_flight.release()
+            batch.record_stage("run", time.time() - item["submitted_at"])
+            save_queue.put((item, result))
+        
+        def start_polling(item: Dict[str, Any]):
+            # Stage 3: the shared status poller tracks every in-flight job
+            item["submitted_at"] = time.time()
+            self.status_poller.track(
+                item["job_id"],
+                callback=lambda result: on_job_finished(item, result),
+                max_wait_time=max_wait_time,
+                max_interval=check_interval
+            )
+        
+        # Stage 1: upload inputs (blocks when the submission stage is full)
+        def upload_stage():
+            for item in work_items:
+                if item["job_id"]:
+                    # Resumed job that was submitted before the interruption
+                    in_flight.acquire()
+                    logger.info(f"🔁 [{item['filename']}] Resuming job {item['job_id']}")
+                    start_polling(item)
+                    continue
+                started = time.time()
+                input_data = self._prepare_job_input(
+                    image_path=item["image_path"],
+                    video_path=item["video_path"],
+                    prompt=prompt,
+                    negative_prompt=negative_prompt,
+                    seed=item["seed"],
+                    width=width,
+                    height=height,
+                    fps=fps,
+                    cfg=cfg,
+                    steps=steps
+                )
+                batch.record_stage("upload", time.time() - started)
+                if "error" in input_data:
+                    logger.error(f"[{item['filename']}] {input_data['error']}")
+                    batch.finish(item["filename"], "failed", error=input_data["error"], job_id=None)
+                    item_done()
+                    continue
+                item["input_data"] = input_data
+                submit_queue.put(item)
+            submit_queue.put(None)
+        
+        # Stage 2: submit jobs, never more than max_in_flight at once
+        def submit_stage():
+            while True:
+                item = submit_queue.get()
+                if item is None:
+                    return
+                in_flight.acquire()
+                job_id = self.submit_job(item["input_data"])
+                if not job_id:
+                    in_flight.release()
+                    batch.finish(item["filename"], "failed", error="Job submission failed", job_id=None)
+                    item_done()
+                    continue
+                item["job_id"] = job_id
+                batch.update_manifest(item["filename"], status="submitted", job_id=job_id)
+                start_polling(item)
+        
+        # Stage 4: download/save results
+        def save_stage():
+            while True:
+                entry = save_queue.get()
+                if entry is None:
+                    return
+                item, result = entry
+                saved = False
+                if result.get('status') == 'COMPLETED':
+                    started = time.time()
+                    saved = self.save_video_result(result, item["output_file"])
+                    batch.record_stage("save", time.time() - started)
+                batch.finish_job(item, result, saved)
+                item_done()
+        
+        threads = [
+            threading.Thread(target=upload_stage, name="batch-upload", daemon=True),
+            threading.Thread(target=submit_stage, name="batch-submit", daemon=True),
+            threading.Thread(target=save_stage, name="batch-save", daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        all_done.wait()
+        save_queue.put(None)
+        for thread in threads:
+            thread.join()
+        
+        return batch.summary()
+
+
+class AsyncWanAnimateS3Client(WanAnimateClientBase):
+    """
+    asyncio version of WanAnimateS3Client
+    
+    Offers the same methods as coroutines. All requests share one pooled aiohttp session
+    and one aioboto3 S3 client, so a single event loop can drive many concurrent jobs.
+    Cancelling a task that waits for a job also cancels the job on RunPod.
+    Requires the optional `aiohttp` and `aioboto3` packages.
+    
+    Usage:
+        async with AsyncWanAnimateS3Client(...) as client:
+            result = await client.create_animation_from_files(...)
+    """
+    
+    def __init__(
+        self,
+        runpod_endpoint_id: str,
+        runpod_api_key: str,
+        s3_endpoint_url: str,
+        s3_access_key_id: str,
+        s3_secret_access_key: str,
+        s3_bucket_name: str,
+        s3_region: str = 'eu-ro-1',
+        max_upload_workers: int = 8,
+        multipart_threshold: int = 16 * 1024 * 1024,
+        multipart_chunksize: int = 16 * 1024 * 1024,
+        max_transfer_concurrency: int = 8,
+        max_connections: int = 100,
+        runpod_api_base: str = "https://api.runpod.ai/v2",
+        inflight_ttl: float = 1800
+    ):
+        """
+        Initialize asyncio WanAnimate S3 client
+        
+        Args:
+            runpod_endpoint_id: RunPod endpoint ID
+            runpod_api_key: RunPod API key
+            s3_endpoint_url: S3 endpoint URL
+            s3_access_key_id: S3 access key ID
+            s3_secret_access_key: S3 secret access key
+            s3_bucket_name: S3 bucket name
+            s3_region: S3 region
+            max_upload_workers: Number of files uploaded concurrently
+            multipart_threshold: File size (bytes) above which multipart upload is used
+            multipart_chunksize: Multipart part size (bytes)
+            max_transfer_concurrency: Parallel part uploads per file
+            max_connections: Size of the shared HTTP connection pool
+            runpod_api_base: RunPod API base URL (override for a local or mock API)
+            inflight_ttl: Seconds a submitted request stays eligible for deduplication
+        """
+        if aiohttp is None or aioboto3 is None:
+            raise ImportError("AsyncWanAnimateS3Client requires 'aiohttp' and 'aioboto3' (pip install aiohttp aioboto3)")
+        
+        super().__init__(
+            runpod_endpoint_id=runpod_endpoint_id,
+            runpod_api_key=runpod_api_key,
+            s3_endpoint_url=s3_endpoint_url,
+            s3_access_key_id=s3_access_key_id,
+            s3_secret_access_key=s3_secret_access_key,
+            s3_bucket_name=s3_bucket_name,
+            s3_region=s3_region,
+            max_upload_workers=max_upload_workers,
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_chunksize,
+            max_transfer_concurrency=max_transfer_concurrency,
+            runpod_api_base=runpod_api_base,
+            inflight_ttl=inflight_ttl
+        )
+        self.max_connections = max_connections
+        self.api_headers = {
+            'Authorization': f'Bearer {runpod_api_key}',
+            'Content-Type': 'application/json'
+        }
+        
+        # Created lazily inside the running event loop
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._s3_context = None
+        self._s3_client = None
+        self._open_lock: Optional[asyncio.Lock] = None
+        self._upload_semaphore: Optional[asyncio.Semaphore] = None
+        
+        # Exponential moving average of job duration, used to time status checks
+        self._expected_duration: Optional[float] = None
+        # Number of tasks waiting on each job (a job is cancelled only when its last waiter is)
+        self._job_waiters: Dict[str, int] = {}
+        
+        logger.info(f"AsyncWanAnimateS3Client initialized - Endpoint: {runpod_endpoint_id}")
+    
+    async def __aenter__(self) -> "AsyncWanAnimateS3Client":
+        await self._ensure_open()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    async def _ensure_open(self):
+        if self._session is not None and self._s3_client is not None:
+            return
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self._session is None:
+                self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=self.max_connections)
+                )
+            if self._s3_client is None:
+                self._s3_context = aioboto3.Session().client(
+                    's3',
+                    endpoint_url=self.s3_endpoint_url,
+                    aws_access_key_id=self.s3_access_key_id,
+                    aws_secret_access_key=self.s3_secret_access_key,
+                    region_name=self.s3_region,
+                    config=Config(
+                        signature_version='s3v4',
+                        max_pool_connections=self.max_upload_workers * self.max_transfer_concurrency
+                    )
+                )
+                self._s3_client = await self._s3_context.__aenter__()
+            if self._upload_semaphore is None:
+                self._upload_semaphore = asyncio.Semaphore(self.max_upload_workers)
+    
+    async def close(self):
+        """Close the shared HTTP session and S3 client"""
+        if self._s3_context is not None:
+            await self._s3_context.__aexit__(None, None, None)
+            self._s3_context = None
+            self._s3_client = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    async def _api_request(self, method: str, url: str, timeout: float = 30, **kwargs) -> Dict[str, Any]:
+        await self._ensure_open()
+        async with self._session.request(
+            method,
+            url,
+            headers=self.api_headers,
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            **kwargs
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+    
+    async def upload_to_s3(self, file_path: str, s3_key: str) -> Optional[str]:
+        """
+        Upload file to S3
+        
+        Args:
+            file_path: Local path of file to upload
+            s3_key: Key (path) to store in S3
+        
+        Returns:
+            S3 path or None (on failure)
+        """
+        try:
+            if not os.path.exists(file_path):
+                logger.error(f"File does not exist: {file_path}")
+                return None
+            
+            await self._ensure_open()
+            logger.info(f"S3 upload started: {file_path} -> s3://{self.s3_bucket_name}/{s3_key}")
+            
+            file_size = os.path.getsize(file_path)
+            start_time = time.time()
+            async with self._upload_semaphore:
+                await self._s3_client.upload_file(file_path, self.s3_bucket_name, s3_key, Config=self.transfer_config)
+            self._record_transfer(s3_key, file_size, time.time() - start_time, skipped=False)
+            
+            s3_path = f"/runpod-volume/{s3_key}"
+            logger.info(f"✅ S3 upload successful: {s3_path}")
+            return s3_path
+            
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ S3 upload failed: {e}")
+            return None
+    
+    async def upload_deduplicated(self, file_path: str, prefix: str = "input/wananimate") -> Optional[str]:
+        """
+        Upload file under a content-hash key, skipping the upload if that key already exists
+        
+        Args:
+            file_path: Local path of file to upload
+            prefix: S3 key prefix
+        
+        Returns:
+            S3 path or None (on failure)
+        """
+        try:
+            if not os.path.exists(file_path):
+                logger.error(f"File does not exist: {file_path}")
+                return None
+            
+            extension = os.path.splitext(file_path)[1].lower()
+            # Hash in a worker thread so large files do not block the event loop
+            content_hash = await asyncio.to_thread(self.file_content_hash, file_path)
+            s3_key = f"{prefix}/{content_hash}{extension}"
+            
+            if await self._s3_key_exists(s3_key):
+                self._record_transfer(s3_key, os.path.getsize(file_path), 0.0, skipped=True)
+                logger.info(f"♻️ S3 upload skipped, identical file already exists: {s3_key}")
+                return f"/runpod-volume/{s3_key}"
+            
+            s3_path = await self.upload_to_s3(file_path, s3_key)
+            if s3_path:
+                with self._transfer_lock:
+                    self._known_keys.add(s3_key)
+            return s3_path
+            
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"❌ S3 upload failed: {e}")
+            return None
+    
+    async def _s3_key_exists(self, s3_key: str) -> bool:
+        with self._transfer_lock:
+            if s3_key in self._known_keys:
+                return True
+        await self._ensure_open()
+        try:
+            await self._s3_client.head_object(Bucket=self.s3_bucket_name, Key=s3_key)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        with self._transfer_lock:
+            self._known_keys.add(s3_key)
+        return True
+    
+    async def upload_multiple_files(self, file_paths: List[str], s3_keys: List[str]) -> Dict[str, Optional[str]]:
         """
-        Upload multiple files to S3
+        Upload multiple files to S3 concurrently
         
         Args:
             file_paths: List of local paths of files to upload
@@ -111,100 +1658,181 @@ class WanAnimateS3Client:
         Returns:
             Dictionary with filename as key and S3 path as value
         """
-        results = {}
-        
-        for file_path, s3_key in zip(file_paths, s3_keys):
-            filename = os.path.basename(file_path)
-            s3_path = self.upload_to_s3(file_path, s3_key)
-            results[filename] = s3_path
-        
-        return results
+        s3_paths = await asyncio.gather(*(
+            self.upload_to_s3(file_path, s3_key)
+            for file_path, s3_key in zip(file_paths, s3_keys)
+        ))
+        return {os.path.basename(file_path): s3_path for file_path, s3_path in zip(file_paths, s3_paths)}
     
-    def submit_job(self, input_data: Dict[str, Any]) -> Optional[str]:
+    async def submit_job(self, input_data: Dict[str, Any]) -> Optional[str]:
         """
         Submit job to RunPod
         
+        A request whose fingerprint matches a job that is still in flight is not submitted
+        again; the job ID of the running job is returned instead.
+        
         Args:
             input_data: API input data
         
         Returns:
             Job ID or None (on failure)
         """
-        payload = {"input": input_data}
+        fingerprint = input_data.get("request_fingerprint")
+        if not fingerprint:
+            return await self._post_job(input_data)
         
+        pending, owner = self._claim_fingerprint(fingerprint, asyncio.get_running_loop().create_future)
+        if not owner:
+            job_id = await asyncio.shield(pending)
+            if job_id:
+                logger.info(f"♻️ Identical request already in flight, reusing Job ID: {job_id}")
+            return job_id
+        
+        job_id = None
+        try:
+            job_id = await self._post_job(input_data)
+        finally:
+            self._release_fingerprint(fingerprint, job_id)
+            pending.set_result(job_id)
+        return job_id
+    
+    async def _post_job(self, input_data: Dict[str, Any]) -> Optional[str]:
         try:
             logger.info(f"Submitting job to RunPod: {self.runpod_api_endpoint}")
-            logger.info(f"Input data: {json.dumps(input_data, indent=2, ensure_ascii=False)}")
-            
-            response = self.session.post(self.runpod_api_endpoint, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            response_data = response.json()
-            job_id = response_data.get('id')
-            
-            if job_id:
-                logger.info(f"✅ Job submission successful! Job ID: {job_id}")
-                return job_id
-            else:
-                logger.error(f"❌ Failed to receive Job ID: {response_data}")
-                return None
-                
-        except requests.exceptions.RequestException as e:
+            response_data = await self._api_request('POST', self.runpod_api_endpoint, json={"input": input_data})
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             logger.error(f"❌ Job submission failed: {e}")
             return None
+        
+        job_id = response_data.get('id')
+        if job_id:
+            logger.info(f"✅ Job submission successful! Job ID: {job_id}")
+            return job_id
+        logger.error(f"❌ Failed to receive Job ID: {response_data}")
+        return None
+    
+    async def submit_job_sync(self, input_data: Dict[str, Any], wait_ms: int = 90000, max_wait_time: int = 1800) -> Dict[str, Any]:
+        """
+        Submit a short job through /runsync and return its result directly
+        
+        Args:
+            input_data: API input data
+            wait_ms: How long /runsync waits for the result (milliseconds)
+            max_wait_time: Maximum total wait time (seconds)
+        
+        Returns:
+            Job result dictionary
+        """
+        try:
+            logger.info(f"Submitting job to RunPod: {self.runsync_url}")
+            response_data = await self._api_request(
+                'POST',
+                f"{self.runsync_url}?wait={wait_ms}",
+                timeout=wait_ms / 1000 + 30,
+                json={"input": input_data}
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"❌ Job submission failed: {e}")
+            return {"error": "Job submission failed"}
+        
+        job_id = response_data.get('id')
+        if not job_id:
+            logger.error(f"❌ Failed to receive Job ID: {response_data}")
+            return {"error": "Job submission failed"}
+        
+        result = self._parse_status(job_id, response_data)
+        if result is not None:
+            return result
+        return await self.wait_for_completion(job_id, max_wait_time=max_wait_time)
+    
+    async def cancel_job(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job on RunPod
+        
+        Args:
+            job_id: Job ID
+        
+        Returns:
+            Whether the cancel request was accepted
+        """
+        try:
+            await self._api_request('POST', f"{self.cancel_url}/{job_id}")
+            logger.info(f"🛑 Job cancelled (Job ID: {job_id})")
+            return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"❌ Job cancel failed (Job ID: {job_id}): {e}")
+            return False
     
-    def wait_for_completion(self, job_id: str, check_interval: int = 10, max_wait_time: int = 1800) -> Dict[str, Any]:
+    async def wait_for_completion(
+        self,
+        job_id: str,
+        check_interval: int = 10,
+        max_wait_time: int = 1800,
+        use_stream: bool = False
+    ) -> Dict[str, Any]:
         """
         Wait for job completion
         
+        Status checks start quickly after submission, back off while the job is queued
+        (never longer than check_interval) and speed up again near the expected completion
+        time. If the waiting task is cancelled, the job is cancelled on RunPod as well.
+        
         Args:
             job_id: Job ID
-            check_interval: Status check interval (seconds)
+            check_interval: Maximum status check interval (seconds)
             max_wait_time: Maximum wait time (seconds)
+            use_stream: Collect streamed output items via /stream (for streaming workers)
         
         Returns:
             Job result dictionary
         """
         start_time = time.time()
+        interval = 1.0
+        stream_items: List[Any] = []
+        self._job_waiters[job_id] = self._job_waiters.get(job_id, 0) + 1
         
-        while time.time() - start_time < max_wait_time:
-            try:
-                logger.info(f"⏱️ Checking job status... (Job ID: {job_id})")
-                
-                response = self.session.get(f"{self.status_url}/{job_id}", timeout=30)
-                response.raise_for_status()
-                
-                status_data = response.json()
-                status = status_data.get('status')
+        try:
+            while time.time() - start_time < max_wait_time:
+                status = None
+                try:
+                    url = f"{self.stream_url if use_stream else self.status_url}/{job_id}"
+                    status_data = await self._api_request('GET', url)
+                    status = status_data.get('status')
+                    if use_stream:
+                        stream_items.extend(item.get('output') for item in status_data.get('stream', []))
+                        if status == 'COMPLETED':
+                            status_data = dict(status_data, output=stream_items)
+                    result = self._parse_status(job_id, status_data)
+                    if result is not None:
+                        if result.get('status') == 'COMPLETED':
+                            duration = time.time() - start_time
+                            self._expected_duration = duration if self._expected_duration is None else (
+                                0.8 * self._expected_duration + 0.2 * duration
+                            )
+                        return result
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"❌ Error checking status: {e}")
                 
-                if status == 'COMPLETED':
-                    logger.info("✅ Job completed!")
-                    return {
-                        'status': 'COMPLETED',
-                        'output': status_data.get('output'),
-                        'job_id': job_id
-                    }
-                elif status == 'FAILED':
-                    logger.error("❌ Job failed.")
-                    return {
-                        'status': 'FAILED',
-                        'error': status_data.get('error', 'Unknown error'),
-                        'job_id': job_id
-                    }
-                elif status in ['IN_QUEUE', 'IN_PROGRESS']:
-                    logger.info(f"🏃 Job in progress... (status: {status})")
-                    time.sleep(check_interval)
+                elapsed = time.time() - start_time
+                if status == 'IN_PROGRESS' and self._expected_duration is not None:
+                    remaining = self._expected_duration - elapsed
+                    interval = remaining / 2 if remaining > 0 else 1.0
+                elif status == 'IN_PROGRESS' and use_stream:
+                    interval = 1.0
                 else:
-                    logger.warning(f"❓ Unknown status: {status}")
-                    return {
-                        'status': 'UNKNOWN',
-                        'data': status_data,
-                        'job_id': job_id
-                    }
-                    
-            except requests.exceptions.RequestException as e:
-                logger.error(f"❌ Error checking status: {e}")
-                time.sleep(check_interval)
+                    interval *= 1.5
+                interval = max(1.0, min(interval, check_interval))
+                await asyncio.sleep(interval)
+        except asyncio.CancelledError:
+            # Do not leave the job running (and billing) on the endpoint
+            if self._job_waiters.get(job_id) == 1:
+                await asyncio.shield(self.cancel_job(job_id))
+            raise
+        finally:
+            self._job_waiters[job_id] -= 1
+            if not self._job_waiters[job_id]:
+                del self._job_waiters[job_id]
+            self._forget_job(job_id)
         
         logger.error(f"❌ Job wait timeout ({max_wait_time} seconds)")
         return {
@@ -212,10 +1840,12 @@ class WanAnimateS3Client:
             'job_id': job_id
         }
     
-    def save_video_result(self, result: Dict[str, Any], output_path: str) -> bool:
+    async def save_video_result(self, result: Dict[str, Any], output_path: str) -> bool:
         """
         Save video file from job result
         
+        Supports the same output formats as WanAnimateS3Client.save_video_result.
+        
         Args:
             result: Job result dictionary
             output_path: File path to save
@@ -229,30 +1859,90 @@ class WanAnimateS3Client:
                 return False
             
             output = result.get('output', {})
-            video_b64 = output.get('video_base64') or output.get('video')
+            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
             
-            if not video_b64:
-                logger.error("No video data available")
+            if isinstance(output, dict) and output.get('video_url'):
+                await self._ensure_open()
+                # Presigned URL: no RunPod authorization header
+                async with self._session.get(output['video_url'], timeout=aiohttp.ClientTimeout(total=None, sock_read=60)) as response:
+                    response.raise_for_status()
+                    with open(output_path, 'wb') as f:
+                        async for chunk in response.content.iter_chunked(1024 * 1024):
+                            f.write(chunk)
+            elif isinstance(output, dict) and output.get('s3_key'):
+                await self._ensure_open()
+                await self._s3_client.download_file(self.s3_bucket_name, output['s3_key'], output_path)
+            elif not await asyncio.to_thread(self._write_embedded_video, output, output_path):
+                # Inline base64 and stream chunks are decoded in a worker thread
                 return False
             
-            # Create directory
-            os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            
-            # Decode and save video
-            decoded_video = base64.b64decode(video_b64)
-            
-            with open(output_path, 'wb') as f:
-                f.write(decoded_video)
-            
             file_size = os.path.getsize(output_path)
             logger.info(f"✅ Video saved successfully: {output_path} ({file_size / (1024*1024):.1f}MB)")
             return True
             
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"❌ Video save failed: {e}")
             return False
     
-    def create_animation_from_files(
+    async def _prepare_job_input(
+        self,
+        image_path: str,
+        video_path: Optional[str],
+        prompt: str,
+        negative_prompt: Optional[str],
+        seed: int,
+        width: int,
+        height: int,
+        fps: int,
+        cfg: float,
+        steps: int,
+        points_store: Optional[str] = None,
+        coordinates: Optional[str] = None,
+        neg_coordinates: Optional[str] = None,
+        output_mode: Optional[str] = None
+    ) -> Dict[str, Any]:
+        # Check file existence
+        if not os.path.exists(image_path):
+            return {"error": f"Image file does not exist: {image_path}"}
+        
+        if video_path and not os.path.exists(video_path):
+            return {"error": f"Video file does not exist: {video_path}"}
+        
+        # Upload image and video (if provided) concurrently under content-hash keys
+        if video_path:
+            image_s3_path, video_s3_path = await asyncio.gather(
+                self.upload_deduplicated(image_path),
+                self.upload_deduplicated(video_path)
+            )
+        else:
+            image_s3_path, video_s3_path = await self.upload_deduplicated(image_path), None
+        
+        if not image_s3_path:
+            return {"error": "Image S3 upload failed"}
+        
+        if video_path and not video_s3_path:
+            return {"error": "Video S3 upload failed"}
+        
+        return self._build_input_data(
+            image_s3_path=image_s3_path,
+            video_s3_path=video_s3_path,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            seed=seed,
+            width=width,
+            height=height,
+            fps=fps,
+            cfg=cfg,
+            steps=steps,
+            points_store=points_store,
+            coordinates=coordinates,
+            neg_coordinates=neg_coordinates,
+            output_mode=output_mode
+        )
+    
+    async def create_animation_from_files(
         self,
         image_path: str,
         video_path: Optional[str] = None,
@@ -266,90 +1956,49 @@ class WanAnimateS3Client:
         steps: int = 6,
         points_store: Optional[str] = None,
         coordinates: Optional[str] = None,
-        neg_coordinates: Optional[str] = None
+        neg_coordinates: Optional[str] = None,
+        output_mode: Optional[str] = None,
+        sync_wait_ms: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Create animation from local files (including S3 upload)
         
-        Args:
-            image_path: Image file path
-            video_path: Reference video file path (optional)
-            prompt: Animation description text
-            negative_prompt: Negative prompt to avoid unwanted elements (optional)
-            seed: Random seed for generation
-            width: Output width
-            height: Output height
-            fps: Frame rate
-            cfg: Classifier-free guidance scale
-            steps: Number of denoising steps
-            points_store: JSON string containing positive control points
-            coordinates: JSON string containing coordinate points
-            neg_coordinates: JSON string containing negative coordinate points
+        Takes the same arguments as WanAnimateS3Client.create_animation_from_files.
         
         Returns:
             Job result dictionary
         """
-        # Check file existence
-        if not os.path.exists(image_path):
-            return {"error": f"Image file does not exist: {image_path}"}
-        
-        if video_path and not os.path.exists(video_path):
-            return {"error": f"Video file does not exist: {video_path}"}
-        
-        # Upload files to S3
-        timestamp = int(time.time())
-        
-        # Upload image
-        image_s3_key = f"input/wananimate/{timestamp}_{os.path.basename(image_path)}"
-        image_s3_path = self.upload_to_s3(image_path, image_s3_key)
-        if not image_s3_path:
-            return {"error": "Image S3 upload failed"}
-        
-        # Upload video (if provided)
-        video_s3_path = None
-        if video_path:
-            video_s3_key = f"input/wananimate/{timestamp}_{os.path.basename(video_path)}"
-            video_s3_path = self.upload_to_s3(video_path, video_s3_key)
-            if not video_s3_path:
-                return {"error": "Video S3 upload failed"}
-        
-        # Configure API input data
-        input_data = {
-            "prompt": prompt,
-            "seed": seed,
-            "width": width,
-            "height": height,
-            "fps": fps,
-            "cfg": cfg,
-            "steps": steps
-        }
-        
-        # Set negative prompt (if provided)
-        if negative_prompt:
-            input_data["negative_prompt"] = negative_prompt
-        
-        # Set image input
-        input_data["image_path"] = image_s3_path
-        
-        # Set video input (if provided)
-        if video_s3_path:
-            input_data["video_path"] = video_s3_path
+        input_data = await self._prepare_job_input(
+            image_path=image_path,
+            video_path=video_path,
+            prompt=prompt,
+            negative_prompt=negative_prompt,
+            seed=seed,
+            width=width,
+            height=height,
+            fps=fps,
+            cfg=cfg,
+            steps=steps,
+            points_store=points_store,
+            coordinates=coordinates,
+            neg_coordinates=neg_coordinates,
+            output_mode=output_mode
+        )
+        if "error" in input_data:
+            return input_data
         
-        # Set control points (if provided)
-        if points_store and coordinates and neg_coordinates:
-            input_data["points_store"] = points_store
-            input_data["coordinates"] = coordinates
-            input_data["neg_coordinates"] = neg_coordinates
+        # Short jobs: /runsync returns the result without any polling
+        if sync_wait_ms:
+            return await self.submit_job_sync(input_data, wait_ms=sync_wait_ms)
         
         # Submit job and wait
-        job_id = self.submit_job(input_data)
+        job_id = await self.submit_job(input_data)
         if not job_id:
             return {"error": "Job submission failed"}
         
-        result = self.wait_for_completion(job_id)
-        return result
+        return await self.wait_for_completion(job_id, use_stream=output_mode == "stream")
     
-    def create_animation_with_control_points(
+    async def create_animation_with_control_points(
         self,
         image_path: str,
         video_path: Optional[str] = None,
@@ -362,24 +2011,14 @@ class WanAnimateS3Client:
         cfg: float = 1.0,
         steps: int = 6,
         positive_points: Optional[List[Dict[str, float]]] = None,
-        negative_points: Optional[List[Dict[str, float]]] = None
+        negative_points: Optional[List[Dict[str, float]]] = None,
+        output_mode: Optional[str] = None,
+        sync_wait_ms: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         Create animation with control points from local files
         
-        Args:
-            image_path: Image file path
-            video_path: Reference video file path (optional)
-            prompt: Animation description text
-            negative_prompt: Negative prompt to avoid unwanted elements (optional)
-            seed: Random seed for generation
-            width: Output width
-            height: Output height
-            fps: Frame rate
-            cfg: Classifier-free guidance scale
-            steps: Number of denoising steps
-            positive_points: List of positive control points [{"x": float, "y": float}]
-            negative_points: List of negative control points [{"x": float, "y": float}]
+        Takes the same arguments as WanAnimateS3Client.create_animation_with_control_points.
         
         Returns:
             Job result dictionary
@@ -397,7 +2036,7 @@ class WanAnimateS3Client:
             coordinates = json.dumps(positive_points)
             neg_coordinates = json.dumps(negative_points)
         
-        return self.create_animation_from_files(
+        return await self.create_animation_from_files(
             image_path=image_path,
             video_path=video_path,
             prompt=prompt,
@@ -410,10 +2049,12 @@ class WanAnimateS3Client:
             steps=steps,
             points_store=points_store,
             coordinates=coordinates,
-            neg_coordinates=neg_coordinates
+            neg_coordinates=neg_coordinates,
+            output_mode=output_mode,
+            sync_wait_ms=sync_wait_ms
         )
     
-    def batch_process_animations(
+    async def batch_process_animations(
         self,
         image_folder_path: str,
         video_folder_path: Optional[str] = None,
@@ -427,136 +2068,115 @@ class WanAnimateS3Client:
         height: int = 480,
         fps: int = 16,
         cfg: float = 1.0,
-        steps: int = 6
+        steps: int = 6,
+        max_in_flight: int = 4,
+        manifest_path: Optional[str] = None,
+        check_interval: int = 10,
+        max_wait_time: int = 1800
     ) -> Dict[str, Any]:
         """
         Batch process animations from folder
         
-        Args:
-            image_folder_path: Folder path containing image files
-            video_folder_path: Folder path containing video files (optional)
-            output_folder_path: Folder path to save results
-            valid_image_extensions: Image file extensions to process
-            valid_video_extensions: Video file extensions to process
-            prompt: Animation description text
-            negative_prompt: Negative prompt to avoid unwanted elements (optional)
-            seed: Random seed for generation
-            width: Output width
-            height: Output height
-            fps: Frame rate
-            cfg: Classifier-free guidance scale
-            steps: Number of denoising steps
+        Takes the same arguments and writes the same manifest as
+        WanAnimateS3Client.batch_process_animations. Uploads run at most
+        `max_in_flight` items ahead of submission. Cancelling the batch cancels
+        every in-flight job on RunPod.
         
         Returns:
             Batch processing result dictionary
         """
-        # Check paths
-        if not os.path.isdir(image_folder_path):
-            return {"error": f"Image folder does not exist: {image_folder_path}"}
-        
-        if video_folder_path and not os.path.isdir(video_folder_path):
-            return {"error": f"Video folder does not exist: {video_folder_path}"}
-        
-        # Create output folder
-        os.makedirs(output_folder_path, exist_ok=True)
-        
-        # Get image file list
-        image_files = [
-            f for f in os.listdir(image_folder_path)
-            if f.lower().endswith(valid_image_extensions)
-        ]
-        
-        if not image_files:
-            return {"error": f"No image files to process: {image_folder_path}"}
+        try:
+            batch = BatchRun.from_folders(
+                image_folder_path,
+                video_folder_path,
+                output_folder_path,
+                valid_image_extensions,
+                valid_video_extensions,
+                seed,
+                manifest_path
+            )
+        except ValueError as e:
+            return {"error": str(e)}
         
-        # Get video file list (if video folder provided)
-        video_files = []
-        if video_folder_path:
-            video_files = [
-                f for f in os.listdir(video_folder_path)
-                if f.lower().endswith(valid_video_extensions)
-            ]
+        in_flight = asyncio.Semaphore(max_in_flight)
+        submit_queue: "asyncio.Queue" = asyncio.Queue(maxsize=max_in_flight)
         
-        logger.info(f"Batch processing started: {len(image_files)} images, {len(video_files)} videos")
+        async def run_job(item: Dict[str, Any]):
+            # Stage 3/4: wait for the job, then download/save the result
+            try:
+                started = time.time()
+                result = await self.wait_for_completion(
+                    item["job_id"],
+                    check_interval=check_interval,
+                    max_wait_time=max_wait_time
+                )
+                batch.record_stage("run", time.time() - started)
+            finally:
+                in_flight.release()
+            saved = False
+            if result.get('status') == 'COMPLETED':
+                started = time.time()
+                saved = await self.save_video_result(result, item["output_file"])
+                batch.record_stage("save", time.time() - started)
+            batch.finish_job(item, result, saved)
         
-        results = {
-            "total_files": len(image_files),
-            "successful": 0,
-            "failed": 0,
-            "results": []
-        }
+        # Stage 1: upload inputs (waits when the submission stage is full)
+        async def upload_stage():
+            for item in batch.work_items:
+                if not item["job_id"]:
+                    started = time.time()
+                    input_data = await self._prepare_job_input(
+                        image_path=item["image_path"],
+                        video_path=item["video_path"],
+                        prompt=prompt,
+                        negative_prompt=negative_prompt,
+                        seed=item["seed"],
+                        width=width,
+                        height=height,
+                        fps=fps,
+                        cfg=cfg,
+                        steps=steps
+                    )
+                    batch.record_stage("upload", time.time() - started)
+                    if "error" in input_data:
+                        logger.error(f"[{item['filename']}] {input_data['error']}")
+                        batch.finish(item["filename"], "failed", error=input_data["error"], job_id=None)
+                        continue
+                    item["input_data"] = input_data
+                await submit_queue.put(item)
+            await submit_queue.put(None)
         
-        # Process each image file
-        for i, image_filename in enumerate(image_files):
-            logger.info(f"\n==================== Processing started: {image_filename} ====================")
-            
-            image_path = os.path.join(image_folder_path, image_filename)
-            
-            # Find corresponding video file (if video folder provided)
-            video_path = None
-            if video_files:
-                # Try to find video with same base name
-                base_name = os.path.splitext(image_filename)[0]
-                for video_filename in video_files:
-                    if os.path.splitext(video_filename)[0] == base_name:
-                        video_path = os.path.join(video_folder_path, video_filename)
-                        break
-                
-                # If no matching video found, use first video
-                if not video_path and video_files:
-                    video_path = os.path.join(video_folder_path, video_files[0])
-            
-            # Create animation
-            result = self.create_animation_from_files(
-                image_path=image_path,
-                video_path=video_path,
-                prompt=prompt,
-                negative_prompt=negative_prompt,
-                seed=seed + i,  # Different seed for each file
-                width=width,
-                height=height,
-                fps=fps,
-                cfg=cfg,
-                steps=steps
-            )
-            
-            if result.get('status') == 'COMPLETED':
-                # Save result file
-                base_filename = os.path.splitext(image_filename)[0]
-                output_filename = os.path.join(output_folder_path, f"animation_{base_filename}.mp4")
-                
-                if self.save_video_result(result, output_filename):
-                    logger.info(f"✅ [{image_filename}] Processing completed")
-                    results["successful"] += 1
-                    results["results"].append({
-                        "filename": image_filename,
-                        "status": "success",
-                        "output_file": output_filename,
-                        "job_id": result.get('job_id')
-                    })
+        # Stage 2: submit jobs, never more than max_in_flight at once
+        async def submit_stage(jobs: List["asyncio.Task"]):
+            while True:
+                item = await submit_queue.get()
+                if item is None:
+                    return
+                await in_flight.acquire()
+                if item["job_id"]:
+                    # Resumed job that was submitted before the interruption
+                    logger.info(f"🔁 [{item['filename']}] Resuming job {item['job_id']}")
                 else:
-                    logger.error(f"[{image_filename}] Result save failed")
-                    results["failed"] += 1
-                    results["results"].append({
-                        "filename": image_filename,
-                        "status": "failed",
-                        "error": "Result save failed",
-                        "job_id": result.get('job_id')
-                    })
-            else:
-                logger.error(f"[{image_filename}] Job failed: {result.get('error', 'Unknown error')}")
-                results["failed"] += 1
-                results["results"].append({
-                    "filename": image_filename,
-                    "status": "failed",
-                    "error": result.get('error', 'Unknown error'),
-                    "job_id": result.get('job_id')
-                })
-            
-            logger.info(f"==================== Processing completed: {image_filename} ====================")
+                    job_id = await self.submit_job(item["input_data"])
+                    if not job_id:
+                        in_flight.release()
+                        batch.finish(item["filename"], "failed", error="Job submission failed", job_id=None)
+                        continue
+                    item["job_id"] = job_id
+                    batch.update_manifest(item["filename"], status="submitted", job_id=job_id)
+                jobs.append(asyncio.create_task(run_job(item)))
         
-        logger.info(f"\n🎉 Batch processing completed: {results['successful']}/{results['total_files']} successful")
-        return results
+        jobs: List["asyncio.Task"] = []
+        try:
+            await asyncio.gather(upload_stage(), submit_stage(jobs))
+            await asyncio.gather(*jobs)
+        except asyncio.CancelledError:
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+            raise
+        
+        return batch.summary()
 
 
 def main():